@@ -0,0 +1,323 @@
+"""
+Reproducible benchmarks for the backend hot paths.
+
+Run from the backend/ directory:
+
+    python benchmarks/run.py                          # all suites, default sizes
+    python benchmarks/run.py --suite scan --sizes 1000 100000 1000000
+    python benchmarks/run.py --suite ocr --pages 10 100 1000
+    python benchmarks/run.py --compare benchmarks/results/<older>.json
+
+Every run uses a throwaway SQLite database and a deterministic dataset
+(seed.generate_loans with a fixed seed and anchor date), and writes a JSON
+file to benchmarks/results/ named after the timestamp and git commit.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+DATASET_SEED = 42
+DATASET_AS_OF = datetime(2026, 1, 1)
+
+# --- 1. ISOLATED ENVIRONMENT (must happen before importing the app modules) ---
+
+WORK_DIR = tempfile.mkdtemp(prefix="covenant-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}")
+os.environ.setdefault("ANALYSIS_CACHE_PATH", os.path.join(WORK_DIR, "analysis_cache.db"))
+os.environ.setdefault("ANALYSIS_JOB_DIR", os.path.join(WORK_DIR, "jobs"))
+os.environ.setdefault("GROQ_API_KEY", "benchmark-no-network")
+os.environ.setdefault("LLM_BACKEND", "fake")
+sys.path.insert(0, BACKEND_DIR)
+
+
+# --- 2. HELPERS ---
+
+def timed(fn, repeat=1):
+    """Runs fn `repeat` times, returns (list of durations in seconds, last return value)."""
+    durations, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return durations, result
+
+
+def summarize(suite, name, durations, params=None, items=None, metrics=None):
+    """
+    One result record. `params` identify the benchmark (used to match runs across
+    commits), `metrics` are extra observations, `items` = units of work per run.
+    """
+    ordered = sorted(durations)
+    median = statistics.median(ordered)
+    record = {
+        "suite": suite,
+        "name": name,
+        "params": params or {},
+        "runs": len(ordered),
+        "seconds": {
+            "min": ordered[0],
+            "median": median,
+            "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+            "max": ordered[-1],
+        },
+        "metrics": metrics or {},
+    }
+    if items:
+        record["items"] = items
+        record["items_per_second"] = items / median if median > 0 else None
+    print(f"   {suite}/{name} {params or ''}: median {median * 1000:.1f} ms"
+          + (f" ({record['items_per_second']:.0f} items/s)" if items and median > 0 else ""))
+    return record
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def seed_dataset(count):
+    import seed
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            seed.seed_db(count, seed=DATASET_SEED, today=DATASET_AS_OF)
+        finally:
+            sys.stdout = stdout
+
+
+def quiet(fn):
+    """Calls fn with stdout suppressed (the scanner prints per-loan events in loop mode)."""
+    def wrapper():
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                return fn()
+            finally:
+                sys.stdout = stdout
+    return wrapper
+
+
+def make_pdf(pages):
+    """Synthetic agreement: boilerplate pages with a few covenant lines the fake LLM can read."""
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        lines = [f"Clause {i + 1}.{j}: The Borrower shall comply with the terms of this Agreement." for j in range(45)]
+        if i == 0:
+            lines[:3] = ["Borrower: Benchmark Holdings Ltd.", "Amount: USD 250,000,000", "Effective Date: 2025-01-01"]
+        if i % 25 == 0:
+            lines[10:12] = ["Debt-to-EBITDA <= 3.50x", "Quarterly Financials <= 45 days"]
+        page.insert_text((40, 40), "\n".join(lines), fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_agreement_text(pages):
+    from services.ocr import extract_text_from_pdf
+    return extract_text_from_pdf(make_pdf(pages), workers=1)
+
+
+# --- 3. SUITES ---
+
+def bench_scan(args):
+    from services.scheduler import run_portfolio_health_check, run_obligation_check
+    from services.evaluation import evaluate_covenants
+
+    results = []
+    for size in args.sizes:
+        print(f"🌱 Seeding {size:,} loans...")
+        seed_time, _ = timed(lambda: seed_dataset(size))
+        results.append(summarize("scan", "seed", seed_time, {"loans": size}, items=size))
+
+        modes = ["columnar"] + (["loop"] if size <= args.max_loop_size else [])
+        for mode in modes:
+            # Each run mutates statuses; the fixed RNG seed keeps runs comparable
+            durations, _ = timed(
+                quiet(lambda: run_portfolio_health_check(mode=mode, seed=DATASET_SEED, risk_engine="simulation")),
+                repeat=args.repeat,
+            )
+            results.append(summarize("scan", f"health_check_{mode}", durations, {"loans": size}, items=size))
+
+        # Real covenant tests against the seeded quarterly financials
+        durations, evaluation = timed(quiet(evaluate_covenants), repeat=args.repeat)
+        results.append(summarize("scan", "evaluate_covenants", durations, {"loans": size},
+                                 items=evaluation["covenants_tested"],
+                                 metrics={"breaches": evaluation["breaches"]}))
+
+        durations, _ = timed(quiet(run_obligation_check), repeat=args.repeat)
+        results.append(summarize("scan", "obligation_check_incremental", durations, {"loans": size}))
+    return results
+
+
+def bench_ocr(args):
+    from services.ocr import extract_text_from_pdf
+
+    results = []
+    for pages in args.pages:
+        pdf = make_pdf(pages)
+        for workers in sorted({1, args.workers}):
+            durations, text = timed(lambda: extract_text_from_pdf(pdf, workers=workers), repeat=args.repeat)
+            results.append(summarize(
+                "ocr", "extract_text_from_pdf", durations,
+                {"pages": pages, "workers": workers},
+                items=pages, metrics={"pdf_bytes": len(pdf), "text_chars": len(text or "")},
+            ))
+    return results
+
+
+def bench_analyze(args):
+    from services.analyzer import analyze_covenants_with_groq
+    from services.fake_llm import FakeLLMClient
+
+    results = []
+    for pages in args.pages:
+        text = make_agreement_text(pages)
+        for latency in (0.0, args.llm_latency):
+            client = FakeLLMClient(latency=latency)
+            relevance = {}
+            durations, data = timed(
+                quiet(lambda: analyze_covenants_with_groq(text, llm_client=client, report=relevance)),
+                repeat=args.repeat,
+            )
+            results.append(summarize(
+                "analyze", "analyze_covenants_stub_llm", durations,
+                {"pages": pages, "llm_latency": latency},
+                metrics={"text_chars": len(text), "llm_calls": client.calls // args.repeat,
+                         "covenants": len((data or {}).get("covenants", [])),
+                         "prompt_chars": relevance.get("chars_out"),
+                         "prompt_reduction": relevance.get("reduction")},
+            ))
+    return results
+
+
+def bench_api(args):
+    from fastapi.testclient import TestClient
+    import main
+
+    size = args.api_loans
+    print(f"🌱 Seeding {size:,} loans for the API suite...")
+    seed_dataset(size)
+    quiet(lambda: main.run_portfolio_health_check(seed=DATASET_SEED, risk_engine="simulation"))()  # Produce some alerts
+
+    endpoints = [
+        ("GET /api/loans", lambda c: c.get("/api/loans")),
+        ("GET /api/loans?limit=100", lambda c: c.get("/api/loans", params={"limit": 100})),
+        ("GET /api/loans?fields=list_view", lambda c: c.get(
+            "/api/loans", params={"fields": "id,borrower_name,loan_amount,risk_status"})),
+        ("GET /api/alerts", lambda c: c.get("/api/alerts")),
+        ("POST /api/loans/{id}/review", lambda c: c.post(f"/api/loans/{1 + (time.perf_counter_ns() % size)}/review")),
+    ]
+
+    results = []
+    with TestClient(main.app) as client:
+        for name, call in endpoints:
+            call(client)  # Warm-up
+            durations = []
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                response = call(client)
+                durations.append(time.perf_counter() - t0)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{name} returned {response.status_code}")
+            wall = time.perf_counter() - started
+
+            record = summarize("api", name, durations, {"loans": size, "requests": args.requests},
+                               metrics={"requests_per_second": args.requests / wall})
+            results.append(record)
+    return results
+
+
+SUITES = {"scan": bench_scan, "ocr": bench_ocr, "analyze": bench_analyze, "api": bench_api}
+
+
+# --- 4. COMPARISON ---
+
+def compare(current, baseline_path):
+    """Prints median time ratios (current / baseline) for matching benchmarks."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    def key(record):
+        return record["suite"], record["name"], json.dumps(record["params"], sort_keys=True)
+
+    previous = {key(r): r for r in baseline["results"]}
+    print(f"\n📊 Compared with {baseline['commit']} ({baseline['started_at']}):")
+    for record in current["results"]:
+        old = previous.get(key(record))
+        if not old:
+            continue
+        ratio = record["seconds"]["median"] / old["seconds"]["median"] if old["seconds"]["median"] else float("inf")
+        flag = "🔴 slower" if ratio > 1.10 else "🟢 faster" if ratio < 0.90 else "  same"
+        print(f"   {flag} {ratio:5.2f}x  {record['suite']}/{record['name']} {record['params']}")
+
+
+# --- 5. MAIN ---
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the COVENANT-IQ backend hot paths.")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="Suite(s) to run (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="Portfolio sizes for the scan suite")
+    parser.add_argument("--max-loop-size", type=int, default=100000, help="Largest portfolio to also scan in 'loop' mode")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000], help="PDF sizes for the ocr/analyze suites")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel extraction workers to compare against serial")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Simulated seconds per stub LLM call")
+    parser.add_argument("--api-loans", type=int, default=10000, help="Portfolio size for the api suite")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint in the api suite")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    started_at = datetime.now()
+    report = {
+        "commit": git_commit(),
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "args": vars(args),
+        "results": [],
+    }
+
+    try:
+        for suite in args.suite or list(SUITES):
+            print(f"⏱️  Running {suite} suite...")
+            report["results"].extend(SUITES[suite](args))
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{started_at:%Y%m%d-%H%M%S}-{report['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
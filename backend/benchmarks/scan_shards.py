@@ -0,0 +1,94 @@
+"""
+Sharded scan benchmark: several worker processes share the hourly scan through leases.
+
+Run from the backend/ directory:
+
+    python benchmarks/scan_shards.py                          # 100k loans, 4 shards, 1 vs 4 workers
+    python benchmarks/scan_shards.py --loans 500000 --shards 8 --workers 1 2 4 8
+
+Each round starts `workers` processes at the same time, all calling
+run_scheduled_health_check(shards=N) like the scheduler in every uvicorn worker
+would. Reports the wall time of the round and checks that every shard ran
+exactly once (no shard skipped, none run twice). Exits non-zero otherwise.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+
+def scan_worker(backend_dir, shards, start, results):
+    sys.path.insert(0, backend_dir)
+    from services.scheduler import run_scheduled_health_check
+
+    with open(os.devnull, "w") as devnull:
+        sys.stdout = devnull
+        start.wait()
+        try:
+            results.put(run_scheduled_health_check(shards=shards))
+        except Exception as e:  # Reported by the parent (e.g. "database is locked")
+            results.put(f"{type(e).__name__}: {e}".splitlines()[0])
+
+
+def run_round(backend_dir, shards, workers):
+    from sqlmodel import Session, delete
+    from database import engine
+    from models import SchedulerLease
+
+    # Every round starts as a fresh interval
+    with Session(engine) as session:
+        session.exec(delete(SchedulerLease))
+        session.commit()
+
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Event(), context.Queue()
+    processes = [
+        context.Process(target=scan_worker, args=(backend_dir, shards, start, results)) for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(2)  # Let every process finish importing before the clock starts
+
+    started = time.perf_counter()
+    start.set()
+    ran = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return elapsed, ran
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Wall time of a sharded portfolio scan across worker processes.")
+    parser.add_argument("--loans", type=int, default=100000, help="Portfolio size")
+    parser.add_argument("--shards", type=int, default=4, help="Shards the loan id space is split into")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4], help="Worker process counts to compare")
+    args = parser.parse_args()
+
+    # Reuses the benchmark harness: throwaway database + deterministic dataset
+    from run import BACKEND_DIR, seed_dataset
+
+    print(f"🌱 Seeding {args.loans:,} loans...")
+    seed_dataset(args.loans)
+
+    failed = False
+    baseline = None
+    for workers in args.workers:
+        elapsed, ran = run_round(BACKEND_DIR, args.shards, workers)
+        baseline = baseline or elapsed
+        errors = [result for result in ran if isinstance(result, str)]
+        ran = [result for result in ran if not isinstance(result, str)]
+        ok = not errors and sum(ran) == args.shards
+        failed |= not ok
+        print(
+            f"   {workers} worker(s), {args.shards} shards: {elapsed:.2f}s ({baseline / elapsed:.2f}x), "
+            f"shards run per worker {sorted(ran, reverse=True)} {'✅' if ok else '❌ expected ' + str(args.shards)}"
+        )
+        for error in errors:
+            print(f"      ❌ {error}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
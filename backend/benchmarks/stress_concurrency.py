@@ -0,0 +1,171 @@
+"""
+Concurrency stress test: API reads and writes while the portfolio scan is running.
+
+Run from the backend/ directory:
+
+    python benchmarks/stress_concurrency.py                       # 20k loans, loop-mode scan
+    python benchmarks/stress_concurrency.py --loans 100000 --scan-mode columnar
+    python benchmarks/stress_concurrency.py --journal-mode DELETE # pre-WAL behaviour, for comparison
+
+Reader threads hit the GET routes (read-only pool), writer threads create and
+review loans (write pool), and one thread runs run_portfolio_health_check
+back to back. Only requests issued while a scan is in progress are counted.
+Exits non-zero if any request failed (e.g. "database is locked").
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import traceback
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent API traffic during a portfolio scan.")
+    parser.add_argument("--loans", type=int, default=20000, help="Portfolio size")
+    parser.add_argument("--scan-mode", choices=["loop", "columnar"], default="loop", help="Scan engine to run")
+    parser.add_argument("--scans", type=int, default=2, help="Back-to-back scans to run traffic against")
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+    parser.add_argument("--writers", type=int, default=4, help="Writer threads")
+    parser.add_argument("--journal-mode", default=None, help="Override SQLITE_JOURNAL_MODE (e.g. DELETE)")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+if ARGS.journal_mode:
+    os.environ["SQLITE_JOURNAL_MODE"] = ARGS.journal_mode
+
+# Reuses the benchmark harness: throwaway database + deterministic dataset
+from run import WORK_DIR, DATASET_SEED, seed_dataset, quiet  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.samples = []
+
+    def record(self, name, seconds, error=None):
+        with self.lock:
+            if error:
+                self.errors.setdefault(name, []).append(error)
+                if len(self.samples) < 5:
+                    self.samples.append(f"{name}: {error}")
+            else:
+                self.latencies.setdefault(name, []).append(seconds)
+
+
+def worker(calls, recorder, scanning, stop, rng_seed):
+    from fastapi.testclient import TestClient
+    import main
+
+    rng = random.Random(rng_seed)
+    client = TestClient(main.app)  # No lifespan: the scheduler is driven by this script
+    while not stop.is_set():
+        name, call = rng.choice(calls)
+        counted = scanning.is_set()
+        started = time.perf_counter()
+        try:
+            response = call(client, rng)
+            error = f"HTTP {response.status_code}" if response.status_code >= 500 else None
+        except Exception as e:  # TestClient re-raises server errors such as OperationalError
+            error = f"{type(e).__name__}: {e}".splitlines()[0]
+        elapsed = time.perf_counter() - started
+        if counted and scanning.is_set():
+            recorder.record(name, elapsed, error)
+
+
+def main():
+    import database
+    from services.scheduler import run_portfolio_health_check
+
+    loans = ARGS.loans
+    print(f"🌱 Seeding {loans:,} loans...")
+    seed_dataset(loans)
+    quiet(lambda: run_portfolio_health_check(mode="columnar", seed=DATASET_SEED, risk_engine="simulation"))()  # Produce some alerts
+
+    with database.engine.connect() as conn:
+        journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+    readers = [
+        ("GET /api/loans?limit=100", lambda c, r: c.get(
+            "/api/loans", params={"limit": 100, "cursor": r.randint(0, loans)})),
+        ("GET /api/loans/{id}", lambda c, r: c.get(f"/api/loans/{r.randint(1, loans)}")),
+        ("GET /api/alerts", lambda c, r: c.get("/api/alerts")),
+    ]
+    writers = [
+        ("POST /api/loans", lambda c, r: c.post("/api/loans", json={
+            "borrower_name": f"Stress Borrower {r.random():.8f}",
+            "loan_amount": "$10,000,000",
+            "effective_date": "2025-01-01",
+            "covenants": [{"name": "Quarterly Financials", "operator": "<=", "threshold": "45 days"}],
+        })),
+        ("POST /api/loans/{id}/review", lambda c, r: c.post(f"/api/loans/{r.randint(1, loans)}/review")),
+    ]
+
+    recorder = Recorder()
+    scanning, stop = threading.Event(), threading.Event()
+    threads = [
+        threading.Thread(target=worker, args=(calls, recorder, scanning, stop, i), daemon=True)
+        for i, calls in enumerate([readers] * ARGS.readers + [writers] * ARGS.writers)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)  # Let the clients warm up before the first scan
+
+    print(f"🔥 journal_mode={journal_mode}: {ARGS.readers} readers + {ARGS.writers} writers "
+          f"during {ARGS.scans} {ARGS.scan_mode} scan(s)...")
+    scan_seconds = []
+    try:
+        for i in range(ARGS.scans):
+            scanning.set()
+            started = time.perf_counter()
+            try:
+                quiet(lambda: run_portfolio_health_check(mode=ARGS.scan_mode, seed=DATASET_SEED + i, risk_engine="simulation"))()
+            except Exception:
+                recorder.record("scan", 0, traceback.format_exc().strip().splitlines()[-1])
+            scan_seconds.append(time.perf_counter() - started)
+            scanning.clear()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+
+    print(f"   scans: {', '.join(f'{s:.2f}s' for s in scan_seconds)}")
+    print(f"   {'operation':<30} {'ok':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    total_errors = 0
+    for name, _ in readers + writers + [("scan", None)]:
+        durations = sorted(recorder.latencies.get(name, []))
+        errors = len(recorder.errors.get(name, []))
+        total_errors += errors
+        if not durations and not errors:
+            continue
+        if durations:
+            p50 = statistics.median(durations) * 1000
+            p95 = durations[min(len(durations) - 1, int(round(0.95 * (len(durations) - 1))))] * 1000
+            worst = durations[-1] * 1000
+            print(f"   {name:<30} {len(durations):>7} {errors:>7} {p50:>9.1f} {p95:>9.1f} {worst:>9.1f}")
+        else:
+            print(f"   {name:<30} {0:>7} {errors:>7} {'-':>9} {'-':>9} {'-':>9}")
+
+    for sample in recorder.samples:
+        print(f"   ❌ {sample}")
+
+    if total_errors:
+        print(f"❌ {total_errors} requests failed while the scan was running.")
+        return 1
+    print("✅ All reads and writes succeeded while the scan was running.")
+    return 0
+
+
+if __name__ == "__main__":
+    import shutil
+
+    try:
+        code = main()
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+    sys.exit(code)
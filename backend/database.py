@@ -1,14 +1,137 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import SQLModel, Session
+from storage import StorageSettings, build_engine
 
-sqlite_file_name = "covenant.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+# URL, pragmas and pool sizes come from the environment (see storage.py)
+settings = StorageSettings.from_env()
 
-# check_same_thread=False is needed for SQLite with FastAPI
-engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+# Writes (and anything that reads then writes) go through `engine`;
+# GET routes use `read_engine`, a separate read-only pool.
+engine = build_engine(settings)
+read_engine = engine if settings.is_memory else build_engine(settings, read_only=True)
+
+# Full-text search (services/search.py):
+# - loan_fts: external-content FTS5 index over loan.borrower_name
+# - covenant_fts: over the distinct covenant names/metrics in covenantname. Names repeat
+#   across loans, so a name match is resolved to covenants through ix_covenant_name_threshold
+#   instead of walking a posting list with an entry per covenant.
+# - agreement_fts: holds its own copy of each loan's agreement text (rowid = loan id)
+# All kept in sync by the triggers below. Prefix indexes on 2 and 3 characters keep "acm*" fast.
+FTS_OPTIONS = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+SEARCH_TABLES = {
+    "loan_fts": f"CREATE VIRTUAL TABLE loan_fts USING fts5(borrower_name, content = 'loan', content_rowid = 'id', {FTS_OPTIONS})",
+    "covenant_fts": f"CREATE VIRTUAL TABLE covenant_fts USING fts5(name, metric, content = 'covenantname', content_rowid = 'id', {FTS_OPTIONS})",
+    "agreement_fts": f"CREATE VIRTUAL TABLE agreement_fts USING fts5(text, {FTS_OPTIONS})",
+}
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS loan_fts_insert AFTER INSERT ON loan BEGIN
+        INSERT INTO loan_fts (rowid, borrower_name) VALUES (new.id, new.borrower_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS loan_fts_delete AFTER DELETE ON loan BEGIN
+        INSERT INTO loan_fts (loan_fts, rowid, borrower_name) VALUES ('delete', old.id, old.borrower_name);
+        DELETE FROM agreement_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS loan_fts_update AFTER UPDATE OF borrower_name ON loan BEGIN
+        INSERT INTO loan_fts (loan_fts, rowid, borrower_name) VALUES ('delete', old.id, old.borrower_name);
+        INSERT INTO loan_fts (rowid, borrower_name) VALUES (new.id, new.borrower_name);
+    END""",
+    # Names no covenant uses any more stay in the vocabulary; they just find no covenants
+    """CREATE TRIGGER IF NOT EXISTS covenantname_insert AFTER INSERT ON covenant BEGIN
+        INSERT OR IGNORE INTO covenantname (name, metric) VALUES (new.name, new.metric);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS covenantname_update AFTER UPDATE OF name ON covenant BEGIN
+        INSERT OR IGNORE INTO covenantname (name, metric) VALUES (new.name, new.metric);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS covenant_fts_insert AFTER INSERT ON covenantname BEGIN
+        INSERT INTO covenant_fts (rowid, name, metric) VALUES (new.id, new.name, new.metric);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS covenant_fts_delete AFTER DELETE ON covenantname BEGIN
+        INSERT INTO covenant_fts (covenant_fts, rowid, name, metric) VALUES ('delete', old.id, old.name, old.metric);
+    END""",
+]
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    upgrade_schema()
+    create_search_index()
+
+# Columns that are filled from an existing column when they are added to an older table:
+# archived alerts used to be keyed by their original Alert.id
+COLUMN_BACKFILLS = {("alertarchive", "alert_id"): "id"}
+
+def upgrade_schema():
+    """
+    create_all() only creates missing tables. For tables that already exist in an
+    older covenant.db, add any new (nullable) columns and any missing indexes.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                    source = COLUMN_BACKFILLS.get((table.name, column.name))
+                    if source:
+                        conn.exec_driver_sql(f"UPDATE {table.name} SET {column.name} = {source}")
+
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def create_search_index():
+    """
+    Creates the FTS5 tables and sync triggers if missing. An index created over existing
+    rows is filled with FTS5's 'rebuild', after collecting the covenant names it indexes
+    (agreement text only arrives with new loans).
+    """
+    with engine.begin() as conn:
+        existing = set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('loan_fts', 'covenant_fts', 'agreement_fts')"
+        )).scalars())
+        for name, ddl in SEARCH_TABLES.items():
+            if name not in existing:
+                conn.exec_driver_sql(ddl)
+                if name == "covenant_fts":
+                    conn.exec_driver_sql(
+                        "INSERT OR IGNORE INTO covenantname (name, metric) "
+                        "SELECT name, max(metric) FROM covenant GROUP BY name"
+                    )
+                if name != "agreement_fts":
+                    conn.exec_driver_sql(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+        for ddl in SEARCH_TRIGGERS:
+            conn.exec_driver_sql(ddl)
+
+def begin_write(session: Session):
+    """
+    Takes SQLite's write lock now (BEGIN IMMEDIATE, waiting up to the busy timeout)
+    for a transaction that reads before it writes. Otherwise the transaction starts
+    as a reader, and if another process commits before its first write, SQLite
+    refuses the upgrade at once ("database is locked") without waiting.
+    No-op if the session already has a transaction open.
+    """
+    dbapi_connection = session.connection().connection.dbapi_connection
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute("BEGIN IMMEDIATE")
+
+def begin_snapshot(session: Session):
+    """
+    Opens a read transaction, so every query in it sees the same WAL snapshot (taken
+    at its first read) instead of each statement seeing the latest commit. Readers
+    never block writers in WAL mode. Ends with the session (rollback on close).
+    """
+    dbapi_connection = session.connection().connection.dbapi_connection
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute("BEGIN")
 
 def get_session():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+def get_read_session():
+    with Session(read_engine) as session:
+        yield session
@@ -1,37 +1,139 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request, Response, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import TypeAdapter
 from sqlmodel import Session, select
-from typing import List
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 import json
+import os
+import time
 from contextlib import asynccontextmanager
+from functools import partial
 from apscheduler.schedulers.background import BackgroundScheduler
 
 # --- IMPORTS ---
 # Make sure you have created backend/services/scheduler.py and backend/models.py 
 # as per the previous step!
-from database import create_db_and_tables, get_session
-from models import Loan, Alert 
-from services.ocr import extract_text_from_pdf
-from services.analyzer import analyze_covenants_with_groq
-from services.scheduler import run_portfolio_health_check 
+from database import create_db_and_tables, get_session, get_read_session, engine, read_engine
+from models import Loan, Alert, Covenant, ComplianceDocument, LoanUpdate, ReviewRequest, StressTestRequest
+from services.scheduler import SCAN_INTERVAL_SECONDS, run_scheduled_health_check, run_obligation_check
+from services.leases import run_exclusive
+from services.covenants import build_covenant_rows, backfill_covenants
+from services.cache import get_analysis_cache
+from services.llm import get_llm_client
+from services.alerts import archive_resolved_alerts
+from services.evaluation import METRIC_BATCH_SIZE, ingest_metric_batch, evaluate_covenants, request_evaluation
+from services.obligations import (
+    maintain_obligation_calendar, regenerate_obligations,
+    parse_obligation_cursor, build_obligation_query, obligation_to_dict,
+)
+from services.uploads import UploadTooLarge, check_content_length, spool_upload, store_document
+from services.portfolio import (
+    record_new_loans, ensure_portfolio_summary, get_portfolio_summary,
+)
+from services.loans import (
+    MAX_PAGE_SIZE, BULK_BATCH_SIZE, parse_fields, build_loan_query, loan_row_to_dict,
+    ingest_loan_batch, review_loans, update_loan,
+)
+from services.jobs import (
+    JOB_HEARTBEAT_SECONDS, submit_analysis_job, resume_pending_jobs, heartbeat_jobs, requeue_stale_jobs,
+    shutdown_job_workers,
+    get_job, job_to_dict, iter_job_events,
+)
+from services.search import SEARCH_MAX_LIMIT, search_loans, index_agreement_text
+from services.stress import run_stress_test
+from services.versions import bump_table_versions
+from services.response_cache import cached_response, get_response_cache
+from services.telemetry import (
+    HTTP_LATENCY, HTTP_QUERIES, render_metrics, start_query_count, stop_query_count,
+    start_thread_tracking, stop_thread_tracking, get_profiler,
+)
 
 # --- LIFESPAN & SCHEDULER SETUP ---
 scheduler = BackgroundScheduler()
 
+OBLIGATION_CHECK_SECONDS = int(os.getenv("OBLIGATION_CHECK_SECONDS", "60"))
+DAILY_JOB_MIN_INTERVAL = 12 * 3600  # Daily jobs: whichever worker ticks first runs them
+
+# Every uvicorn worker runs this scheduler. Each job is wrapped in a lease
+# (services/leases.py) so it runs in one worker per interval, not once per worker.
+def exclusive_job(name, fn, min_interval_seconds):
+    return partial(run_exclusive, name, fn, min_interval_seconds)
+
+def migrate_covenants():
+    with Session(engine) as session:
+        return backfill_covenants(session)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
+
+    # Migrate loans that were saved before the Covenant table existed (one worker does it)
+    run_exclusive("covenant_backfill", migrate_covenants)
+
+    # Obligation calendar: built on first start, then extended (and its history pruned)
+    # daily as the window moves (incremental, so a worker starting after another one
+    # finds nothing left to do). Built before the summary, which counts the obligations
+    # due soon from it.
+    run_exclusive("obligation_calendar", maintain_obligation_calendar)
+    with Session(engine) as session:
+        ensure_portfolio_summary(session)
+
+    # Opt-in slow request profiler (PROFILE_SLOW_REQUEST_MS)
+    get_profiler()
+
+    # Pick up analysis jobs that were queued (or interrupted) before the last shutdown or crash
+    resume_pending_jobs()
     
-    # CHANGED: 'seconds=60' -> 'hours=1'
-    scheduler.add_job(run_portfolio_health_check, 'interval', hours=1) 
+    # Deadlines are checked incrementally every minute (only newly crossed ones),
+    # so the hourly scan only runs the risk simulation.
+    scheduler.add_job(
+        exclusive_job("obligation_check", run_obligation_check, OBLIGATION_CHECK_SECONDS / 2),
+        'interval', seconds=OBLIGATION_CHECK_SECONDS,
+    )
+    # Leased per shard (SCAN_SHARDS), so workers split the scan between them
+    scheduler.add_job(run_scheduled_health_check, 'interval', seconds=SCAN_INTERVAL_SECONDS)
+    # Resolved alerts past ALERT_RETENTION_DAYS move to the archive table once a day
+    scheduler.add_job(
+        exclusive_job("alert_archive", archive_resolved_alerts, DAILY_JOB_MIN_INTERVAL), 'interval', days=1
+    )
+    scheduler.add_job(
+        exclusive_job("obligation_calendar", maintain_obligation_calendar, DAILY_JOB_MIN_INTERVAL), 'interval', days=1
+    )
+    # Analysis jobs: every worker heartbeats the jobs it holds, and one worker at a time
+    # takes over the jobs of workers that stopped (crashed, or restarted under a new pid)
+    scheduler.add_job(heartbeat_jobs, 'interval', seconds=JOB_HEARTBEAT_SECONDS)
+    scheduler.add_job(
+        exclusive_job("resume_jobs", requeue_stale_jobs, JOB_HEARTBEAT_SECONDS / 2),
+        'interval', seconds=JOB_HEARTBEAT_SECONDS,
+    )
     
     scheduler.start()
     print("✅ [SYSTEM] Hourly Risk Monitor Started.")
     yield
     scheduler.shutdown()
+    shutdown_job_workers()
 
 app = FastAPI(lifespan=lifespan)
 
+# --- UPLOAD SIZE LIMIT ---
+# Oversized uploads are refused from the Content-Length header, before Starlette
+# parses (and spools) the multipart body. Chunked requests without a length are
+# still capped while spool_upload copies them.
+# Registered before CORS so the 413 still carries the CORS headers.
+UPLOAD_ROUTES = {"/api/analyze", "/api/obligations/upload"}
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    if request.method == "POST" and request.url.path in UPLOAD_ROUTES:
+        try:
+            check_content_length(request.headers)
+        except UploadTooLarge as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+    return await call_next(request)
+
 # --- CORS MIDDLEWARE ---
 app.add_middleware(
     CORSMiddleware,
@@ -39,8 +141,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],  # Readable by the frontend (paging, If-None-Match)
 )
 
+# --- REQUEST TELEMETRY ---
+# Registered last, so it is the outermost middleware and also times 413s and CORS.
+# Latency is measured up to the response headers (a streamed body is not included).
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    started = time.perf_counter()
+    queries, token = start_query_count()
+    threads, threads_token = start_thread_tracking()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        stop_query_count(token)
+        stop_thread_tracking(threads_token)
+        # Route template ("/api/loans/{loan_id}"), not the raw path, to keep label counts bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_LATENCY.observe(elapsed, method=request.method, route=route, status=str(status))
+        HTTP_QUERIES.observe(queries[0], method=request.method, route=route)
+        profiler = get_profiler()
+        if profiler:
+            await run_in_threadpool(profiler.finish_request, f"{request.method} {route}", started, elapsed, threads)
+
 # --- ROUTES ---
 
 @app.get("/")
@@ -48,64 +176,262 @@ def read_root():
     return {"status": "Database & Scheduler Active"}
 
 # 1. AI ANALYSIS ROUTE
-@app.post("/api/analyze")
+# Returns a job ID immediately; extraction + LLM analysis run in a bounded worker pool
+# so the event loop (and every other route) stays responsive.
+# The upload is spooled to disk in chunks (hashed on the way), never held in memory.
+@app.post("/api/analyze", status_code=202)
 async def analyze_agreement(file: UploadFile = File(...)):
-    content = await file.read()
-    text = extract_text_from_pdf(content)
-    if not text:
-        raise HTTPException(status_code=400, detail="OCR Failed")
-    
-    data = analyze_covenants_with_groq(text)
-    if not data:
-        raise HTTPException(status_code=500, detail="AI Analysis Failed")
-    
-    return data
+    try:
+        spooled = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = await run_in_threadpool(submit_analysis_job, spooled)
+    return job_to_dict(job)
+
+# 1a. ANALYSIS JOB STATUS (poll until status is "done" or "failed")
+@app.get("/api/analyze/{job_id}")
+def read_analysis_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+# 1c. ANALYSIS JOB PROGRESS (Server-Sent Events: status, page, chunk, end)
+@app.get("/api/analyze/{job_id}/events")
+def stream_analysis_job(job_id: str):
+    if not get_job(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(iter_job_events(job_id), media_type="text/event-stream")
+
+# 1b. ANALYSIS CACHE STATS (hit/miss counters)
+@app.get("/api/cache/stats")
+def read_cache_stats():
+    return get_analysis_cache().stats()
+
+# 1d. LLM CLIENT STATS (calls, retries, 429s, tokens, latency)
+@app.get("/api/llm/stats")
+def read_llm_stats():
+    return get_llm_client().stats()
+
+# 1e. PROMETHEUS SCRAPE ENDPOINT (route latency and queries, extraction, LLM calls, scans)
+@app.get("/metrics")
+def read_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# 1f. RESPONSE CACHE STATS (ETag hits, 304s, cached bytes)
+@app.get("/api/cache/responses")
+def read_response_cache_stats():
+    return get_response_cache().stats()
 
 # 2. SAVE LOAN ROUTE
 @app.post("/api/loans", response_model=Loan)
 def create_loan(loan_data: dict, session: Session = Depends(get_session)):
-    covenants_str = json.dumps(loan_data.get("covenants", []))
+    covenants = loan_data.get("covenants", [])
+    covenants_str = json.dumps(covenants)
     
     new_loan = Loan(
         borrower_name=loan_data.get("borrower_name"),
         loan_amount=loan_data.get("loan_amount"),
         effective_date=loan_data.get("effective_date"),
+        sector=loan_data.get("sector"),
         covenants_json=covenants_str,
         risk_status="Healthy"
     )
     
     session.add(new_loan)
+    session.flush()  # Assigns new_loan.id for the covenant rows
+
+    covenant_rows = build_covenant_rows(new_loan.id, covenants, new_loan.effective_date)
+    for row in covenant_rows:
+        session.add(Covenant(**row))
+
+    record_new_loans(session, [(new_loan.risk_status, new_loan.loan_amount)], len(covenant_rows))
+    regenerate_obligations(session, [new_loan.id])
+    # Saved from an upload: make the agreement text searchable under this loan
+    index_agreement_text(session, new_loan.id, loan_data.get("analysis_job_id"))
+    bump_table_versions(session, "loan")
     session.commit()
     session.refresh(new_loan)
     return new_loan
 
-# 3. FETCH ALL LOANS
-@app.get("/api/loans", response_model=List[Loan])
-def read_loans(session: Session = Depends(get_session)):
-    loans = session.exec(select(Loan)).all()
-    return loans
-
-# 4. FETCH SINGLE LOAN
-@app.get("/api/loans/{loan_id}", response_model=Loan)
-def read_loan(loan_id: int, session: Session = Depends(get_session)):
+# 2a. EDIT LOAN (fields left out of the body are unchanged; covenants are replaced)
+@app.put("/api/loans/{loan_id}", response_model=Loan)
+def edit_loan(loan_id: int, changes: LoanUpdate, session: Session = Depends(get_session)):
     loan = session.get(Loan, loan_id)
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
+    update_loan(session, loan, changes)
+    session.commit()
+    session.refresh(loan)
     return loan
 
+# 2b. BULK LOAN INGESTION
+# Body: a JSON array of loans, or NDJSON (one loan per line, Content-Type: application/x-ndjson)
+# which is consumed as it streams in. Each batch is validated and inserted in its own transaction.
+async def ingest_bulk_body(request: Request, ingest_batch, batch_size):
+    """Feeds a JSON-array or NDJSON body to `ingest_batch(records, offset, summary)` batch by batch."""
+    summary = {"inserted": 0, "rejected": 0, "errors": []}
+
+    if "ndjson" in request.headers.get("content-type", ""):
+        batch, index, buffer = [], 0, b""
+
+        async def flush():
+            nonlocal batch
+            await run_in_threadpool(ingest_batch, batch, index - len(batch), summary)
+            batch = []
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    batch.append(None)  # Counted as a rejected record by the validator
+                index += 1
+                if len(batch) >= batch_size:
+                    await flush()
+
+        if buffer.strip():
+            try:
+                batch.append(json.loads(buffer))
+            except ValueError:
+                batch.append(None)
+            index += 1
+        if batch:
+            await flush()
+    else:
+        try:
+            records = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+
+        for start in range(0, len(records), batch_size):
+            await run_in_threadpool(ingest_batch, records[start:start + batch_size], start, summary)
+
+    return summary
+
+@app.post("/api/loans/bulk")
+async def create_loans_bulk(request: Request):
+    return await ingest_bulk_body(request, ingest_loan_batch, BULK_BATCH_SIZE)
+
+# 2c. BULK FINANCIAL METRICS INGESTION (same body formats as 2b)
+# Records: {"loan_id", "metric", "period_end", "value", "source"?}. Re-sent periods overwrite.
+# Covenants are re-evaluated in the background once the batch is in.
+@app.post("/api/metrics/bulk")
+async def ingest_metrics_bulk(request: Request, background_tasks: BackgroundTasks):
+    summary = await ingest_bulk_body(request, ingest_metric_batch, METRIC_BATCH_SIZE)
+    if summary["inserted"]:
+        background_tasks.add_task(request_evaluation)
+    return summary
+
+# 2d. RUN COVENANT EVALUATION NOW (normally runs after metric ingest and in the hourly scan)
+@app.post("/api/covenants/evaluate")
+def run_covenant_evaluation():
+    return evaluate_covenants()
+
+# 3. FETCH ALL LOANS
+# Optional: ?limit=&cursor= (keyset pagination, next cursor in the X-Next-Cursor header),
+# ?risk_status=, ?created_after=&created_before=, ?fields=id,borrower_name,...
+# and ?format=ndjson for streaming exports. With no parameters it returns every loan, as before.
+@app.get("/api/loans")
+def read_loans(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    risk_status: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    session: Session = Depends(get_read_session),
+):
+    try:
+        field_names = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = dict(risk_status=risk_status, created_after=created_after, created_before=created_before)
+
+    if format == "ndjson":
+        return StreamingResponse(
+            _stream_loans_ndjson(field_names, cursor, limit, filters),
+            media_type="application/x-ndjson",
+        )
+
+    def build():
+        stmt = build_loan_query(field_names, cursor=cursor, limit=limit, **filters)
+        loans = [loan_row_to_dict(row) for row in session.execute(stmt).mappings()]
+
+        headers = {}
+        if limit and len(loans) == limit:
+            headers["X-Next-Cursor"] = str(loans[-1]["id"])
+
+        # Serialize directly: skips per-row pydantic validation of the response model
+        return json.dumps(loans), headers
+
+    # Polled pages are answered from the ETag / body cache until a loan is written
+    return cached_response(request, ("loan",), build)
+
+def _stream_loans_ndjson(field_names, cursor, limit, filters, batch_size=MAX_PAGE_SIZE):
+    """Walks the table in keyset batches with its own session (outlives the request dependency)."""
+    remaining = limit
+    with Session(read_engine) as session:
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            stmt = build_loan_query(field_names, cursor=cursor, limit=size, **filters)
+            batch = [loan_row_to_dict(row) for row in session.execute(stmt).mappings()]
+            if not batch:
+                return
+
+            yield "".join(json.dumps(loan) + "\n" for loan in batch)
+
+            cursor = batch[-1]["id"]
+            if remaining is not None:
+                remaining -= len(batch)
+            if len(batch) < size:
+                return
+
+# 4. FETCH SINGLE LOAN
+@app.get("/api/loans/{loan_id}", responses={200: {"model": Loan}})  # Body built by cached_response
+def read_loan(loan_id: int, request: Request, session: Session = Depends(get_read_session)):
+    def build():
+        loan = session.get(Loan, loan_id)
+        if not loan:
+            raise HTTPException(status_code=404, detail="Loan not found")
+        return loan.model_dump_json(), {}
+
+    return cached_response(request, ("loan",), build)
+
 # --- NEW FEATURES START HERE ---
 
 # 5. FETCH ALERTS (For the Dashboard)
-@app.get("/api/alerts", response_model=List[Alert])
-def read_alerts(session: Session = Depends(get_session)):
-    # Get the 10 most recent unresolved alerts
-    alerts = session.exec(
-        select(Alert)
-        .where(Alert.is_resolved == False)
-        .order_by(Alert.timestamp.desc())
-        .limit(10)
-    ).all()
-    return alerts
+_alert_list = TypeAdapter(List[Alert])
+
+@app.get("/api/alerts", responses={200: {"model": List[Alert]}})  # Body built by cached_response
+def read_alerts(request: Request, session: Session = Depends(get_read_session)):
+    def build():
+        # Get the 10 most recent unresolved alerts
+        alerts = session.exec(
+            select(Alert)
+            .where(Alert.is_resolved == False)
+            .order_by(Alert.timestamp.desc())
+            .limit(10)
+        ).all()
+        return _alert_list.dump_json(alerts), {}
+
+    return cached_response(request, ("alert",), build)
+
+# 5b. PORTFOLIO SUMMARY (Dashboard KPIs)
+# Served from the PortfolioStat table, which every writer keeps up to date,
+# so the cost doesn't grow with the number of loans.
+@app.get("/api/portfolio/summary")
+def read_portfolio_summary(session: Session = Depends(get_read_session)):
+    return get_portfolio_summary(session)
 
 # 6. REVIEW LOAN (Credit Officer Action)
 @app.post("/api/loans/{loan_id}/review")
@@ -114,36 +440,142 @@ def review_loan(loan_id: int, session: Session = Depends(get_session)):
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     
-    # Approve the loan -> Set to Healthy
-    loan.risk_status = "Healthy"
-    session.add(loan)
-    
-    # Resolve any alerts related to this loan
-    alerts = session.exec(select(Alert).where(Alert.loan_id == loan_id)).all()
-    for alert in alerts:
-        alert.is_resolved = True
-        session.add(alert)
-        
+    # Approve the loan -> Set to Healthy, and resolve any alerts related to it
+    review_loans(session, loan_ids=[loan_id])
     session.commit()
     return {"status": "reviewed", "new_risk_status": "Healthy"}
 
+# 6b. BATCH REVIEW (e.g. after a credit committee)
+# Body: {"loan_ids": [...]} and/or filters like {"risk_status": "Watchlist", "alerts_older_than_days": 30}.
+# Runs as a few set-based statements in one transaction, whatever the number of loans.
+@app.post("/api/loans/review")
+def review_loans_batch(request: ReviewRequest, session: Session = Depends(get_session)):
+    if request.loan_ids is None and not request.risk_status and request.alerts_older_than_days is None:
+        raise HTTPException(status_code=400, detail="Provide loan_ids and/or a filter (risk_status, alerts_older_than_days)")
+
+    result = review_loans(
+        session,
+        loan_ids=request.loan_ids,
+        risk_status=request.risk_status,
+        alerts_older_than_days=request.alerts_older_than_days,
+    )
+    session.commit()
+    return {"status": "reviewed", "new_risk_status": "Healthy", **result}
+
+# 6c. OBLIGATION CALENDAR
+# ?from=&to= (dates, inclusive; default: the next 7 days), optional ?loan_id=,
+# ?limit=&cursor= (keyset pagination, next cursor in the X-Next-Cursor header).
+# Served from the materialized calendar: an index range scan on due_date.
+@app.get("/api/obligations")
+def read_obligations(
+    from_date: Optional[date] = Query(None, alias="from"),
+    to_date: Optional[date] = Query(None, alias="to"),
+    loan_id: Optional[int] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_read_session),
+):
+    start = datetime.combine(from_date or date.today(), datetime.min.time())
+    end = datetime.combine(to_date or start.date() + timedelta(days=6), datetime.min.time()) + timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    try:
+        after = parse_obligation_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    rows = session.exec(build_obligation_query(start, end, loan_id=loan_id, cursor=after, limit=limit)).all()
+    obligations = [obligation_to_dict(instance, borrower_name) for instance, borrower_name in rows]
+
+    headers = {}
+    if len(obligations) == limit:
+        last = rows[-1][0]
+        headers["X-Next-Cursor"] = f"{last.due_date.isoformat()},{last.id}"
+    return Response(content=json.dumps(obligations), media_type="application/json", headers=headers)
+
+# 6d. SEARCH (borrowers, covenants, agreement text)
+# ?q= free text ("acme", prefix "acm*"), ?covenant= covenant name/metric with optional
+# ?threshold_lt=&threshold_lte=&threshold_gt=&threshold_gte= and ?kind=, ?risk_status=.
+# e.g. ?covenant=dscr&threshold_lt=1.2 -> loans with a DSCR covenant set below 1.2x.
+# Results are ranked by FTS5 bm25 relevance.
+@app.get("/api/search")
+def search(
+    q: Optional[str] = None,
+    covenant: Optional[str] = None,
+    threshold_lt: Optional[float] = None,
+    threshold_lte: Optional[float] = None,
+    threshold_gt: Optional[float] = None,
+    threshold_gte: Optional[float] = None,
+    kind: Optional[str] = None,
+    risk_status: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+    session: Session = Depends(get_read_session),
+):
+    filters = dict(
+        threshold_lt=threshold_lt, threshold_lte=threshold_lte,
+        threshold_gt=threshold_gt, threshold_gte=threshold_gte,
+    )
+    try:
+        results = search_loans(
+            session, q=q, covenant=covenant, filters=filters, kind=kind,
+            risk_status=risk_status, limit=limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": results}
+
+# 6e. STRESS TEST (read-only: nothing is written, the live scanner is never blocked)
+# Body: {"scenarios": [{"name": "Energy EBITDA -20%",
+#                       "shocks": [{"metric": "EBITDA", "factor": 0.8, "sector": "Energy"}]}, ...]}
+# A shock sets a metric's latest value to value * factor + shift, optionally per sector / currency.
+# Returns breach counts, exposure at risk and headroom distributions per scenario, and for the baseline.
+@app.post("/api/stress-test")
+def stress_test(request: StressTestRequest):
+    try:
+        return run_stress_test(request.scenarios)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # 7. UPLOAD COMPLIANCE CERTIFICATE
 @app.post("/api/obligations/upload")
-async def upload_compliance_doc(loan_id: int, file: UploadFile = File(...), session: Session = Depends(get_session)):
+async def upload_compliance_doc(loan_id: int, file: UploadFile = File(...)):
     """
-    Simulates uploading a proof document. 
-    In a real app, you would save 'file' to S3 or a local folder.
+    Stores a proof document in the content-addressed document store
+    (re-uploading the same file doesn't store it twice) and records it against the loan.
     """
     # 1. Log the receipt
     print(f"📄 [UPLOAD] Received {file.filename} for Loan ID {loan_id}")
     
-    # 2. (Optional) You could verify the file type here
+    # 2. Verify the file type
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files allowed")
 
-    # 3. Return success to Frontend so it can update the UI to "Verified"
+    # 3. Spool to disk in chunks, then move into the store under its sha256
+    try:
+        spooled = await spool_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    await run_in_threadpool(store_document, spooled)
+
+    def save_document():
+        with Session(engine) as session:
+            doc = ComplianceDocument(
+                loan_id=loan_id, filename=spooled.filename, sha256=spooled.sha256,
+                size_bytes=spooled.size, path=spooled.path,
+            )
+            session.add(doc)
+            session.commit()
+            session.refresh(doc)
+            return doc
+
+    doc = await run_in_threadpool(save_document)
+
+    # 4. Return success to Frontend so it can update the UI to "Verified"
     return {
         "status": "uploaded", 
+        "document_id": doc.id,
         "filename": file.filename, 
+        "sha256": doc.sha256,
+        "size_bytes": doc.size_bytes,
         "verification": "AI Verified (Simulated)"
-    }
\ No newline at end of file
+    }
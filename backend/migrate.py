@@ -0,0 +1,27 @@
+from sqlmodel import Session
+from database import engine, create_db_and_tables
+from services.covenants import backfill_covenants
+from services.obligations import maintain_obligation_calendar
+from services.portfolio import ensure_portfolio_summary
+
+# Upgrades an existing covenant.db in place:
+# 1. Creates any new tables (e.g. Covenant)
+# 2. Normalizes every loan's covenants_json into Covenant rows
+# 3. Extends the obligation calendar to the current horizon (and prunes its history)
+# 4. Builds the dashboard summary table
+
+def migrate_db():
+    print("🔧 Migrating database schema...")
+    create_db_and_tables()
+
+    with Session(engine) as session:
+        migrated = backfill_covenants(session)
+    # Before the summary, which counts the obligations due soon from the calendar
+    maintain_obligation_calendar()
+    with Session(engine) as session:
+        ensure_portfolio_summary(session)
+
+    print(f"✅ SUCCESS: Migration complete ({migrated} loans normalized).")
+
+if __name__ == "__main__":
+    migrate_db()
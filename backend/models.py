@@ -1,4 +1,5 @@
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from datetime import datetime
 
@@ -8,18 +9,224 @@ class Loan(SQLModel, table=True):
     borrower_name: str
     loan_amount: str
     effective_date: str
-    risk_status: str = "Healthy"  # Default status
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    risk_status: str = Field(default="Healthy", index=True)  # Default status
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    sector: Optional[str] = Field(default=None, index=True)  # e.g. "Energy"; stress scenarios can target it
 
-    # We store covenants as a big string (JSON) for simplicity in SQLite
-    # In a real Postgres app, you'd use a separate table or JSONB
+    # The original covenant payload, kept as-is so the API response shape doesn't change.
+    # The scanner reads the normalized `Covenant` rows below instead.
     covenants_json: str
 
+# Input schema for bulk ingestion (not a table)
+class LoanIn(SQLModel):
+    borrower_name: str
+    loan_amount: str
+    effective_date: str
+    risk_status: str = "Healthy"
+    sector: Optional[str] = None
+    covenants: List[dict] = []
+
+# Input schema for PUT /api/loans/{id} (not a table). Omitted fields are left unchanged.
+class LoanUpdate(SQLModel):
+    borrower_name: Optional[str] = None
+    loan_amount: Optional[str] = None
+    effective_date: Optional[str] = None
+    sector: Optional[str] = None
+    covenants: Optional[List[dict]] = None  # Replaces the loan's covenants
+
+# Input schema for POST /api/loans/review (not a table). Selectors are combined with AND.
+class ReviewRequest(SQLModel):
+    loan_ids: Optional[List[int]] = None
+    risk_status: Optional[str] = None  # e.g. "Watchlist"
+    alerts_older_than_days: Optional[int] = Field(default=None, ge=0)  # Newest unresolved alert is older than this
+
+# Input schema for POST /api/stress-test (not a table). A shock moves the latest value
+# of one metric to value * factor + shift, for every loan or only those in `sector` / `currency`.
+class StressShock(SQLModel):
+    metric: str  # A covenant metric ("dscr", "Debt-to-EBITDA") or a driver ("EBITDA", "debt")
+    factor: float = 1.0  # e.g. 0.8 = down 20%
+    shift: float = 0.0  # In the metric's own unit (e.g. -0.25 on a 1.25x DSCR)
+    sector: Optional[str] = None
+    currency: Optional[str] = None  # ISO code, as parsed from loan_amount
+
+class StressScenario(SQLModel):
+    name: str
+    shocks: List[StressShock] = []
+
+class StressTestRequest(SQLModel):
+    scenarios: List[StressScenario]
+
+# Covenant Table (one row per covenant, parsed once at write time)
+class Covenant(SQLModel, table=True):
+    __table_args__ = (
+        # Search: covenants with a given name, optionally within a threshold range
+        Index("ix_covenant_name_threshold", "name", "threshold"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    loan_id: int = Field(foreign_key="loan.id", index=True)
+    name: str
+    kind: str = Field(index=True)  # financial, reporting
+    operator: Optional[str] = None  # <, <=, >, >=, ==
+    threshold: Optional[float] = Field(default=None, index=True)
+    unit: Optional[str] = None  # x, days, M, %
+    raw_threshold: str = ""  # Original text, e.g. "4.25x"
+    confidence: Optional[str] = None
+
+    # Financial covenants only: canonical metric key the test reads, e.g. "debt_to_ebitda"
+    metric: Optional[str] = Field(default=None, index=True)
+
+    # Reporting obligations only: first delivery date (the calendar is in ObligationInstance)
+    next_due_at: Optional[datetime] = Field(default=None, index=True)
+    frequency_months: Optional[int] = None  # 1, 3, 6, 12 for recurring reports, 0 for one-off
+
+# Obligation calendar: one row per reporting covenant and period, materialized over a
+# rolling horizon (see services/obligations.py) so "what is due between X and Y" is a
+# range scan on due_date instead of a pass over every loan.
+class ObligationInstance(SQLModel, table=True):
+    __table_args__ = (
+        Index("ux_obligationinstance_covenant_id_due_date", "covenant_id", "due_date", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    covenant_id: int
+    loan_id: int = Field(index=True)
+    name: str
+    period_end: datetime
+    due_date: datetime = Field(index=True)
+
+# Reported financials, one row per loan / metric / period (re-ingesting a period overwrites it).
+# Ratios are plain numbers (3.1 for 3.1x), money is in millions, like the covenant thresholds.
+class FinancialMetric(SQLModel, table=True):
+    __table_args__ = (
+        # Upsert key, and "latest period per loan and metric" is a range scan on it
+        Index("ux_financialmetric_loan_id_metric_period_end", "loan_id", "metric", "period_end", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    loan_id: int
+    metric: str  # Canonical key, see services/covenants.py normalize_metric()
+    period_end: datetime
+    value: float
+    source: Optional[str] = None  # e.g. "Q3 compliance certificate"
+    ingested_at: datetime = Field(default_factory=datetime.now)
+
+# Input schema for POST /api/metrics/bulk (not a table)
+class FinancialMetricIn(SQLModel):
+    loan_id: int
+    metric: str  # Canonical key or covenant name ("Debt-to-EBITDA")
+    period_end: datetime
+    value: float
+    source: Optional[str] = None
+
+# Scheduler bookkeeping (e.g. the obligation checker's watermark)
+class SchedulerState(SQLModel, table=True):
+    key: str = Field(primary_key=True)
+    value: str
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+# Cross-process job coordination (see services/leases.py): a job runs only in the worker
+# holding its row, and not again before `acquired_at` + the job's minimum interval.
+class SchedulerLease(SQLModel, table=True):
+    name: str = Field(primary_key=True)  # e.g. "portfolio_scan:0/4"
+    owner: str  # host:pid of the worker that last acquired it
+    acquired_at: datetime
+    expires_at: datetime  # Set to the release time when the job finishes; a crashed holder times out
+
+# Change counter per table, bumped by every writer (see services/versions.py); ETags are built from it
+class TableVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True)  # Table name, e.g. "loan", "alert"
+    version: int = 0
+
+# Dashboard aggregates, kept current by the writers (see services/portfolio.py)
+# e.g. ("loans", "Watchlist", "USD") -> 12 loans, 3.4bn exposure; ("alerts", "critical", "") -> 5
+class PortfolioStat(SQLModel, table=True):
+    bucket: str = Field(primary_key=True)  # loans, alerts, covenants, obligations
+    key: str = Field(primary_key=True)  # risk status, alert type, ...
+    currency: str = Field(default="", primary_key=True)  # ISO code for loan exposure, "" otherwise
+    count: int = 0
+    exposure: float = 0.0
+    updated_at: datetime = Field(default_factory=datetime.now)
+
 # NEW: Alert Table
 class Alert(SQLModel, table=True):
+    __table_args__ = (
+        # "Unresolved alerts of these loans" (reviews) is an index range scan
+        Index("ix_alert_loan_id_is_resolved", "loan_id", "is_resolved"),
+        # Dashboard feed: unresolved, newest first
+        Index("ix_alert_is_resolved_timestamp", "is_resolved", "timestamp"),
+        # One overdue alert per obligation deadline (NULLs, i.e. risk alerts, never collide)
+        Index("ux_alert_loan_id_covenant_id_due_date", "loan_id", "covenant_id", "due_date", unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     loan_id: int
     message: str
     type: str = "warning" # critical, warning, info
     timestamp: datetime = Field(default_factory=datetime.now)
-    is_resolved: bool = False
\ No newline at end of file
+    is_resolved: bool = False
+
+    # Set for obligation alerts only: which deadline this alert is about
+    covenant_id: Optional[int] = None
+    due_date: Optional[datetime] = None
+
+# Resolved alerts past the retention period (see services/alerts.py): the Alert columns, plus archived_at
+class AlertArchive(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_alertarchive_loan_id_covenant_id_due_date", "loan_id", "covenant_id", "due_date"),
+    )
+
+    # Own key: SQLite reuses the id of an archived alert for the next new one
+    id: Optional[int] = Field(default=None, primary_key=True)
+    alert_id: Optional[int] = Field(default=None, index=True)  # Original Alert.id
+    loan_id: int = Field(index=True)
+    message: str
+    type: str
+    timestamp: datetime
+    is_resolved: bool
+    covenant_id: Optional[int] = None
+    due_date: Optional[datetime] = None
+    archived_at: datetime = Field(default_factory=datetime.now)
+
+
+# Background /api/analyze work, persisted so queued jobs survive a restart
+class AnalysisJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)  # uuid4 hex
+    filename: str
+    file_path: str  # Spooled upload, deleted once the job finishes
+    file_sha256: Optional[str] = None  # Content address of the upload (analysis cache key)
+    status: str = Field(default="queued", index=True)  # queued, running, done, failed
+    owner: Optional[str] = None  # Worker running the job (services/leases.py worker_id)
+    pages_extracted: int = 0
+    chunks_total: int = 0
+    chunks_done: int = 0
+    result_json: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+# Distinct covenant names (a few dozen, however many covenants there are), filled by a
+# trigger on covenant. The full-text index over covenant names is built on this table.
+class CovenantName(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+    metric: Optional[str] = None
+
+# Text extracted from an analyzed agreement, by content address of the PDF. A loan saved
+# from an analysis job gets it copied into the search index (see services/search.py).
+class AgreementText(SQLModel, table=True):
+    sha256: str = Field(primary_key=True)
+    pages: int
+    text: str
+    extracted_at: datetime = Field(default_factory=datetime.now)
+
+# Compliance certificates etc. uploaded against a loan. The file itself lives in the
+# content-addressed store (services/uploads.py), so re-uploads don't duplicate bytes.
+class ComplianceDocument(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    loan_id: int = Field(index=True)
+    filename: str
+    sha256: str = Field(index=True)
+    size_bytes: int
+    path: str
+    uploaded_at: datetime = Field(default_factory=datetime.now)
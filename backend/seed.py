@@ -1,12 +1,20 @@
-import json
+import argparse
 import random
+import time
 from datetime import datetime, timedelta
-from sqlmodel import Session, select
+from sqlalchemy import text
+from sqlmodel import Session, delete, select
 from database import engine, create_db_and_tables
-from models import Loan
+from models import Loan, LoanIn, Covenant, Alert, AlertArchive, FinancialMetric, FinancialMetricIn, ObligationInstance, SchedulerState, SchedulerLease, CovenantName, AnalysisJob, AgreementText
+from services.loans import insert_loans
+from services.evaluation import insert_metrics
+from services.portfolio import rebuild_portfolio_summary, refresh_obligation_counts
+from services.versions import bump_table_versions
 
 # --- 1. CONFIGURATION ---
 TARGET_LOAN_COUNT = 150  # We will generate exactly this many unique loans
+BATCH_SIZE = 10000  # Loans per INSERT batch / transaction
+METRIC_PERIODS = 2  # Quarters of reported financials per financial covenant
 
 # --- 2. EXPANDED DATA POOLS (For Maximum Variety) ---
 PREFIXES = [
@@ -30,6 +38,20 @@ INDUSTRIES = [
     "Media", "Entertainment", "Communications", "Data", "Cloud", "Cyber"
 ]
 
+# Sector of each industry word (stress scenarios shock metrics per sector)
+SECTORS = {
+    "Energy": ["Energy", "Mining", "Resources", "Chemicals"],
+    "Industrials": ["Logistics", "Shipping", "Maritime", "Construction", "Automotive", "Aerospace",
+                    "Engineering", "Robotics", "Dynamics", "Systems", "Development", "Consulting"],
+    "Healthcare": ["Pharmaceuticals", "Biosciences", "Health", "Care", "Labs", "Diagnostics"],
+    "Technology": ["Technologies", "Solutions", "Networks", "Data", "Cloud", "Cyber"],
+    "Financials": ["Capital", "Partners", "Ventures", "Holdings", "Financial", "Investments"],
+    "Real Estate": ["Properties", "Estates"],
+    "Consumer": ["Retail", "Foods", "Beverages", "Textiles", "Apparel"],
+    "Media": ["Media", "Entertainment", "Communications"],
+}
+SECTOR_BY_INDUSTRY = {industry: sector for sector, industries in SECTORS.items() for industry in industries}
+
 ENTITIES = ["Ltd.", "Inc.", "Corp.", "LLC", "Group", "PLC", "GmbH", "S.A.", "Pvt Ltd", "B.V.", "NV", "Co."]
 
 # Weighted Risk Status (Most loans are healthy, some have issues)
@@ -65,26 +87,29 @@ REPORTING_TEMPLATES = [
 
 # --- 4. GENERATOR FUNCTIONS ---
 
-def generate_unique_name(existing_names):
+def generate_unique_name(existing_names, rng=random, max_retries=1000):
     """Generates a name and guarantees it is unique."""
-    max_retries = 1000
     for _ in range(max_retries):
-        name = f"{random.choice(PREFIXES)} {random.choice(INDUSTRIES)} {random.choice(ENTITIES)}"
+        name = f"{rng.choice(PREFIXES)} {rng.choice(INDUSTRIES)} {rng.choice(ENTITIES)}"
         if name not in existing_names:
             existing_names.add(name)
             return name
-    return f"Fallback Enterprise {random.randint(1000, 9999)}"
 
-def generate_amount():
-    currency = random.choice(CURRENCIES)
+    # Name space exhausted (large datasets): disambiguate with a serial number
+    name = f"{name} {len(existing_names) + 1}"
+    existing_names.add(name)
+    return name
+
+def generate_amount(rng=random):
+    currency = rng.choice(CURRENCIES)
     # Generate amount between 2M and 800M, rounded nicely
-    amount_mil = random.randint(2, 800) * 1000000
+    amount_mil = rng.randint(2, 800) * 1000000
     return f"{currency} {amount_mil:,.0f}"
 
-def generate_date():
+def generate_date(rng=random, today=None):
     """Generates an effective date from the past 4 years."""
-    start_date = datetime.now() - timedelta(days=365 * 4)
-    random_days = random.randint(0, 365 * 4)
+    start_date = (today or datetime.now()) - timedelta(days=365 * 4)
+    random_days = rng.randint(0, 365 * 4)
     date = start_date + timedelta(days=random_days)
     return date.strftime("%Y-%m-%d")
 
@@ -92,19 +117,19 @@ def smart_round(value, step):
     """Rounds a value to the nearest step (e.g. 3.12 -> 3.25)."""
     return round(value / step) * step
 
-def generate_realistic_covenants():
+def generate_realistic_covenants(rng=random):
     """
     Creates a unique 'fingerprint' of covenants for this loan.
     """
     covenants = []
 
     # 1. Pick 3-5 Financial Covenants (Randomized Limits)
-    num_financial = random.randint(3, 5)
-    selected_financials = random.sample(FINANCIAL_TEMPLATES, num_financial)
+    num_financial = rng.randint(3, 5)
+    selected_financials = rng.sample(FINANCIAL_TEMPLATES, num_financial)
     
     for tmpl in selected_financials:
         # Calculate a randomized threshold based on Base +/- Variance
-        raw_val = random.uniform(tmpl["base"] - (tmpl["variance"]/2), tmpl["base"] + (tmpl["variance"]/2))
+        raw_val = rng.uniform(tmpl["base"] - (tmpl["variance"]/2), tmpl["base"] + (tmpl["variance"]/2))
         
         # Round it nicely (e.g., 3.1234 -> 3.25)
         val = smart_round(raw_val, tmpl["step"])
@@ -119,71 +144,158 @@ def generate_realistic_covenants():
 
         covenants.append({
             "name": tmpl["name"],
-            "operator": random.choice(tmpl["operators"]),
+            "operator": rng.choice(tmpl["operators"]),
             "threshold": threshold,
             "confidence": "High"
         })
 
     # 2. Pick 2-4 Reporting Obligations
-    num_reports = random.randint(2, 4)
-    selected_reports = random.sample(REPORTING_TEMPLATES, num_reports)
+    num_reports = rng.randint(2, 4)
+    selected_reports = rng.sample(REPORTING_TEMPLATES, num_reports)
     
     for tmpl in selected_reports:
-        val = random.choice(tmpl["choices"])
+        val = rng.choice(tmpl["choices"])
         covenants.append({
             "name": tmpl["name"],
-            "operator": random.choice(tmpl["operators"]),
+            "operator": rng.choice(tmpl["operators"]),
             "threshold": f"{val} days",
             "confidence": "High"
         })
 
     return covenants
 
+def generate_loans(count, seed=None, today=None):
+    """
+    Yields `count` LoanIn records. With a fixed `seed` (and `today`) the
+    dataset is fully deterministic - useful for load-testing the scanner.
+    """
+    rng = random.Random(seed)
+    used_names = set() # Registry to ensure 100% uniqueness
+    # Large datasets exhaust the name space quickly; don't retry for long
+    max_retries = 1000 if count <= TARGET_LOAN_COUNT * 10 else 3
+
+    for _ in range(count):
+        borrower_name = generate_unique_name(used_names, rng, max_retries)
+        yield LoanIn(
+            # 1. Generate Unique Identity
+            borrower_name=borrower_name,
+            sector=SECTOR_BY_INDUSTRY.get(borrower_name.split()[1]),  # "{prefix} {industry} {entity}"
+            loan_amount=generate_amount(rng),
+            effective_date=generate_date(rng, today),
+            # 2. Assign Risk Profile
+            risk_status=rng.choice(RISK_STATUSES),
+            # 3. Generate Unique Legal Structure (Covenants)
+            covenants=generate_realistic_covenants(rng),
+        )
+
+def quarter_ends(today=None, count=METRIC_PERIODS):
+    """The last `count` calendar quarter ends before `today`, oldest first."""
+    today = today or datetime.now()
+    year, quarter = today.year, (today.month - 1) // 3  # Quarters fully elapsed this year
+    ends = []
+    for _ in range(count):
+        if quarter == 0:
+            year, quarter = year - 1, 4
+        month = quarter * 3
+        ends.append(datetime(year, month, 30 if month in (6, 9) else 31))
+        quarter -= 1
+    return ends[::-1]
+
+def generate_metrics(covenants, rng=random, today=None, periods=METRIC_PERIODS):
+    """
+    Yields FinancialMetricIn records for (loan_id, metric, operator, threshold) covenant
+    tuples: each quarter's figure sits a random cushion away from the limit, on the
+    compliant side most of the time (~5% of figures breach).
+    """
+    period_ends = quarter_ends(today, periods)
+    for loan_id, metric, operator, threshold in covenants:
+        for period_end in period_ends:
+            cushion = rng.gauss(0.25, 0.15)
+            factor = 1 - cushion if operator in ("<", "<=") else 1 + cushion
+            yield FinancialMetricIn.model_construct(
+                loan_id=loan_id, metric=metric, period_end=period_end,
+                value=round(threshold * factor, 2), source="Seeded financials",
+            )
+
 # --- 5. MAIN SEED LOGIC ---
 
-def seed_db():
-    print(f"🌱 Initializing Generator for {TARGET_LOAN_COUNT} unique loans...")
+def seed_db(count=TARGET_LOAN_COUNT, seed=None, today=None, batch_size=BATCH_SIZE):
+    print(f"🌱 Initializing Generator for {count} unique loans...")
     print("   - Building Name Registry...")
     print("   - Synthesizing Financial Ratios...")
     
     create_db_and_tables()
-    
-    used_names = set() # Registry to ensure 100% uniqueness
+    started = time.perf_counter()
     
     with Session(engine) as session:
-        # OPTIONAL: Clear old data
-        existing_loans = session.exec(select(Loan)).all()
-        if len(existing_loans) > 0:
-            print(f"   - Cleaning up {len(existing_loans)} old records...")
-            for l in existing_loans:
-                session.delete(l)
-            session.commit()
+        # Clear old data: one DELETE per table (SQLite truncates without a WHERE clause)
+        print("   - Truncating old records...")
+        session.execute(delete(ObligationInstance))
+        session.execute(delete(SchedulerState))  # Watermarks / calendar horizon refer to the old data
+        session.execute(delete(SchedulerLease))  # Jobs run against the new data on their next tick
+        session.execute(delete(FinancialMetric))
+        session.execute(delete(Covenant))
+        session.execute(delete(CovenantName))  # Search vocabulary, refilled by the covenant trigger
+        session.execute(delete(Alert))
+        session.execute(delete(AlertArchive))  # Archived alerts of the old loans
+        # Finished analyses and their extracted text belong to the old loans (queued jobs still run)
+        session.execute(delete(AnalysisJob).where(AnalysisJob.status.in_(("done", "failed"))))
+        session.execute(delete(AgreementText))
+        session.execute(text("DELETE FROM agreement_fts"))
+        session.execute(delete(Loan))
+        rebuild_portfolio_summary(session)  # Back to zero; insert_loans adds each batch
+        bump_table_versions(session, "loan", "alert")  # Cached responses of the old data are stale
+        session.commit()
         
         loans_created = 0
-        while loans_created < TARGET_LOAN_COUNT:
-            # 1. Generate Unique Identity
-            company_name = generate_unique_name(used_names)
-            
-            # 2. Assign Risk Profile
-            risk = random.choice(RISK_STATUSES)
-            
-            # 3. Generate Unique Legal Structure (Covenants)
-            covenants_list = generate_realistic_covenants()
-            
-            # 4. Create Record
-            loan = Loan(
-                borrower_name=company_name,
-                loan_amount=generate_amount(),
-                effective_date=generate_date(),
-                risk_status=risk,
-                covenants_json=json.dumps(covenants_list)
-            )
-            session.add(loan)
-            loans_created += 1
-            
+        batch = []
+        for loan in generate_loans(count, seed, today):
+            batch.append(loan)
+            if len(batch) >= batch_size:
+                insert_loans(session, batch)
+                session.commit()
+                loans_created += len(batch)
+                batch = []
+                print(f"   - {loans_created:,} loans inserted...")
+
+        if batch:
+            insert_loans(session, batch)
+            session.commit()
+            loans_created += len(batch)
+
+        # Reported financials for every financial covenant (what the evaluator tests)
+        print("   - Generating quarterly financials...")
+        metric_rng = random.Random(seed)
+        covenants = session.exec(
+            select(Covenant.loan_id, Covenant.metric, Covenant.operator, Covenant.threshold)
+            .where(Covenant.kind == "financial")
+            .where(Covenant.metric != None)
+            .where(Covenant.threshold != None)
+            .order_by(Covenant.id)
+        ).all()
+        batch = []
+        for metric in generate_metrics(covenants, metric_rng, today):
+            batch.append(metric)
+            if len(batch) >= batch_size * 4:
+                insert_metrics(session, batch)
+                session.commit()
+                batch = []
+        insert_metrics(session, batch)
+
+        refresh_obligation_counts(session)
         session.commit()
     
-    print(f"✅ SUCCESS: Database seeded with {loans_created} unique, enterprise-grade loans.")
+    elapsed = time.perf_counter() - started
+    print(f"✅ SUCCESS: Database seeded with {loans_created} unique, enterprise-grade loans in {elapsed:.1f}s.")
+    return loans_created
 
 if __name__ == "__main__":
-    seed_db()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Seed covenant.db with synthetic loans.")
+    parser.add_argument("--count", type=int, default=TARGET_LOAN_COUNT, help="Number of loans to generate")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed for a reproducible dataset")
+    parser.add_argument("--as-of", default=None, help="Anchor date (YYYY-MM-DD) for effective dates; defaults to today")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Loans per insert transaction")
+    args = parser.parse_args()
+
+    today = datetime.strptime(args.as_of, "%Y-%m-%d") if args.as_of else None
+    seed_db(args.count, args.seed, today, args.batch_size)
@@ -0,0 +1,135 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import (
+    Boolean, Column, DateTime, Integer, MetaData, String, Table, and_, delete, exists, func, insert, literal,
+)
+from sqlmodel import Session, select
+from database import engine
+from models import Alert, AlertArchive
+from services.versions import bump_table_versions
+
+# --- CONFIGURATION ---
+ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "90"))  # Resolved alerts older than this are archived
+ALERT_ARCHIVE_BATCH_SIZE = int(os.getenv("ALERT_ARCHIVE_BATCH_SIZE", "5000"))  # Rows moved per transaction
+
+# Per-connection scratch table for candidate obligation alerts
+_staged = Table(
+    "alert_staging", MetaData(),
+    Column("loan_id", Integer, nullable=False),
+    Column("covenant_id", Integer, nullable=False),
+    Column("due_date", DateTime, nullable=False),
+    Column("message", String, nullable=False),
+    Column("type", String, nullable=False),
+    Column("timestamp", DateTime, nullable=False),
+    prefixes=["TEMPORARY"],
+)
+
+_DEDUPE_KEY = ("loan_id", "covenant_id", "due_date")
+
+
+def _same_key(table):
+    return and_(*[table.c[name] == _staged.c[name] for name in _DEDUPE_KEY])
+
+
+# --- DEDUPLICATED INSERTS ---
+
+def overdue_alert(loan_id, covenant_id, cov_name, due_date, now):
+    """Alert row for a missed deadline; (loan_id, covenant_id, due_date) is its dedupe key."""
+    return {
+        "loan_id": loan_id,
+        "covenant_id": covenant_id,
+        "due_date": due_date,
+        "message": f"Overdue: {cov_name} was due on {due_date.strftime('%Y-%m-%d')}.",
+        "type": "warning",
+        "timestamp": now,
+    }
+
+
+def insert_obligation_alerts(session: Session, rows):
+    """
+    Inserts alerts keyed by (loan_id, covenant_id, due_date), skipping any key that
+    already has an alert - live or archived. Used for "Overdue" alerts (due_date is the
+    deadline) and covenant breaches (due_date is the reporting period end).
+    Rows need those three keys plus message, type and timestamp. Does not commit.
+    Returns {alert_type: count} of the rows actually inserted.
+    """
+    if not rows:
+        return {}
+
+    conn = session.connection()
+    _staged.create(conn, checkfirst=True)
+    conn.execute(delete(_staged))
+    conn.execute(insert(_staged), rows)
+
+    # Drop deadlines that were already alerted (the unique index backs up the live table)
+    alert_table, archive_table = Alert.__table__, AlertArchive.__table__
+    conn.execute(delete(_staged).where(exists().where(_same_key(alert_table))))
+    conn.execute(delete(_staged).where(exists().where(_same_key(archive_table))))
+
+    columns = ["loan_id", "covenant_id", "due_date", "message", "type", "timestamp"]
+    staged_rows = select(*[_staged.c[name] for name in columns], literal(False, Boolean)).distinct()
+    conn.execute(
+        insert(alert_table)
+        .from_select(columns + ["is_resolved"], staged_rows)
+        .prefix_with("OR IGNORE")  # Duplicates within the batch itself
+    )
+
+    inserted = dict(conn.execute(
+        select(_staged.c.type, func.count(alert_table.c.id.distinct()))
+        .select_from(_staged.join(alert_table, _same_key(alert_table)))
+        .group_by(_staged.c.type)
+    ).all())
+    conn.execute(delete(_staged))
+    if inserted:
+        bump_table_versions(session, "alert")
+    return inserted
+
+
+# --- RETENTION ---
+
+def archive_resolved_alerts(older_than_days=None, batch_size=None, now=None):
+    """
+    Moves resolved alerts older than the retention period from `alert` into
+    `alertarchive`, in batches (one short transaction each, oldest first).
+    Unresolved alerts are never archived. Returns the number of rows moved.
+    """
+    older_than_days = ALERT_RETENTION_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or ALERT_ARCHIVE_BATCH_SIZE
+    now = now or datetime.now()
+    cutoff = now - timedelta(days=older_than_days)
+
+    alert_table, archive_table = Alert.__table__, AlertArchive.__table__
+    columns = [column.name for column in alert_table.columns if column.name != "id"]
+    archived = 0
+
+    while True:
+        with Session(engine) as session:
+            # Range scan on the (is_resolved, timestamp) index
+            ids = session.exec(
+                select(Alert.id)
+                .where(Alert.is_resolved == True)
+                .where(Alert.timestamp < cutoff)
+                .order_by(Alert.timestamp)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                break
+
+            session.execute(
+                insert(archive_table).from_select(
+                    ["alert_id"] + columns + ["archived_at"],
+                    select(alert_table.c.id, *[alert_table.c[name] for name in columns], literal(now, DateTime))
+                    .where(alert_table.c.id.in_(ids)),
+                )
+            )
+            session.execute(delete(alert_table).where(alert_table.c.id.in_(ids)))
+            bump_table_versions(session, "alert")
+            session.commit()
+
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    if archived:
+        print(f"🗄️  [RETENTION] Archived {archived} resolved alerts older than {older_than_days} days.")
+    return archived
@@ -1,36 +1,34 @@
 import os
 import json
+import hashlib
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from groq import Groq
+from services.llm import get_llm_client
+from services.relevance import RELEVANCE_SETTINGS, filter_relevant_text, split_pages
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# The LLM client (Groq or the local fake, see LLM_BACKEND) is created lazily by
+# services/llm.py on the first call, so importing this module needs no API key.
 
-def clean_json_output(raw_text):
-    """
-    Removes markdown formatting (```json ... ```) that LLMs often add.
-    """
-    cleaned = re.sub(r"```json\s*", "", raw_text)  # Remove start tag
-    cleaned = re.sub(r"```\s*", "", cleaned) # Remove end tag     
-    return cleaned.strip()
+# 70B Versatile is available on Groq and is much better at logic than 8B.
+MODEL_NAME = "llama-3.3-70b-versatile"
+TEMPERATURE = 0.1
+MAX_OUTPUT_TOKENS = 2048
 
-def analyze_covenants_with_groq(text_content: str):
-    """
-    Analyzes loan agreement text using Llama-3.3-70b on Groq.
-    EXTRACTS: Financial Covenants AND Reporting Obligations.
-    """
-    
-    # 1. INCREASE CONTEXT WINDOW
-    # 12,000 chars is too small (only ~4 pages). 
-    # 100,000 chars covers ~40-50 pages of dense legal text.
-    truncated_text = text_content[:100000]
-
-    # 2. ENGINEERED PROMPT
-    # We explicitly tell the AI to treat "Reporting Deadlines" as "Covenants"
-    # so they fit into your existing Frontend Table.
-    prompt = f"""
+# Long agreements are split at page markers into chunks of roughly this many
+# tokens (~4 chars per token) and analyzed in parallel, then merged.
+CHUNK_TOKEN_BUDGET = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "12000"))
+CHARS_PER_TOKEN = 4
+MAX_PARALLEL_CHUNKS = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+
+SYSTEM_PROMPT = "You are a JSON-only API. Respond only with valid JSON."
+
+# We explicitly tell the AI to treat "Reporting Deadlines" as "Covenants"
+# so they fit into your existing Frontend Table.
+PROMPT_TEMPLATE = """
     You are a Senior Credit Risk Officer. Analyze the Loan Agreement text below.
     
     YOUR GOAL: Extract structured data for the Covenant Monitoring Dashboard.
@@ -59,25 +57,114 @@ def analyze_covenants_with_groq(text_content: str):
     }}
 
     ### LOAN AGREEMENT TEXT:
-    {truncated_text}
+    {text}
+    """
+
+# Identifies "this prompt + this model + this page filter". Cached analyses are keyed
+# by it, so editing the prompt or switching models invalidates old results.
+ANALYSIS_FINGERPRINT = hashlib.sha256(
+    json.dumps([
+        MODEL_NAME, TEMPERATURE, MAX_OUTPUT_TOKENS, CHUNK_TOKEN_BUDGET, SYSTEM_PROMPT, PROMPT_TEMPLATE,
+        RELEVANCE_SETTINGS,
+    ]).encode()
+).hexdigest()[:16]
+
+def clean_json_output(raw_text):
+    """
+    Removes markdown formatting (```json ... ```) that LLMs often add.
+    """
+    cleaned = re.sub(r"```json\s*", "", raw_text)  # Remove start tag
+    cleaned = re.sub(r"```\s*", "", cleaned) # Remove end tag     
+    return cleaned.strip()
+
+def split_into_chunks(text_content: str, token_budget: int = CHUNK_TOKEN_BUDGET):
+    """
+    Splits the output of extract_text_from_pdf at its "--- Page N ---" markers and
+    packs whole pages into chunks of at most `token_budget` (estimated) tokens.
+    A single page larger than the budget is cut into budget-sized pieces.
+    """
+    max_chars = max(1, token_budget * CHARS_PER_TOKEN)
+    pages = split_pages(text_content)
+
+    chunks = []
+    current = []
+    current_len = 0
+    for page in pages:
+        # Oversized page: flush, then cut it into pieces on its own
+        if len(page) > max_chars:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_len = [], 0
+            chunks.extend(page[i:i + max_chars] for i in range(0, len(page), max_chars))
+            continue
+
+        if current and current_len + len(page) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, current_len = [], 0
+        current.append(page)
+        current_len += len(page) + 2
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def _is_missing(value):
+    return value is None or str(value).strip().upper() in ("", "N/A", "NA", "NONE", "NULL")
+
+def _covenant_key(cov):
+    """Two extractions are the same covenant if name, operator and threshold match (ignoring case/punctuation)."""
+    name = re.sub(r"[^a-z0-9]+", " ", str(cov.get("name", "")).lower()).strip()
+    threshold = re.sub(r"\s+", "", str(cov.get("threshold", "")).lower())
+    return name, str(cov.get("operator", "")).strip(), threshold
+
+def merge_chunk_results(results):
+    """
+    Reduces per-chunk outputs into one result in the usual JSON schema.
+    - Header fields: first non-"N/A" value, in document order
+    - Covenants: concatenated in document order, duplicates dropped
     """
+    merged = {"borrower_name": "N/A", "loan_amount": "N/A", "effective_date": "N/A", "covenants": []}
+    seen = set()
+
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+
+        for field in ("borrower_name", "loan_amount", "effective_date"):
+            if _is_missing(merged[field]) and not _is_missing(result.get(field)):
+                merged[field] = result[field]
+
+        for cov in result.get("covenants") or []:
+            if not isinstance(cov, dict) or _is_missing(cov.get("name")):
+                continue
+            key = _covenant_key(cov)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged["covenants"].append(cov)
+
+    return merged
+
+def _analyze_chunk(llm_client, chunk_text):
+    """One LLM call on one chunk. Returns the parsed dict, or None on failure."""
+    prompt = PROMPT_TEMPLATE.format(text=chunk_text)
+    raw_output = ""
 
     try:
-        response = client.chat.completions.create(
-            # 3. USE THE SMARTER MODEL (70B)
-            # 70B Versatile is available on Groq and is much better at logic than 8B.
-            model="llama-3.3-70b-versatile",
+        response = llm_client.chat.completions.create(
+            # USE THE SMARTER MODEL (70B)
+            model=MODEL_NAME,
             messages=[
-                {"role": "system", "content": "You are a JSON-only API. Respond only with valid JSON."},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.1, # Low temperature = More deterministic/factual
-            max_tokens=2048
+            temperature=TEMPERATURE, # Low temperature = More deterministic/factual
+            max_tokens=MAX_OUTPUT_TOKENS
         )
 
         raw_output = response.choices[0].message.content.strip()
         
-        # 4. CLEAN & PARSE
+        # CLEAN & PARSE
         final_json_string = clean_json_output(raw_output)
         data = json.loads(final_json_string)
         
@@ -88,5 +175,64 @@ def analyze_covenants_with_groq(text_content: str):
         print(raw_output)
         return None
     except Exception as e:
-        print(f"❌ Groq API Error: {e}")
-        return None
\ No newline at end of file
+        print(f"❌ LLM API Error: {e}")
+        return None
+
+def analyze_covenants_with_groq(text_content: str, llm_client=None, max_concurrency: int = None, on_progress=None,
+                                report: dict = None):
+    """
+    Analyzes loan agreement text using Llama-3.3-70b on Groq.
+    EXTRACTS: Financial Covenants AND Reporting Obligations.
+
+    Map-reduce: low-relevance pages are dropped first (services/relevance.py), the
+    rest is split into token-budgeted chunks, chunks are analyzed concurrently (at
+    most `max_concurrency` in flight) and the per-chunk results are merged and de-duplicated.
+    `llm_client` defaults to the shared rate-limited LLMClient; any Groq-compatible
+    client (e.g. a bare FakeLLMClient) can be passed instead.
+    `on_progress(chunks_done, chunks_total)` is called as each chunk finishes.
+    `report`, if given, is filled in place with the filter's page/char/token counts.
+    """
+    llm_client = llm_client or get_llm_client()
+    max_concurrency = max_concurrency or MAX_PARALLEL_CHUNKS
+
+    # 1. FILTER (keep covenant-relevant pages only)
+    text_content, relevance = filter_relevant_text(text_content)
+    if report is not None:
+        report.update(relevance)
+    if relevance["pages_kept"] < relevance["pages_total"]:
+        print(
+            f"✂️  [AI] Relevance filter kept {relevance['pages_kept']}/{relevance['pages_total']} pages "
+            f"({relevance['chars_in']:,} -> {relevance['chars_out']:,} chars, ~{relevance['tokens_saved']:,} tokens saved)."
+        )
+
+    # 2. SPLIT
+    chunks = split_into_chunks(text_content)
+    if not chunks:
+        return None
+
+    # 3. MAP (in parallel)
+    progress_lock = threading.Lock()
+    done = [0]
+
+    def run_chunk(chunk):
+        result = _analyze_chunk(llm_client, chunk)
+        if on_progress:
+            with progress_lock:
+                done[0] += 1
+                on_progress(done[0], len(chunks))
+        return result
+
+    if len(chunks) == 1:
+        results = [run_chunk(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as pool:
+            results = list(pool.map(run_chunk, chunks))
+
+    succeeded = [r for r in results if r]
+    if not succeeded:
+        return None
+    if len(succeeded) < len(chunks):
+        print(f"⚠️  [AI] {len(chunks) - len(succeeded)} of {len(chunks)} chunks failed; merging the rest.")
+
+    # 4. REDUCE
+    return merge_chunk_results(succeeded)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# --- CONFIGURATION ---
+CACHE_PATH = os.getenv("ANALYSIS_CACHE_PATH", "analysis_cache.db")
+CACHE_MEMORY_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MEMORY_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_MB", "256")) * 1024 * 1024
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "30")) * 86400
+
+
+def hash_text(text):
+    """Content address of extracted text (catches re-scans/re-saves of the same agreement)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for /api/analyze results.
+    - Tier 1: in-process LRU (OrderedDict), bounded by entry count.
+    - Tier 2: SQLite file, bounded by total bytes and TTL.
+
+    Entries live under a `level` ("pdf" = hash of the upload, "text" = hash of the
+    extracted text) and the analyzer `version`, so a new prompt/model never sees
+    results produced by the old one.
+    """
+
+    def __init__(self, path=CACHE_PATH, version="", memory_entries=CACHE_MEMORY_ENTRIES,
+                 max_bytes=CACHE_MAX_BYTES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.version = version
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (created_at, json string)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_last_access ON analysis_cache (last_access)")
+        self._db.commit()
+
+    def _key(self, level, digest):
+        return f"{level}:{self.version}:{digest}"
+
+    def get(self, level, digest):
+        """Returns the cached result dict, or None on a miss."""
+        key = self._key(level, digest)
+        now = time.time()
+
+        with self._lock:
+            # 1. MEMORY TIER
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters[f"{level}_memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+            # 2. DISK TIER
+            row = self._db.execute(
+                "SELECT value, created_at FROM analysis_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                value, created_at = row
+                if now - created_at <= self.ttl_seconds:
+                    self._db.execute("UPDATE analysis_cache SET last_access = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, created_at, value)
+                    self._counters[f"{level}_disk_hits"] += 1
+                    return json.loads(value)
+
+                self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._db.commit()
+                self._counters["expired"] += 1
+
+            self._counters[f"{level}_misses"] += 1
+            return None
+
+    def put(self, level, digest, data):
+        key = self._key(level, digest)
+        value = json.dumps(data)
+        now = time.time()
+
+        with self._lock:
+            self._remember(key, now, value)
+            self._db.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict_disk(now)
+            self._db.commit()
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def _evict_disk(self, now):
+        """Drops expired rows, then least-recently-used rows until under the size budget."""
+        expired = self._db.execute(
+            "DELETE FROM analysis_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        self._counters["expired"] += expired
+
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()[0]
+        while total > self.max_bytes:
+            key, size = self._db.execute(
+                "SELECT key, size FROM analysis_cache ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self._counters["disk_evictions"] += 1
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache"
+            ).fetchone()
+            return {
+                "version": self.version,
+                "memory_entries": len(self._memory),
+                "disk_entries": entries,
+                "disk_bytes": size,
+                **self._counters,
+            }
+
+
+_analysis_cache = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache():
+    """Process-wide cache, created on first use and versioned by the analyzer prompt/model."""
+    global _analysis_cache
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            from services.analyzer import ANALYSIS_FINGERPRINT
+            _analysis_cache = AnalysisCache(version=ANALYSIS_FINGERPRINT)
+        return _analysis_cache
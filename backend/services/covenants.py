@@ -0,0 +1,300 @@
+import json
+import re
+from functools import lru_cache
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, exists, text, update
+from sqlmodel import Session, select
+from models import Loan, Covenant, SchedulerState
+
+# --- PARSING HELPERS ---
+# The LLM (and the seed data) give us free text like "<=", "4.25x", "$15M", "45 days".
+# We parse it ONCE at write time so the scanner never has to sniff strings again.
+
+OPERATOR_ALIASES = {
+    "<=": "<=", "=<": "<=", "≤": "<=",
+    ">=": ">=", "=>": ">=", "≥": ">=",
+    "<": "<", ">": ">",
+    "=": "==", "==": "==",
+}
+
+# Covenant names vary between agreements ("Debt-to-EBITDA", "Senior Leverage", "DSCR").
+# Financial covenants and ingested metrics are both mapped to one canonical key so the
+# evaluator can join them; first match wins, so the more specific patterns come first.
+METRIC_PATTERNS = [
+    (re.compile(r"debt[\W_]*(?:to[\W_]*)?ebitda|net[\W_]*leverage"), "debt_to_ebitda"),
+    (re.compile(r"leverage|gearing"), "leverage"),
+    (re.compile(r"debt[\W_]*service|dscr"), "dscr"),
+    (re.compile(r"fixed[\W_]*charge"), "fixed_charge_coverage"),
+    (re.compile(r"interest[\W_]*cover"), "interest_coverage"),
+    (re.compile(r"current[\W_]*ratio"), "current_ratio"),
+    (re.compile(r"capex|capital[\W_]*expenditure"), "capex"),
+    (re.compile(r"liquidity|cash[\W_]*balance"), "liquidity"),
+    (re.compile(r"net[\W_]*worth"), "tangible_net_worth"),
+    (re.compile(r"loan[\W_]*to[\W_]*value|\bltv\b"), "ltv"),
+]
+
+# How often a reporting obligation recurs, in months, from its name. First match wins;
+# anything unrecognised is treated as a one-off delivery (0).
+FREQUENCY_PATTERNS = [
+    (re.compile(r"month"), 1),
+    (re.compile(r"quarter|compliance[\W_]*certificate"), 3),
+    (re.compile(r"semi[\W_]*annual|half[\W_]*year"), 6),
+    (re.compile(r"annual|year|audited|budget|insurance|renewal|esg"), 12),
+]
+
+_NUMBER = re.compile(r"[-+]?\d[\d,]*(?:\.\d+)?|[-+]?\.\d+")
+
+
+def parse_operator(raw):
+    """Normalizes an operator string ("=<", "≥", ...) to one of <, <=, >, >=, ==."""
+    if not raw:
+        return None
+    return OPERATOR_ALIASES.get(str(raw).strip())
+
+
+@lru_cache(maxsize=1024)
+def normalize_metric(name):
+    """
+    Canonical metric key for a covenant or metric name.
+    - "Debt-to-EBITDA"               -> "debt_to_ebitda"
+    - "Debt Service Coverage (DSCR)" -> "dscr"
+    - "Minimum Cash Sweep"           -> "minimum_cash_sweep" (unknown names are slugified)
+    """
+    text = str(name or "").strip().lower()
+    for pattern, key in METRIC_PATTERNS:
+        if pattern.search(text):
+            return key
+    return re.sub(r"[^a-z0-9]+", "_", text).strip("_") or None
+
+
+@lru_cache(maxsize=1024)
+def infer_frequency(name):
+    """Recurrence in months for a reporting covenant name ("Quarterly Financials" -> 3), 0 if one-off."""
+    text = str(name or "").lower()
+    for pattern, months in FREQUENCY_PATTERNS:
+        if pattern.search(text):
+            return months
+    return 0
+
+
+def parse_threshold(raw):
+    """
+    Splits a threshold string into (value, unit).
+    - "4.25x"   -> (4.25, "x")
+    - "$15M"    -> (15.0, "M")
+    - "45 days" -> (45.0, "days")
+    - "N/A"     -> (None, None)
+    """
+    if raw is None:
+        return None, None
+    return _parse_threshold_text(str(raw).strip().lower())
+
+
+@lru_cache(maxsize=4096)
+def _parse_threshold_text(text):
+    # Thresholds repeat a lot across a portfolio ("45 days", "3.50x"), so results are memoized
+    match = _NUMBER.search(text)
+    if not match:
+        return None, None
+
+    value = float(match.group().replace(",", ""))
+    rest = text[match.end():].strip()
+
+    # Deadlines are normalised to days so they can be added to dates directly
+    if "day" in rest:
+        return value, "days"
+    if rest.startswith("week"):
+        return value * 7, "days"
+    if rest.startswith("month"):
+        return value * 30, "days"
+
+    if rest.startswith("x") or rest.startswith("times"):
+        return value, "x"
+    if rest.startswith(("bn", "billion")):
+        return value * 1000, "M"
+    if rest.startswith(("m", "mn", "million")):
+        return value, "M"
+    if rest.startswith("%"):
+        return value, "%"
+
+    return value, None
+
+
+def classify_covenant(unit):
+    """Reporting obligations are the ones with a deadline (days). Everything else is a financial test."""
+    return "reporting" if unit == "days" else "financial"
+
+
+def parse_effective_date(effective_date):
+    """YYYY-MM-DD -> datetime, or None for "N/A"/garbage."""
+    try:
+        return datetime.fromisoformat(str(effective_date)[:10])
+    except ValueError:
+        return None
+
+
+def compute_due_date(effective_date, days_limit):
+    """Effective Date + Days Limit, or None if either part is missing/unparsable."""
+    if days_limit is None:
+        return None
+    if not isinstance(effective_date, datetime):
+        effective_date = parse_effective_date(effective_date)
+    if effective_date is None:
+        return None
+    return effective_date + timedelta(days=days_limit)
+
+
+def build_covenant_rows(loan_id, covenants, effective_date=None):
+    """Turns the covenant dicts from the analyzer/frontend into `Covenant` row dicts."""
+    rows = []
+    start_date = parse_effective_date(effective_date) if effective_date else None
+    for cov in covenants or []:
+        if not isinstance(cov, dict):
+            continue
+
+        raw_threshold = str(cov.get("threshold") or "")
+        value, unit = parse_threshold(raw_threshold)
+        kind = classify_covenant(unit)
+
+        rows.append({
+            "loan_id": loan_id,
+            "name": str(cov.get("name") or ""),
+            "kind": kind,
+            "operator": parse_operator(cov.get("operator")),
+            "threshold": value,
+            "unit": unit,
+            "raw_threshold": raw_threshold,
+            "confidence": cov.get("confidence"),
+            "metric": normalize_metric(cov.get("name")) if kind == "financial" else None,
+            "next_due_at": compute_due_date(start_date, value) if kind == "reporting" else None,
+            "frequency_months": infer_frequency(cov.get("name")) if kind == "reporting" else None,
+        })
+    return rows
+
+
+def covenant_rows_from_json(loan_id, covenants_json, effective_date=None):
+    """Same as build_covenant_rows, but for the legacy `covenants_json` blob."""
+    try:
+        covenants = json.loads(covenants_json or "[]")
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(covenants, list):
+        return []
+    return build_covenant_rows(loan_id, covenants, effective_date)
+
+
+def sync_covenant_rows(session: Session, loan):
+    """
+    Brings the loan's `Covenant` rows in line with its `covenants_json` after an edit.
+    Old and new covenants are paired by normalized name (in order, for repeated names):
+    changed rows are updated in place, so their ids (and the alerts pointing at them)
+    survive; only removed covenants are deleted and only new ones inserted.
+    Returns (rows added - rows removed, whether anything changed). Does not commit.
+    """
+    existing = {}
+    for covenant in session.exec(select(Covenant).where(Covenant.loan_id == loan.id).order_by(Covenant.id)):
+        existing.setdefault(normalize_metric(covenant.name), []).append(covenant)
+
+    updated, new_rows = 0, []
+    for row in covenant_rows_from_json(loan.id, loan.covenants_json, loan.effective_date):
+        matches = existing.get(normalize_metric(row["name"]))
+        if not matches:
+            new_rows.append(row)
+            continue
+        covenant = matches.pop(0)
+        if any(getattr(covenant, key) != value for key, value in row.items()):
+            for key, value in row.items():
+                setattr(covenant, key, value)
+            session.add(covenant)
+            updated += 1
+
+    removed_ids = [covenant.id for covenants in existing.values() for covenant in covenants]
+    if removed_ids:
+        session.execute(delete(Covenant).where(Covenant.id.in_(removed_ids)))
+    if new_rows:
+        session.execute(insert(Covenant.__table__), new_rows)
+    session.flush()
+    return len(new_rows) - len(removed_ids), bool(updated or new_rows or removed_ids)
+
+
+# --- MIGRATION ---
+
+COVENANT_BACKFILL_KEY = "covenant_backfill_loan_id"  # SchedulerState: loans up to this id are normalized
+
+def backfill_covenants(session: Session, batch_size: int = 5000):
+    """
+    Migration path for existing databases: creates `Covenant` rows for every loan
+    that only has the `covenants_json` blob. Safe to run repeatedly: the highest loan id
+    processed is stored, so loans whose JSON yields no rows (invalid or non-dict
+    entries) are read once, not on every start. Loans created later get their rows
+    when they are saved.
+    """
+    migrated = 0
+    state = session.get(SchedulerState, COVENANT_BACKFILL_KEY) or SchedulerState(key=COVENANT_BACKFILL_KEY, value="0")
+    last_id = int(state.value)
+    max_id = session.exec(select(func.max(Loan.id))).one() or 0
+
+    while True:
+        batch = session.exec(
+            select(Loan.id, Loan.covenants_json, Loan.effective_date)
+            .where(Loan.id > last_id)
+            .where(Loan.id <= max_id)
+            .where(~exists().where(Covenant.loan_id == Loan.id))
+            # Loans saved with an empty covenant list legitimately have no rows; skipping
+            # them keeps the pass from re-reading them on every start
+            .where(Loan.covenants_json.not_in(("", "[]")))
+            .order_by(Loan.id)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+
+        rows = []
+        for loan_id, covenants_json, effective_date in batch:
+            rows.extend(covenant_rows_from_json(loan_id, covenants_json, effective_date))
+        if rows:
+            session.execute(insert(Covenant), rows)
+        migrated += len(batch)
+        last_id = batch[-1][0]
+        # The watermark moves in the same transaction as the batch's rows
+        state.value, state.updated_at = str(last_id), datetime.now()
+        session.add(state)
+        session.commit()
+
+    if max_id > int(state.value):
+        # The loans after the last batch already had rows (or an empty list)
+        state.value, state.updated_at = str(max_id), datetime.now()
+        session.add(state)
+        session.commit()
+
+    # Covenant rows written before `next_due_at` existed: compute it in one statement
+    session.execute(text(
+        "UPDATE covenant SET next_due_at = ("
+        "  SELECT datetime(loan.effective_date, '+' || CAST(covenant.threshold AS INTEGER) || ' days')"
+        "  FROM loan WHERE loan.id = covenant.loan_id"
+        ") WHERE kind = 'reporting' AND threshold IS NOT NULL AND next_due_at IS NULL"
+    ))
+    session.commit()
+
+    # Covenants written before `metric` / `frequency_months` existed (one UPDATE per distinct name)
+    for kind, column, derive in (
+        ("financial", Covenant.metric, normalize_metric),
+        ("reporting", Covenant.frequency_months, infer_frequency),
+    ):
+        names = session.exec(
+            select(Covenant.name).where(Covenant.kind == kind).where(column == None).distinct()
+        ).all()
+        for name in names:
+            session.execute(
+                update(Covenant)
+                .where(Covenant.kind == kind)
+                .where(column == None)
+                .where(Covenant.name == name)
+                .values({column.key: derive(name)})
+            )
+    session.commit()
+
+    if migrated > 0:
+        print(f"🔧 [MIGRATE] Normalized covenants for {migrated} loans.")
+    return migrated
+
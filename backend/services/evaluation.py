@@ -0,0 +1,353 @@
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import DateTime, bindparam, insert, text
+from sqlmodel import Session, select
+from database import engine, begin_write
+from models import Loan, Alert, FinancialMetricIn
+from services.covenants import normalize_metric
+from services.alerts import insert_obligation_alerts
+from services.loans import MAX_REPORTED_ERRORS, apply_status_transitions
+from services.portfolio import record_alerts
+from services.telemetry import record_scan
+from services.versions import bump_table_versions
+
+# --- COVENANT EVALUATION ---
+# Financial covenants are tested against the latest reported value of their metric.
+# The whole portfolio is evaluated in one pass: covenants and latest metrics are
+# loaded as NumPy columns, joined on (loan, metric) with a sorted-key search, and
+# compliance / headroom are computed for every covenant at once.
+
+# --- CONFIGURATION ---
+EVAL_WATCHLIST_HEADROOM = float(os.getenv("EVAL_WATCHLIST_HEADROOM", "0.10"))  # Compliant, but within 10% of a limit
+METRIC_BATCH_SIZE = int(os.getenv("METRIC_BATCH_SIZE", "20000"))  # Rows per ingest transaction
+
+OPERATORS = ("<", "<=", ">", ">=", "==")
+
+_metric_validator = TypeAdapter(FinancialMetricIn)
+
+_UPSERT = text(
+    "INSERT INTO financialmetric (loan_id, metric, period_end, value, source, ingested_at) "
+    "VALUES (:loan_id, :metric, :period_end, :value, :source, :ingested_at) "
+    "ON CONFLICT (loan_id, metric, period_end) DO UPDATE SET "
+    "value = excluded.value, source = excluded.source, ingested_at = excluded.ingested_at"
+).bindparams(
+    # Same text format as ORM-written datetimes, so the upsert key and MAX() compare like for like
+    bindparam("period_end", type_=DateTime), bindparam("ingested_at", type_=DateTime),
+)
+
+
+# --- INGEST ---
+
+def validate_metric_batch(session: Session, records, offset=0):
+    """
+    Validates raw dicts against FinancialMetricIn, normalizes the metric name and
+    rejects metrics of loans that don't exist.
+    Returns (valid list, [{"index": n, "error": "..."}] for the rejects).
+    """
+    valid, rejected = [], []
+    for i, record in enumerate(records):
+        try:
+            metric = _metric_validator.validate_python(record)
+        except ValidationError as e:
+            error = e.errors(include_url=False)[0]
+            location = ".".join(str(part) for part in error["loc"])
+            message = f"{location}: {error['msg']}" if location else error["msg"]
+            rejected.append({"index": offset + i, "error": message})
+            continue
+
+        metric.metric = normalize_metric(metric.metric)
+        if not metric.metric:
+            rejected.append({"index": offset + i, "error": "metric: must not be empty"})
+        elif not math.isfinite(metric.value):
+            rejected.append({"index": offset + i, "error": "value: must be a finite number"})
+        else:
+            valid.append((offset + i, metric))
+
+    # One lookup for the batch's distinct loan ids (a JSON parameter, not one per id)
+    loan_ids = {metric.loan_id for _, metric in valid}
+    known = set(session.execute(
+        text("SELECT id FROM loan WHERE id IN (SELECT value FROM json_each(:loan_ids))"),
+        {"loan_ids": json.dumps(sorted(loan_ids))},
+    ).scalars()) if loan_ids else set()
+    for index, metric in valid:
+        if metric.loan_id not in known:
+            rejected.append({"index": index, "error": f"loan_id: loan {metric.loan_id} does not exist"})
+    rejected.sort(key=lambda reject: reject["index"])
+    return [metric for _, metric in valid if metric.loan_id in known], rejected
+
+
+def insert_metrics(session: Session, metrics):
+    """
+    Upserts FinancialMetricIn records with one executemany (a re-sent period replaces
+    the earlier figure). Does not commit.
+    """
+    if not metrics:
+        return
+    now = datetime.now()
+    session.execute(_UPSERT, [
+        {
+            "loan_id": metric.loan_id,
+            "metric": metric.metric,
+            "period_end": metric.period_end,
+            "value": metric.value,
+            "source": metric.source,
+            "ingested_at": now,
+        }
+        for metric in metrics
+    ])
+
+
+def ingest_metric_batch(records, offset, summary):
+    """
+    Validates and upserts one batch in its own transaction, updating `summary`
+    ({"inserted", "rejected", "errors"}) in place. Used by POST /api/metrics/bulk.
+    """
+    with Session(engine) as session:
+        valid, rejected = validate_metric_batch(session, records, offset)
+        insert_metrics(session, valid)
+        session.commit()
+
+    summary["inserted"] += len(valid)
+    summary["rejected"] += len(rejected)
+    room = MAX_REPORTED_ERRORS - len(summary["errors"])
+    if room > 0:
+        summary["errors"].extend(rejected[:room])
+
+
+# --- EVALUATION ---
+
+def _shard_filter(shard):
+    """SQL condition on loan_id for shard (index, count) of the loan id space."""
+    if not shard:
+        return "1"
+    index, count = (int(part) for part in shard)
+    return f"loan_id % {count} = {index}"
+
+
+def load_latest_metrics(session, shard=None):
+    """
+    (loan_id, metric, period_end, value) of the newest period per loan and metric.
+    SQLite returns the bare `value` column from the row holding MAX(period_end), so
+    this is one pass over the (loan_id, metric, period_end) index, no self-join.
+    Raw tuples: period_end stays an ISO string (only breaches need it parsed).
+    """
+    return session.connection().exec_driver_sql(
+        "SELECT loan_id, metric, MAX(period_end), value FROM financialmetric "
+        f"WHERE {_shard_filter(shard)} GROUP BY loan_id, metric"
+    ).fetchall()
+
+
+def load_financial_covenants(session, shard=None):
+    """(covenant_id, loan_id, name, metric, operator, threshold, raw_threshold) of every testable covenant."""
+    return session.connection().exec_driver_sql(
+        "SELECT id, loan_id, name, metric, operator, threshold, raw_threshold FROM covenant "
+        "WHERE kind = 'financial' AND metric IS NOT NULL AND operator IS NOT NULL AND threshold IS NOT NULL "
+        f"AND {_shard_filter(shard)}"
+    ).fetchall()
+
+
+def join_latest_metrics(cov_loan_ids, cov_metrics, met_loan_ids, met_metrics):
+    """
+    Pairs each covenant with its loan's latest value of the covenant's metric: both
+    sides are encoded as one int64 (loan_id, metric) key, then binary searched.
+    Returns (cov_index, metric_index): positions of the matched covenants and of their metric rows.
+    """
+    codes = {name: code for code, name in enumerate(set(cov_metrics) | set(met_metrics))}
+    n_metrics = len(codes)
+    cov_keys = np.array(cov_loan_ids, dtype=np.int64) * n_metrics + np.array([codes[m] for m in cov_metrics])
+    met_keys = np.array(met_loan_ids, dtype=np.int64) * n_metrics + np.array([codes[m] for m in met_metrics])
+
+    order = np.argsort(met_keys)
+    met_keys = met_keys[order]
+    positions = np.minimum(np.searchsorted(met_keys, cov_keys), len(met_keys) - 1)
+    matched = met_keys[positions] == cov_keys
+    return np.flatnonzero(matched), order[positions[matched]]
+
+
+def encode_operators(operators):
+    """Operator strings -> indexes into OPERATORS (-1 for anything else), as check_covenants takes them."""
+    operator_index = {op: code for code, op in enumerate(OPERATORS)}
+    return np.array([operator_index.get(op, -1) for op in operators])
+
+
+def check_covenants(values, operators, thresholds):
+    """
+    Vectorized covenant test. `operators` holds indexes into OPERATORS.
+    Returns (compliant, headroom): headroom is the distance to the limit as a share
+    of the threshold, positive while compliant (0.25 = 25% away from breaching).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    operators = np.asarray(operators)
+
+    compliant = np.select(
+        [operators == 0, operators == 1, operators == 2, operators == 3, operators == 4],
+        [values < thresholds, values <= thresholds, values > thresholds, values >= thresholds,
+         np.isclose(values, thresholds)],
+        default=False,
+    )
+
+    scale = np.abs(thresholds)
+    scale[scale == 0] = 1.0
+    upper_bound = operators <= 1  # "<", "<=": the value must stay below the limit
+    headroom = np.where(upper_bound, thresholds - values, values - thresholds) / scale
+    headroom = np.where(operators == 4, -np.abs(values - thresholds) / scale, headroom)
+    return compliant, headroom
+
+
+def _breach_alert(loan_id, covenant_id, name, operator, raw_threshold, value, period_end, now):
+    """Breach alert; (loan_id, covenant_id, period_end) dedupes it to one per reporting period."""
+    return {
+        "loan_id": loan_id,
+        "covenant_id": covenant_id,
+        "due_date": period_end,
+        "message": (
+            f"Covenant breach: {name} is {value:,.2f} for the period ending {period_end:%Y-%m-%d} "
+            f"(limit {operator} {raw_threshold})."
+        ),
+        "type": "critical",
+        "timestamp": now,
+    }
+
+
+def evaluate_covenants(now=None, shard=None):
+    """
+    Tests every financial covenant against the latest reported value of its metric
+    and moves loans to the status the numbers support:
+    - any breached covenant                           -> Critical
+    - all compliant, but one within the headroom band -> Watchlist
+    - all compliant with room to spare                -> Healthy
+    Loans with no reported metrics are left alone. Breach alerts are raised once per
+    covenant and reporting period. `shard` = (index, count) evaluates only the loans
+    with id % count == index. Returns counts for logging / the API.
+    """
+    now = now or datetime.now()
+    started = time.perf_counter()
+
+    with Session(engine) as session:
+        # 1. LOAD COLUMNS
+        cov_rows = load_financial_covenants(session, shard)
+        metric_rows = load_latest_metrics(session, shard)
+        result = {"covenants_tested": 0, "breaches": 0, "loans_evaluated": 0, "transitions": {}, "alerts": 0}
+        if not cov_rows or not metric_rows:
+            return result
+
+        cov_ids, cov_loan_ids, cov_names, cov_metrics, cov_ops, cov_thresholds, cov_raw = zip(*cov_rows)
+        met_loan_ids, met_metrics, met_periods, met_values = zip(*metric_rows)
+
+        # 2. JOIN ON (loan_id, metric)
+        cov_index, metric_index = join_latest_metrics(cov_loan_ids, cov_metrics, met_loan_ids, met_metrics)
+        if len(cov_index) == 0:
+            return result
+        operator_codes = encode_operators(cov_ops)[cov_index]
+        values = np.array(met_values, dtype=np.float64)[metric_index]
+        thresholds = np.array(cov_thresholds, dtype=np.float64)[cov_index]
+
+        # 3. TEST EVERY COVENANT AT ONCE
+        compliant, headroom = check_covenants(values, operator_codes, thresholds)
+        breached = ~compliant
+
+        # 4. ROLL UP PER LOAN (worst covenant wins)
+        tested_loan_ids = np.array(cov_loan_ids, dtype=np.int64)[cov_index]
+        loan_ids, loan_pos = np.unique(tested_loan_ids, return_inverse=True)
+        any_breach = np.zeros(len(loan_ids), dtype=bool)
+        np.logical_or.at(any_breach, loan_pos, breached)
+        min_headroom = np.full(len(loan_ids), np.inf)
+        np.minimum.at(min_headroom, loan_pos, headroom)
+
+        targets = np.where(
+            any_breach, "Critical", np.where(min_headroom < EVAL_WATCHLIST_HEADROOM, "Watchlist", "Healthy")
+        )
+        loan_query = select(Loan.id, Loan.risk_status)
+        if shard:
+            loan_query = loan_query.where(Loan.id % shard[1] == shard[0])
+        current = dict(session.exec(loan_query).all())
+        current_status = np.array([current.get(int(loan_id)) for loan_id in loan_ids], dtype=object)
+        known = current_status != None
+        changed = known & (current_status != targets)
+
+        transitions = {
+            status: loan_ids[changed & (targets == status)] for status in ("Critical", "Watchlist", "Healthy")
+        }
+
+        # 5. BREACH ALERTS: one per breached covenant and period (watch alerts follow the applied moves)
+        alert_rows = []
+        for i in np.flatnonzero(breached):
+            c, m = cov_index[i], metric_index[i]
+            if cov_loan_ids[c] not in current:
+                continue
+            alert_rows.append(_breach_alert(
+                cov_loan_ids[c], cov_ids[c], cov_names[c], cov_ops[c], cov_raw[c], met_values[m],
+                datetime.fromisoformat(met_periods[m]), now,
+            ))
+
+        # 6. APPLY (one write transaction)
+        begin_write(session)
+        # Loans re-rated since step 4 (e.g. a review) keep their status and get no watch alert
+        moved = apply_status_transitions(session, (
+            (loan_id, current[int(loan_id)], status) for status, ids in transitions.items() for loan_id in ids
+        ))
+        watch_rows = [
+            {
+                "loan_id": int(loan_id),
+                "message": "Covenant headroom below "
+                           f"{EVAL_WATCHLIST_HEADROOM:.0%}: latest financials are close to a limit.",
+                "type": "warning",
+                "timestamp": now,
+                "is_resolved": False,
+            }
+            for loan_id in loan_ids[changed & (targets == "Watchlist") & (current_status == "Healthy")]
+            if int(loan_id) in moved
+        ]
+        inserted = insert_obligation_alerts(session, alert_rows)
+        record_alerts(session, inserted)
+        if watch_rows:
+            session.execute(insert(Alert), watch_rows)
+            bump_table_versions(session, "alert")
+            record_alerts(session, [row["type"] for row in watch_rows])
+        session.commit()
+
+    result.update({
+        "covenants_tested": int(len(cov_index)),
+        "breaches": int(breached.sum()),
+        "loans_evaluated": int(known.sum()),
+        "transitions": {
+            status: sum(int(loan_id) in moved for loan_id in ids) for status, ids in transitions.items()
+        },
+        "alerts": int(sum(inserted.values()) + len(watch_rows)),
+    })
+    record_scan("covenant_evaluation", time.perf_counter() - started, result["loans_evaluated"], result["alerts"])
+    print(
+        f"📐 [EVAL] Tested {result['covenants_tested']} covenants on {result['loans_evaluated']} loans in "
+        f"{time.perf_counter() - started:.2f}s: {result['breaches']} breaches, "
+        f"{sum(result['transitions'].values())} status changes, {result['alerts']} new alerts."
+    )
+    return result
+
+
+# --- TRIGGERING ---
+# Ingest requests ask for an evaluation when they finish. Requests that arrive while one
+# is running are coalesced into a single follow-up pass instead of queueing one each.
+
+_evaluation_lock = threading.Lock()
+_evaluation_pending = threading.Event()
+
+
+def request_evaluation():
+    """Runs evaluate_covenants now, or makes the running evaluation go once more."""
+    _evaluation_pending.set()
+    while _evaluation_pending.is_set():
+        if not _evaluation_lock.acquire(blocking=False):
+            return  # The running pass will see the flag
+        try:
+            while _evaluation_pending.is_set():
+                _evaluation_pending.clear()
+                evaluate_covenants()
+        finally:
+            _evaluation_lock.release()
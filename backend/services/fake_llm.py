@@ -0,0 +1,124 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# A deterministic, offline stand-in for the Groq SDK client.
+# It mimics `client.chat.completions.create(...)` (and the AsyncGroq one as
+# `client.aio.chat.completions.create(...)`) and "extracts" covenants with
+# simple regexes, so the analysis pipeline can be tested and benchmarked without
+# a network connection or an API key.
+
+_TEXT_MARKER = "### LOAN AGREEMENT TEXT:"
+_COVENANT_LINE = re.compile(
+    r"^\s*(?P<name>[A-Za-z][\w\s\-()&/]*?)\s*(?P<operator><=|>=|<|>)\s*"
+    r"(?P<threshold>\$?\d[\d,.]*\s*(?:x|M|days?)?)\s*\.?\s*$",
+    re.MULTILINE,
+)
+_BORROWER = re.compile(r"^\s*Borrower:\s*(?P<value>.+?)\s*$", re.MULTILINE)
+_AMOUNT = re.compile(r"^\s*(?:Facility )?Amount:\s*(?P<value>.+?)\s*$", re.MULTILINE)
+_DATE = re.compile(r"^\s*Effective Date:\s*(?P<value>\d{4}-\d{2}-\d{2})\s*$", re.MULTILINE)
+
+
+def _first(pattern, text):
+    match = pattern.search(text)
+    return match.group("value") if match else "N/A"
+
+
+class FakeRateLimitError(Exception):
+    """Shaped like the SDK's RateLimitError (status_code 429), to exercise retries."""
+
+    status_code = 429
+
+    def __init__(self, message="Rate limit reached (simulated)"):
+        super().__init__(message)
+        self.response = SimpleNamespace(status_code=429, headers={})
+
+
+class _Completions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, model=None, messages=None, temperature=None, max_tokens=None, **kwargs):
+        return self._owner._complete(messages or [])
+
+
+class _AsyncCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def create(self, model=None, messages=None, temperature=None, max_tokens=None, **kwargs):
+        return await self._owner._acomplete(messages or [])
+
+
+class FakeLLMClient:
+    """
+    Drop-in replacement for `Groq(...)`, with `aio` standing in for `AsyncGroq(...)`.
+    - `latency`: seconds to sleep per call (to simulate network time in benchmarks)
+    - `calls`: number of completed calls, handy for asserting cache hits
+    - `rate_limit_every`: every Nth request fails with a 429 (0 = never)
+    """
+
+    def __init__(self, latency=0.0, rate_limit_every=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self.aio = SimpleNamespace(chat=SimpleNamespace(completions=_AsyncCompletions(self)))
+
+    def _complete(self, messages):
+        self._start_request()
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(messages)
+
+    async def _acomplete(self, messages):
+        self._start_request()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(messages)
+
+    def _start_request(self):
+        with self._lock:
+            self.requests += 1
+            rate_limited = self.rate_limit_every and self.requests % self.rate_limit_every == 0
+        if rate_limited:
+            raise FakeRateLimitError()
+
+    def _respond(self, messages):
+        prompt = messages[-1]["content"] if messages else ""
+        text = prompt.split(_TEXT_MARKER, 1)[-1]
+
+        data = {
+            "borrower_name": _first(_BORROWER, text),
+            "loan_amount": _first(_AMOUNT, text),
+            "effective_date": _first(_DATE, text),
+            "covenants": [
+                {
+                    "name": match.group("name").strip(),
+                    "operator": match.group("operator"),
+                    "threshold": match.group("threshold").strip(),
+                    "confidence": "High",
+                }
+                for match in _COVENANT_LINE.finditer(text)
+            ],
+        }
+        content = json.dumps(data)
+
+        with self._lock:
+            self.calls += 1
+
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
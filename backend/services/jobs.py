@@ -0,0 +1,322 @@
+import asyncio
+import json
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+from database import engine
+from models import AnalysisJob, AgreementText
+from services.ocr import iter_pdf_pages, shutdown_extraction_pool
+from services.analyzer import analyze_covenants_with_groq
+from services.cache import get_analysis_cache, hash_text
+from services.leases import run_exclusive, worker_id
+from services.uploads import discard, hash_file
+
+# --- CONFIGURATION ---
+JOB_DIR = os.getenv("ANALYSIS_JOB_DIR", os.path.join("uploads", "jobs"))
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+JOB_HEARTBEAT_SECONDS = 30  # Each worker touches updated_at of the jobs it holds this often
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "120"))  # No heartbeat this long = the worker died
+
+PENDING_STATUSES = ("queued", "running")
+
+TERMINAL_STATUSES = ("done", "failed")
+MAX_TRACKED_JOBS = 500  # Progress events are kept in memory for this many recent jobs
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# In-memory progress events per job (for SSE). Job state itself lives in the DB.
+_events = {}
+_events_lock = threading.Lock()
+
+
+def _get_executor():
+    """Bounded pool: at most ANALYSIS_WORKERS extractions/LLM analyses run at once."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+        return _executor
+
+
+def shutdown_job_workers():
+    """Stops the pools. Unfinished jobs stay 'queued'/'running' in the DB and resume on a later start."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+    shutdown_extraction_pool()
+
+
+def _publish(job_id, event, **data):
+    with _events_lock:
+        _events.setdefault(job_id, []).append({"event": event, **data})
+        while len(_events) > MAX_TRACKED_JOBS:
+            _events.pop(next(iter(_events)))
+
+
+def _update_job(job_id, **fields):
+    with Session(engine) as session:
+        job = session.get(AnalysisJob, job_id)
+        if job is None:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.now()
+        session.add(job)
+        session.commit()
+
+
+def _claim_job(job_id):
+    """
+    Atomically moves a queued job to 'running' for this worker. A job can be submitted
+    more than once (taken over from a worker that looked dead); only the UPDATE that wins runs it.
+    """
+    with Session(engine) as session:
+        result = session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.id == job_id, AnalysisJob.status == "queued")
+            .values(status="running", owner=worker_id(), updated_at=datetime.now())
+        )
+        session.commit()
+    return result.rowcount == 1
+
+
+# --- PUBLIC API ---
+
+def submit_analysis_job(spooled):
+    """
+    Queues a spooled upload (services/uploads.py), moving the file into JOB_DIR.
+    If the exact same PDF was analyzed before, the job is created already 'done'
+    from the cache and never queued.
+    """
+    job_id = uuid.uuid4().hex
+    cached = get_analysis_cache().get("pdf", spooled.sha256)
+
+    if cached is not None:
+        discard(spooled.path)
+        job = AnalysisJob(id=job_id, filename=spooled.filename, file_path="", file_sha256=spooled.sha256,
+                          status="done", result_json=json.dumps(cached))
+    else:
+        os.makedirs(JOB_DIR, exist_ok=True)
+        file_path = os.path.join(JOB_DIR, f"{job_id}.pdf")
+        shutil.move(spooled.path, file_path)
+        job = AnalysisJob(id=job_id, filename=spooled.filename, file_path=file_path, file_sha256=spooled.sha256,
+                          owner=worker_id())
+
+    with Session(engine) as session:
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+
+    if job.status == "queued":
+        _publish(job_id, "status", status="queued")
+        _get_executor().submit(_run_job, job_id)
+    else:
+        _publish(job_id, "status", status="done")
+    return job
+
+
+# Ownership: a pending job belongs to the worker whose pool holds it (`owner`). Every
+# worker heartbeats its jobs (heartbeat_jobs); a leased sweep (requeue_stale_jobs) takes
+# over the jobs of a worker that stopped, so work queued or running in a process that
+# died is picked up again within JOB_STALE_SECONDS, whether or not it restarts.
+
+def resume_pending_jobs():
+    """
+    Called on startup. A restarted process can have the worker id of the one that died
+    (same pid in a container): the jobs under this id are orphans, so they are re-queued
+    here at once. Then the jobs of other dead workers are swept up.
+    """
+    me = worker_id()
+    with Session(engine) as session:
+        session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.owner == me, AnalysisJob.status.in_(PENDING_STATUSES))
+            .values(status="queued", updated_at=datetime.now())
+        )
+        session.commit()
+        job_ids = session.exec(
+            select(AnalysisJob.id)
+            .where(AnalysisJob.owner == me, AnalysisJob.status == "queued")
+            .order_by(AnalysisJob.created_at)
+        ).all()
+    _submit_resumed(job_ids)
+    return len(job_ids) + (run_exclusive("resume_jobs", requeue_stale_jobs) or 0)
+
+
+def heartbeat_jobs():
+    """Scheduled in every worker (each JOB_HEARTBEAT_SECONDS): shows the jobs it holds are alive."""
+    with Session(engine) as session:
+        session.execute(
+            update(AnalysisJob)
+            .where(AnalysisJob.owner == worker_id(), AnalysisJob.status.in_(PENDING_STATUSES))
+            .values(updated_at=datetime.now())
+        )
+        session.commit()
+
+
+def requeue_stale_jobs(now=None):
+    """
+    Leased sweep (startup and scheduler): takes over the queued/running jobs of other
+    workers that haven't heartbeated for JOB_STALE_SECONDS, re-queues them under this
+    worker and submits them here. Returns the number of jobs taken over.
+    """
+    now = now or datetime.now()
+    me = worker_id()
+    stale = (
+        AnalysisJob.status.in_(PENDING_STATUSES),
+        or_(AnalysisJob.owner == None, AnalysisJob.owner != me),
+        AnalysisJob.updated_at < now - timedelta(seconds=JOB_STALE_SECONDS),
+    )
+    with Session(engine) as session:
+        job_ids = session.exec(select(AnalysisJob.id).where(*stale).order_by(AnalysisJob.created_at)).all()
+        # Conditional on still being stale, in case the owner heartbeated since the read
+        taken = [
+            job_id for job_id in job_ids
+            if session.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, *stale)
+                .values(status="queued", owner=me, updated_at=now)
+            ).rowcount == 1
+        ]
+        session.commit()
+    _submit_resumed(taken)
+    return len(taken)
+
+
+def _submit_resumed(job_ids):
+    for job_id in job_ids:
+        _publish(job_id, "status", status="queued")
+        _get_executor().submit(_run_job, job_id)
+    if job_ids:
+        print(f"🔁 [JOBS] Resumed {len(job_ids)} pending analysis jobs.")
+
+
+def get_job(job_id):
+    with Session(engine) as session:
+        return session.get(AnalysisJob, job_id)
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "progress": {
+            "pages_extracted": job.pages_extracted,
+            "chunks_done": job.chunks_done,
+            "chunks_total": job.chunks_total,
+        },
+        "result": json.loads(job.result_json) if job.result_json else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+    }
+
+
+async def iter_job_events(job_id, poll_seconds=0.25):
+    """
+    Server-Sent Events stream for one job: 'status', 'page', 'relevance' and 'chunk' events,
+    ending after the job reaches a terminal status.
+    """
+    sent = 0
+    while True:
+        with _events_lock:
+            pending = _events.get(job_id, [])[sent:]
+        for event in pending:
+            sent += 1
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+        job = await asyncio.to_thread(get_job, job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            # Flush anything published between the last read and the status check
+            with _events_lock:
+                pending = _events.get(job_id, [])[sent:]
+            for event in pending:
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            final = job_to_dict(job) if job else {"job_id": job_id, "status": "unknown"}
+            yield f"event: end\ndata: {json.dumps(final)}\n\n"
+            return
+
+        await asyncio.sleep(poll_seconds)
+
+
+# --- WORKER ---
+
+def _run_job(job_id):
+    if not _claim_job(job_id):
+        return  # Finished, or already claimed by another worker
+    job = get_job(job_id)
+    _publish(job_id, "status", status="running")
+    print(f"🧠 [JOBS] Analyzing {job.filename} ({job_id})...")
+
+    try:
+        cache = get_analysis_cache()
+        pdf_key = job.file_sha256 or hash_file(job.file_path)  # Jobs queued before the hash was stored
+        data = cache.get("pdf", pdf_key)
+
+        if data is None:
+            # 1. EXTRACT (streamed page by page, straight from the file on disk)
+            pages = []
+            try:
+                for page_num, page_text in iter_pdf_pages(job.file_path):
+                    pages.append(f"--- Page {page_num} ---\n{page_text}")
+                    _publish(job_id, "page", page=page_num)
+            except Exception as e:
+                print(f"❌ PDF Extraction Error: {e}")
+                return _fail(job_id, "OCR Failed")
+            _update_job(job_id, pages_extracted=len(pages))
+
+            text = "\n\n".join(pages)
+            if not text:
+                return _fail(job_id, "OCR Failed")
+            _save_agreement_text(pdf_key, len(pages), text)
+
+            # 2. ANALYZE (chunked, cached by text hash)
+            text_key = hash_text(text)
+            data = cache.get("text", text_key)
+            if data is None:
+                def on_progress(done, total):
+                    _publish(job_id, "chunk", done=done, total=total)
+                    _update_job(job_id, chunks_done=done, chunks_total=total)
+
+                relevance = {}
+                data = analyze_covenants_with_groq(text, on_progress=on_progress, report=relevance)
+                _publish(job_id, "relevance", **relevance)
+                if not data:
+                    return _fail(job_id, "AI Analysis Failed")
+                cache.put("text", text_key, data)
+
+            cache.put("pdf", pdf_key, data)
+
+        _update_job(job_id, status="done", result_json=json.dumps(data))
+        _publish(job_id, "status", status="done")
+        discard(job.file_path)
+        print(f"✅ [JOBS] Analysis {job_id} complete.")
+
+    except Exception as e:
+        print(f"❌ [JOBS] Analysis {job_id} failed: {e}")
+        _fail(job_id, str(e))
+
+
+def _save_agreement_text(sha256, pages, text):
+    """Keeps the extracted text (by PDF hash) so a loan saved from this job is searchable by it."""
+    with Session(engine) as session:
+        if session.get(AgreementText, sha256) is None:
+            session.add(AgreementText(sha256=sha256, pages=pages, text=text))
+            session.commit()
+
+
+def _fail(job_id, error):
+    _update_job(job_id, status="failed", error=error)
+    _publish(job_id, "status", status="failed", error=error)
+    job = get_job(job_id)
+    if job:
+        discard(job.file_path)
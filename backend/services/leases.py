@@ -0,0 +1,73 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, bindparam, text
+from sqlmodel import Session
+from database import engine
+
+# --- JOB LEASES ---
+# With several uvicorn workers every process starts its own BackgroundScheduler.
+# Each scheduled job first claims its row in `schedulerlease` with one atomic UPSERT;
+# only the worker that wins runs the job, the others skip this tick.
+
+# --- CONFIGURATION ---
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", "3600"))  # A holder that dies is presumed gone after this
+
+_ACQUIRE = text(
+    "INSERT INTO schedulerlease (name, owner, acquired_at, expires_at) "
+    "VALUES (:name, :owner, :now, :expires_at) "
+    "ON CONFLICT (name) DO UPDATE SET "
+    "owner = excluded.owner, acquired_at = excluded.acquired_at, expires_at = excluded.expires_at "
+    "WHERE schedulerlease.expires_at <= :now AND schedulerlease.acquired_at <= :not_before"
+).bindparams(
+    # Same text format as ORM-written datetimes, so the comparisons are like for like
+    bindparam("now", type_=DateTime), bindparam("expires_at", type_=DateTime), bindparam("not_before", type_=DateTime),
+)
+
+_RELEASE = text(
+    "UPDATE schedulerlease SET expires_at = :now WHERE name = :name AND owner = :owner"
+).bindparams(bindparam("now", type_=DateTime))
+
+
+def worker_id():
+    """Identifies this process in the lease table."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_lease(name, min_interval_seconds=0, ttl_seconds=None, owner=None, now=None):
+    """
+    Claims the lease `name` if nobody holds it and it wasn't taken in the last
+    `min_interval_seconds` (so a job fires once per interval, however many workers
+    tick). Returns True if this worker now holds it.
+    """
+    now = now or datetime.now()
+    with Session(engine) as session:
+        result = session.execute(_ACQUIRE, {
+            "name": name,
+            "owner": owner or worker_id(),
+            "now": now,
+            "expires_at": now + timedelta(seconds=ttl_seconds or LEASE_TTL_SECONDS),
+            "not_before": now - timedelta(seconds=min_interval_seconds),
+        })
+        session.commit()
+    return result.rowcount == 1
+
+
+def release_lease(name, owner=None, now=None):
+    """Ends the lease early (the job finished); the minimum interval still applies."""
+    with Session(engine) as session:
+        session.execute(_RELEASE, {"name": name, "owner": owner or worker_id(), "now": now or datetime.now()})
+        session.commit()
+
+
+def run_exclusive(name, fn, min_interval_seconds=0, ttl_seconds=None):
+    """
+    Runs fn() only if this worker wins the lease `name`.
+    Returns fn's result, or None if another worker has (or recently had) the job.
+    """
+    if not acquire_lease(name, min_interval_seconds, ttl_seconds):
+        return None
+    try:
+        return fn()
+    finally:
+        release_lease(name)
@@ -0,0 +1,280 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from services.telemetry import LLM_LATENCY, LLM_PROMPT_CHARS, LLM_RETRIES, LLM_TOKENS
+
+# --- CONFIGURATION ---
+# One shared client for the whole process: every analysis job and chunk goes through
+# the same rate limiter and concurrency cap, so bursts of uploads queue up here
+# instead of tripping Groq's 429s.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")  # groq, fake
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))  # 0 = unlimited
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 0 = unlimited
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "1.0"))  # First retry delay, doubled each time
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_RATE_LIMIT_EVERY = int(os.getenv("FAKE_LLM_RATE_LIMIT_EVERY", "0"))  # Simulated 429 on every Nth request
+
+CHARS_PER_TOKEN = 4  # Same estimate as the chunker
+ASYNC_SLOT_POLL_SECONDS = 0.01  # acreate(): how often a waiting call rechecks for a free slot
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, bursts of up to `capacity`.
+    acquire() blocks until enough tokens are available (aacquire() awaits instead).
+    A rate of 0 disables it.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self, amount):
+        """Takes `amount` tokens if available (returns 0), else returns the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return 0.0
+            return (amount - self._tokens) / self.rate
+
+    def acquire(self, amount=1.0):
+        """Takes `amount` tokens, sleeping as needed. Returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)  # A single huge request must not wait forever
+
+        waited = 0.0
+        while delay := self._take(amount):
+            time.sleep(delay)
+            waited += delay
+        return waited
+
+    async def aacquire(self, amount=1.0):
+        """acquire() for async callers: awaits instead of blocking the event loop."""
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+
+        waited = 0.0
+        while delay := self._take(amount):
+            await asyncio.sleep(delay)
+            waited += delay
+        return waited
+
+
+def _create_backend(name):
+    """
+    Builds the underlying SDK-style client (anything with .chat.completions.create).
+    Its `aio` attribute, if any, is the async counterpart (awaitable .chat.completions.create).
+    """
+    if name == "fake":
+        from services.fake_llm import FakeLLMClient
+        return FakeLLMClient(latency=FAKE_LLM_LATENCY, rate_limit_every=FAKE_LLM_RATE_LIMIT_EVERY)
+    if name == "groq":
+        from groq import AsyncGroq, Groq
+        # Retries are ours (with the shared limiter), so the SDK's own are turned off
+        options = dict(api_key=os.getenv("GROQ_API_KEY"), max_retries=0, timeout=LLM_TIMEOUT_SECONDS)
+        client = Groq(**options)
+        client.aio = AsyncGroq(**options)
+        return client
+    raise ValueError(f"Unknown LLM backend: {name}")
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _is_retryable(error):
+    """429s, 5xx and connection/timeouts are worth retrying; other 4xx are not."""
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    try:
+        import groq
+        if isinstance(error, groq.APIConnectionError):
+            return True
+    except ImportError:
+        pass
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _retry_after(error):
+    """Server-suggested delay (Retry-After header), if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """
+    Rate-limited, concurrency-bounded wrapper around an LLM SDK client.
+    Exposes the same `chat.completions.create(...)` surface as the Groq SDK, plus
+    `acreate(...)` for async callers and `stats()` for latency/token accounting.
+    The backend is created on first use, not at import time.
+    """
+
+    def __init__(self, backend=None, backend_name=None, requests_per_minute=None, tokens_per_minute=None,
+                 max_concurrency=None, max_retries=None, backoff_seconds=None, backoff_max_seconds=None):
+        self._backend = backend
+        self.backend_name = backend_name or (type(backend).__name__ if backend is not None else LLM_BACKEND)
+        rpm = LLM_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute
+        tpm = LLM_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute
+        self._requests = TokenBucket(rpm / 60, capacity=max(1.0, rpm / 6))  # Bursts of ~10s worth
+        self._tokens = TokenBucket(tpm / 60, capacity=max(1.0, tpm / 6))
+        self._slots = threading.BoundedSemaphore(max_concurrency or LLM_MAX_CONCURRENCY)
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = LLM_BACKOFF_SECONDS if backoff_seconds is None else backoff_seconds
+        self.backoff_max_seconds = LLM_BACKOFF_MAX_SECONDS if backoff_max_seconds is None else backoff_max_seconds
+
+        self._backend_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0, "failures": 0, "retries": 0, "rate_limited": 0,
+            "prompt_tokens": 0, "completion_tokens": 0,
+            "latency_seconds_total": 0.0, "latency_seconds_max": 0.0, "throttled_seconds_total": 0.0,
+        }
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    self._backend = _create_backend(self.backend_name)
+        return self._backend
+
+    def _count(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _retry_delay(self, error, attempt, throttled):
+        """Seconds to wait before retry number `attempt`; re-raises when the call can't be retried."""
+        if not _is_retryable(error) or attempt > self.max_retries:
+            self._count(failures=1, throttled_seconds_total=throttled)
+            raise error
+        delay = _retry_after(error)
+        if delay is None:
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (attempt - 1)))
+        self._count(retries=1, rate_limited=int(_status_code(error) == 429), throttled_seconds_total=throttled)
+        LLM_RETRIES.inc(backend=self.backend_name)
+        print(f"🔁 [LLM] {type(error).__name__}; retry {attempt}/{self.max_retries} in {delay:.1f}s")
+        return delay
+
+    def _record(self, response, latency, prompt_chars, throttled):
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        LLM_LATENCY.observe(latency, backend=self.backend_name, outcome="ok")
+        LLM_PROMPT_CHARS.observe(prompt_chars, backend=self.backend_name)
+        LLM_TOKENS.inc(prompt_tokens, backend=self.backend_name, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, backend=self.backend_name, kind="completion")
+        with self._stats_lock:
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += prompt_tokens
+            self._stats["completion_tokens"] += completion_tokens
+            self._stats["latency_seconds_total"] += latency
+            self._stats["latency_seconds_max"] = max(self._stats["latency_seconds_max"], latency)
+            self._stats["throttled_seconds_total"] += throttled
+
+    def create(self, model=None, messages=None, temperature=None, max_tokens=None, **kwargs):
+        """Synchronous completion with rate limiting, bounded concurrency and retries."""
+        messages = messages or []
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        estimated_tokens = prompt_chars // CHARS_PER_TOKEN + (max_tokens or 0)
+
+        attempt = 0
+        while True:
+            throttled = self._requests.acquire() + self._tokens.acquire(estimated_tokens)
+            try:
+                with self._slots:
+                    started = time.perf_counter()
+                    response = self.backend.chat.completions.create(
+                        model=model, messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs
+                    )
+            except Exception as e:
+                LLM_LATENCY.observe(time.perf_counter() - started, backend=self.backend_name, outcome="error")
+                attempt += 1
+                time.sleep(self._retry_delay(e, attempt, throttled))
+                continue
+
+            self._record(response, time.perf_counter() - started, prompt_chars, throttled)
+            return response
+
+    async def acreate(self, model=None, messages=None, temperature=None, max_tokens=None, **kwargs):
+        """
+        Async completion: awaits the backend's async client (`aio`), under the same rate
+        limits, concurrency cap and retries as create(), without holding a thread while
+        it waits. Backends without an async client run in a worker thread instead.
+        """
+        messages = messages or []
+        prompt_chars = sum(len(m.get("content", "")) for m in messages)
+        estimated_tokens = prompt_chars // CHARS_PER_TOKEN + (max_tokens or 0)
+        aio = getattr(self.backend, "aio", None)
+
+        attempt = 0
+        while True:
+            throttled = await self._requests.aacquire() + await self._tokens.aacquire(estimated_tokens)
+            # The slots are shared with create()'s threads, so they can't be awaited: poll
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(ASYNC_SLOT_POLL_SECONDS)
+            error = None
+            try:
+                started = time.perf_counter()
+                call = dict(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+                if aio is not None:
+                    response = await aio.chat.completions.create(**call)
+                else:
+                    response = await asyncio.to_thread(self.backend.chat.completions.create, **call)
+            except Exception as e:
+                error = e
+            finally:
+                self._slots.release()  # Before any backoff, like create()
+
+            if error is not None:
+                LLM_LATENCY.observe(time.perf_counter() - started, backend=self.backend_name, outcome="error")
+                attempt += 1
+                await asyncio.sleep(self._retry_delay(error, attempt, throttled))
+                continue
+
+            self._record(response, time.perf_counter() - started, prompt_chars, throttled)
+            return response
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["backend"] = self.backend_name
+        stats["latency_seconds_avg"] = stats["latency_seconds_total"] / stats["calls"] if stats["calls"] else 0.0
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """Process-wide LLMClient (created on first use)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient()
+        return _client
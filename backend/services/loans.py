@@ -0,0 +1,324 @@
+import json
+import os
+from datetime import datetime, timedelta
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Integer, column, delete, func, insert, table, text, update
+from sqlmodel import Session, select
+from database import engine, begin_write
+from models import Loan, LoanIn, Covenant, Alert
+from services.covenants import build_covenant_rows, sync_covenant_rows
+from services.obligations import regenerate_obligations
+from services.portfolio import record_new_loans, record_loan_edit, record_status_changes, record_alerts
+from services.versions import bump_table_versions
+
+# --- LIST QUERIES (keyset pagination + projection) ---
+
+LOAN_FIELDS = tuple(Loan.model_fields)
+MAX_PAGE_SIZE = 1000
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+MAX_REPORTED_ERRORS = 100
+
+
+def parse_fields(fields):
+    """
+    Turns "borrower_name,loan_amount" into a list of Loan column names (id is always
+    included, it is the pagination key). Raises ValueError on unknown names.
+    """
+    if not fields:
+        return list(LOAN_FIELDS)
+
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in LOAN_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return names
+
+
+def build_loan_query(field_names, cursor=None, risk_status=None, created_after=None,
+                     created_before=None, limit=None):
+    """
+    SELECT only the requested columns, ordered by id. `cursor` is the last id of the
+    previous page (keyset pagination: WHERE id > cursor, no OFFSET scans).
+    """
+    stmt = select(*[getattr(Loan, name) for name in field_names]).order_by(Loan.id)
+
+    if cursor is not None:
+        stmt = stmt.where(Loan.id > cursor)
+    if risk_status:
+        stmt = stmt.where(Loan.risk_status == risk_status)
+    if created_after:
+        stmt = stmt.where(Loan.created_at >= created_after)
+    if created_before:
+        stmt = stmt.where(Loan.created_at < created_before)
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def loan_row_to_dict(row):
+    """Row mapping -> JSON-ready dict (same datetime format as the pydantic response)."""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in row.items()
+    }
+
+
+# --- BULK INSERT ---
+
+_loan_validator = TypeAdapter(LoanIn)
+
+
+def validate_loan_batch(records, offset=0):
+    """
+    Validates raw dicts against LoanIn.
+    Returns (valid LoanIn list, [{"index": n, "error": "..."}] for the rejects).
+    """
+    valid, rejected = [], []
+    for i, record in enumerate(records):
+        try:
+            valid.append(_loan_validator.validate_python(record))
+        except ValidationError as e:
+            error = e.errors(include_url=False)[0]
+            location = ".".join(str(part) for part in error["loc"])
+            message = f"{location}: {error['msg']}" if location else error["msg"]
+            rejected.append({"index": offset + i, "error": message})
+    return valid, rejected
+
+
+def insert_loans(session, loans):
+    """
+    Inserts LoanIn records (and their Covenant rows) with two executemany statements,
+    and adds them to the portfolio summary. Does not commit - callers decide the
+    transaction size. Returns the new loan ids.
+    """
+    if not loans:
+        return []
+
+    now = datetime.utcnow()
+    loan_table = Loan.__table__
+    loan_ids = session.execute(
+        insert(loan_table).returning(loan_table.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "borrower_name": loan.borrower_name,
+                "loan_amount": loan.loan_amount,
+                "effective_date": loan.effective_date,
+                "risk_status": loan.risk_status,
+                "sector": loan.sector,
+                "created_at": now,
+                "covenants_json": json.dumps(loan.covenants),
+            }
+            for loan in loans
+        ],
+    ).scalars().all()
+
+    covenant_rows = []
+    for loan_id, loan in zip(loan_ids, loans):
+        covenant_rows.extend(build_covenant_rows(loan_id, loan.covenants, loan.effective_date))
+    if covenant_rows:
+        session.execute(insert(Covenant.__table__), covenant_rows)
+
+    record_new_loans(session, [(loan.risk_status, loan.loan_amount) for loan in loans], len(covenant_rows))
+    regenerate_obligations(session, loan_ids)
+    bump_table_versions(session, "loan")
+    return loan_ids
+
+
+def update_loan(session, loan, changes):
+    """
+    Applies a LoanUpdate to `loan`. New covenants (or a new effective date) update its
+    Covenant rows in place and rebuild its obligation calendar; the portfolio summary
+    follows the amount.
+    Does not commit.
+    """
+    begin_write(session)  # Reads the covenant rows, then writes them
+    old_amount = loan.loan_amount
+    fields = changes.model_dump(exclude_unset=True, exclude={"covenants"})
+    for name, value in fields.items():
+        if value is not None:
+            setattr(loan, name, value)
+    if changes.covenants is not None:
+        loan.covenants_json = json.dumps(changes.covenants)
+    session.add(loan)
+
+    covenant_delta = 0
+    if changes.covenants is not None or "effective_date" in fields:
+        covenant_delta, changed = sync_covenant_rows(session, loan)
+        if changed:
+            regenerate_obligations(session, [loan.id])
+
+    record_loan_edit(session, loan.risk_status, old_amount, loan.loan_amount, covenant_delta)
+    bump_table_versions(session, "loan")
+    return loan
+
+
+def ingest_loan_batch(records, offset, summary):
+    """
+    Validates and inserts one batch in its own transaction, updating `summary`
+    ({"inserted", "rejected", "errors"}) in place. Used by POST /api/loans/bulk.
+    """
+    valid, rejected = validate_loan_batch(records, offset)
+
+    with Session(engine) as session:
+        insert_loans(session, valid)
+        session.commit()
+
+    summary["inserted"] += len(valid)
+    summary["rejected"] += len(rejected)
+    room = MAX_REPORTED_ERRORS - len(summary["errors"])
+    if room > 0:
+        summary["errors"].extend(rejected[:room])
+
+
+# --- REVIEW (set-based) ---
+
+# Per-connection scratch table holding the loans selected for one review
+_review_target = table("review_target", column("loan_id", Integer))
+
+
+def review_loans(session, loan_ids=None, risk_status=None, alerts_older_than_days=None, now=None):
+    """
+    Marks the selected loans Healthy and resolves all their alerts with a handful of
+    statements, however many loans are selected. Selectors are combined with AND:
+    - loan_ids: explicit list (unknown ids are counted as not_found)
+    - risk_status: only loans currently in this status
+    - alerts_older_than_days: only loans whose newest unresolved alert is older than N days
+    Does not commit. Returns counts for the response.
+    """
+    now = now or datetime.now()
+    begin_write(session)  # Reads the targets, then writes them
+
+    # 1. SELECT TARGETS
+    matching = select(Loan.id)
+    if risk_status:
+        matching = matching.where(Loan.risk_status == risk_status)
+    if alerts_older_than_days is not None:
+        cutoff = now - timedelta(days=alerts_older_than_days)
+        matching = matching.where(Loan.id.in_(
+            select(Alert.loan_id)
+            .where(Alert.is_resolved == False)
+            .group_by(Alert.loan_id)
+            .having(func.max(Alert.timestamp) < cutoff)
+        ))
+
+    conn = session.connection()
+    conn.exec_driver_sql("CREATE TEMP TABLE IF NOT EXISTS review_target (loan_id INTEGER PRIMARY KEY)")
+    conn.exec_driver_sql("DELETE FROM review_target")
+
+    not_found = skipped = 0
+    if loan_ids is not None:
+        staged = [(loan_id,) for loan_id in set(loan_ids)]
+        if staged:
+            conn.exec_driver_sql("INSERT INTO review_target (loan_id) VALUES (?)", staged)
+        not_found = conn.execute(
+            delete(_review_target).where(_review_target.c.loan_id.not_in(select(Loan.id)))
+        ).rowcount
+        if risk_status or alerts_older_than_days is not None:
+            skipped = conn.execute(
+                delete(_review_target).where(_review_target.c.loan_id.not_in(matching))
+            ).rowcount
+    else:
+        conn.execute(insert(_review_target).from_select(["loan_id"], matching))
+
+    targets = select(_review_target.c.loan_id)
+    reviewed = conn.execute(select(func.count()).select_from(_review_target)).scalar()
+
+    # 2. PORTFOLIO SUMMARY (old values, read before they are overwritten)
+    changed = conn.execute(
+        select(Loan.risk_status, Loan.loan_amount)
+        .where(Loan.id.in_(targets))
+        .where(Loan.risk_status != "Healthy")
+    ).all()
+    record_status_changes(session, [(old_status, "Healthy", amount) for old_status, amount in changed])
+
+    open_alerts = dict(conn.execute(
+        select(Alert.type, func.count())
+        .where(Alert.loan_id.in_(targets))
+        .where(Alert.is_resolved == False)
+        .group_by(Alert.type)
+    ).all())
+    record_alerts(session, open_alerts, sign=-1)
+
+    # 3. APPLY (one UPDATE per table)
+    conn.execute(
+        update(Loan.__table__)
+        .where(Loan.__table__.c.id.in_(targets))
+        .where(Loan.__table__.c.risk_status != "Healthy")
+        .values(risk_status="Healthy")
+    )
+    conn.execute(
+        update(Alert.__table__)
+        .where(Alert.__table__.c.loan_id.in_(targets))
+        .where(Alert.__table__.c.is_resolved == False)
+        .values(is_resolved=True)
+    )
+    conn.exec_driver_sql("DELETE FROM review_target")
+    if changed or open_alerts:
+        bump_table_versions(session, "loan", "alert")
+
+    return {
+        "reviewed": reviewed,
+        "status_changed": len(changed),
+        "alerts_resolved": sum(open_alerts.values()),
+        "not_found": not_found,  # Requested ids that don't exist
+        "skipped": skipped,  # Requested ids that didn't match the filters
+    }
+
+
+# --- STATUS TRANSITIONS (set-based) ---
+
+def apply_status_transitions(session, transitions):
+    """
+    `transitions`: iterable of (loan_id, old_status, new_status), where old_status is the
+    status the caller read. Stages them in a temp table, then runs one set-based UPDATE
+    per target status (avoids SQLite's bound-parameter limit on huge IN lists).
+    A loan whose status changed since it was read (e.g. a concurrent review) is left
+    alone. Call inside the write transaction (begin_write), so the check and the UPDATE
+    see the same rows. The portfolio summary is adjusted from the applied rows.
+    Returns the set of loan ids actually moved. Does not commit.
+    """
+    staged = [
+        (int(loan_id), old_status, new_status)
+        for loan_id, old_status, new_status in transitions
+        if old_status != new_status
+    ]
+    if not staged:
+        return set()
+
+    conn = session.connection()
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS scan_transition "
+        "(loan_id INTEGER PRIMARY KEY, old_status TEXT, new_status TEXT NOT NULL)"
+    )
+    conn.exec_driver_sql("DELETE FROM scan_transition")
+    conn.exec_driver_sql(
+        "INSERT INTO scan_transition (loan_id, old_status, new_status) VALUES (?, ?, ?)", staged
+    )
+    # Drop loans that moved (or were deleted) after the caller read them
+    conn.exec_driver_sql(
+        "DELETE FROM scan_transition WHERE old_status IS NOT "
+        "(SELECT risk_status FROM loan WHERE loan.id = scan_transition.loan_id)"
+    )
+
+    applied = conn.exec_driver_sql(
+        "SELECT scan_transition.loan_id, loan.risk_status, scan_transition.new_status, loan.loan_amount "
+        "FROM scan_transition JOIN loan ON loan.id = scan_transition.loan_id"
+    ).all()
+    if not applied:
+        return set()
+    record_status_changes(session, [row[1:] for row in applied])
+
+    for status in {row[2] for row in applied}:
+        session.execute(
+            text(
+                "UPDATE loan SET risk_status = :status "
+                "WHERE id IN (SELECT loan_id FROM scan_transition WHERE new_status = :status)"
+            ),
+            {"status": status},
+        )
+
+    conn.exec_driver_sql("DELETE FROM scan_transition")
+    bump_table_versions(session, "loan")
+    return {row[0] for row in applied}
@@ -0,0 +1,270 @@
+import calendar
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, delete, insert, literal, tuple_
+from sqlmodel import Session, select
+from database import engine
+from models import Loan, Covenant, ObligationInstance, SchedulerState
+from services.alerts import insert_obligation_alerts, overdue_alert
+from services.covenants import parse_effective_date
+from services.portfolio import record_alerts, refresh_obligation_counts
+
+# --- OBLIGATION CALENDAR ---
+# Every reporting covenant is expanded into dated instances (one per period) over a
+# rolling window: OBLIGATION_HISTORY_DAYS back and OBLIGATION_HORIZON_DAYS ahead.
+# A daily job pushes the horizon forward and prunes what fell out of the back;
+# creating or editing a loan regenerates just that loan's instances. Readers only
+# ever do range scans on due_date.
+
+# --- CONFIGURATION ---
+OBLIGATION_HORIZON_DAYS = int(os.getenv("OBLIGATION_HORIZON_DAYS", "180"))
+OBLIGATION_HISTORY_DAYS = int(os.getenv("OBLIGATION_HISTORY_DAYS", "30"))
+OBLIGATION_BATCH_SIZE = int(os.getenv("OBLIGATION_BATCH_SIZE", "20000"))  # Covenants per generation batch
+OBLIGATION_PRUNE_BATCH_SIZE = int(os.getenv("OBLIGATION_PRUNE_BATCH_SIZE", "5000"))  # Rows deleted per transaction
+OBLIGATION_HORIZON_KEY = "obligation_calendar_horizon"  # SchedulerState: materialized up to here
+OBLIGATION_WATERMARK_KEY = "obligations_watermark"  # SchedulerState: deadlines checked up to here (scheduler.py)
+
+
+def add_months(date, months):
+    """Calendar month arithmetic, clamping the day (Jan 31 + 1 month -> Feb 28/29)."""
+    month_index = date.month - 1 + months
+    year, month = date.year + month_index // 12, month_index % 12 + 1
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+def iter_due_dates(effective_date, days_limit, frequency_months, start, end):
+    """
+    Yields (period_end, due_date) for every delivery due in (start, end].
+    Recurring reports: period k ends `k * frequency_months` after the effective date and
+    is due `days_limit` days later. One-off reports are due once, days_limit after it.
+    """
+    delay = timedelta(days=days_limit)
+
+    if not frequency_months:
+        due_date = effective_date + delay
+        if start < due_date <= end:
+            yield effective_date, due_date
+        return
+
+    # Jump straight to the first period that can be due after `start`
+    earliest = start - delay
+    months = (earliest.year - effective_date.year) * 12 + earliest.month - effective_date.month
+    k = max(1, months // frequency_months)
+    while True:
+        period_end = add_months(effective_date, k * frequency_months)
+        due_date = period_end + delay
+        if due_date > end:
+            return
+        if due_date > start:
+            yield period_end, due_date
+        k += 1
+
+
+def _load_reporting_covenants(session, after_id, limit, loan_ids=None):
+    """(covenant_id, loan_id, name, days_limit, frequency_months, effective_date), keyset by covenant id."""
+    stmt = (
+        select(Covenant.id, Covenant.loan_id, Covenant.name, Covenant.threshold,
+               Covenant.frequency_months, Loan.effective_date)
+        .join(Loan, Loan.id == Covenant.loan_id)
+        .where(Covenant.kind == "reporting")
+        .where(Covenant.threshold != None)
+        .where(Covenant.id > after_id)
+        .order_by(Covenant.id)
+        .limit(limit)
+    )
+    if loan_ids is not None:
+        stmt = stmt.where(Covenant.loan_id.in_(loan_ids))
+    return session.exec(stmt).all()
+
+
+def materialize_obligations(session: Session, start, end, loan_ids=None):
+    """
+    Inserts the instances due in (start, end] for all reporting covenants (or just those
+    of `loan_ids`), in covenant batches. Existing instances are kept (INSERT OR IGNORE on
+    covenant_id + due_date), so overlapping windows are safe. Does not commit.
+    Returns the number of instances generated.
+    """
+    generated = 0
+    last_id = 0
+    while True:
+        batch = _load_reporting_covenants(session, last_id, OBLIGATION_BATCH_SIZE, loan_ids)
+        if not batch:
+            break
+
+        rows = []
+        for cov_id, loan_id, name, days_limit, frequency, effective_date in batch:
+            effective = parse_effective_date(effective_date)
+            if effective is None:
+                continue
+            for period_end, due_date in iter_due_dates(effective, days_limit, frequency, start, end):
+                rows.append({
+                    "covenant_id": cov_id, "loan_id": loan_id, "name": name,
+                    "period_end": period_end, "due_date": due_date,
+                })
+        if rows:
+            session.execute(insert(ObligationInstance).prefix_with("OR IGNORE"), rows)
+
+        generated += len(rows)
+        last_id = batch[-1][0]
+        if len(batch) < OBLIGATION_BATCH_SIZE:
+            break
+    return generated
+
+
+def get_calendar_horizon(session: Session, now=None):
+    """How far ahead the calendar is materialized (the default window if it was never built)."""
+    state = session.get(SchedulerState, OBLIGATION_HORIZON_KEY)
+    if state:
+        return datetime.fromisoformat(state.value)
+    return (now or datetime.now()) + timedelta(days=OBLIGATION_HORIZON_DAYS)
+
+
+def regenerate_obligations(session: Session, loan_ids, now=None):
+    """
+    Rebuilds the calendar of the given loans (after they are created or edited) over
+    the current window, and the summary's due-soon counts with it. Instances that are
+    already past due (backdated loans, shortened deadlines) are alerted right away:
+    their due date is behind the obligation checker's watermark, so it never sees them.
+    Does not commit.
+    """
+    if not loan_ids:
+        return 0
+    now = now or datetime.now()
+    session.execute(delete(ObligationInstance).where(ObligationInstance.loan_id.in_(loan_ids)))
+    generated = materialize_obligations(
+        session, now - timedelta(days=OBLIGATION_HISTORY_DAYS), get_calendar_horizon(session, now), loan_ids
+    )
+
+    past_due = session.exec(
+        select(ObligationInstance.covenant_id, ObligationInstance.loan_id,
+               ObligationInstance.name, ObligationInstance.due_date)
+        .where(ObligationInstance.loan_id.in_(loan_ids))
+        .where(ObligationInstance.due_date <= now)
+    ).all()
+    # Deadlines alerted before (e.g. ahead of an edit) are skipped
+    record_alerts(session, insert_obligation_alerts(session, [
+        overdue_alert(loan_id, cov_id, cov_name, due_date, now) for cov_id, loan_id, cov_name, due_date in past_due
+    ]))
+
+    refresh_obligation_counts(session, now)
+    return generated
+
+
+def extend_obligation_calendar(now=None):
+    """
+    Daily job: materializes the instances that entered the window since the last run.
+    The first run (no stored horizon) builds the whole window.
+    """
+    now = now or datetime.now()
+    new_horizon = now + timedelta(days=OBLIGATION_HORIZON_DAYS)
+
+    with Session(engine) as session:
+        state = session.get(SchedulerState, OBLIGATION_HORIZON_KEY)
+        if state:
+            start = datetime.fromisoformat(state.value)
+            if new_horizon <= start:
+                return 0
+        else:
+            start = now - timedelta(days=OBLIGATION_HISTORY_DAYS)
+            state = SchedulerState(key=OBLIGATION_HORIZON_KEY, value="")
+
+        generated = materialize_obligations(session, start, new_horizon)
+
+        # The horizon (and the summary's due-soon counts) move in the same transaction as the instances
+        state.value = new_horizon.isoformat()
+        state.updated_at = now
+        session.add(state)
+        refresh_obligation_counts(session, now)
+        session.commit()
+
+    if generated:
+        print(f"📅 [CALENDAR] {generated} obligation instances materialized up to {new_horizon:%Y-%m-%d}.")
+    return generated
+
+
+def prune_obligation_instances(now=None, batch_size=None):
+    """
+    Deletes the instances that fell out of the back of the window (due more than
+    OBLIGATION_HISTORY_DAYS ago), in batches (one short transaction each, oldest first).
+    Instances the obligation checker has not passed yet are kept, so a long outage
+    doesn't drop deadlines before they are alerted. Returns the number of rows deleted.
+    """
+    now = now or datetime.now()
+    batch_size = batch_size or OBLIGATION_PRUNE_BATCH_SIZE
+    cutoff = now - timedelta(days=OBLIGATION_HISTORY_DAYS)
+    pruned = 0
+
+    while True:
+        with Session(engine) as session:
+            watermark = session.get(SchedulerState, OBLIGATION_WATERMARK_KEY)
+            if watermark:
+                cutoff = min(cutoff, datetime.fromisoformat(watermark.value))
+
+            # Range scan on the due_date index
+            ids = session.exec(
+                select(ObligationInstance.id)
+                .where(ObligationInstance.due_date < cutoff)
+                .order_by(ObligationInstance.due_date)
+                .limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            session.execute(delete(ObligationInstance).where(ObligationInstance.id.in_(ids)))
+            session.commit()
+
+        pruned += len(ids)
+        if len(ids) < batch_size:
+            break
+
+    if pruned:
+        print(f"🗑️  [CALENDAR] Pruned {pruned} obligation instances due before {cutoff:%Y-%m-%d}.")
+    return pruned
+
+
+def maintain_obligation_calendar(now=None):
+    """Daily job (and migration step): extends the calendar's horizon, then prunes its history."""
+    now = now or datetime.now()
+    return extend_obligation_calendar(now) + prune_obligation_instances(now)
+
+
+def parse_obligation_cursor(cursor):
+    """ "<due_date ISO>,<id>" (the X-Next-Cursor of the previous page) -> (datetime, id)."""
+    due_date, _, instance_id = cursor.rpartition(",")
+    return datetime.fromisoformat(due_date), int(instance_id)
+
+
+def build_obligation_query(start, end, loan_id=None, cursor=None, limit=None):
+    """
+    Instances due in [start, end), with the borrower name, ordered by (due_date, id).
+    `cursor` is the (due_date, id) of the previous page's last row (keyset pagination).
+    """
+    stmt = (
+        select(ObligationInstance, Loan.borrower_name)
+        .join(Loan, Loan.id == ObligationInstance.loan_id)
+        .where(ObligationInstance.due_date >= start)
+        .where(ObligationInstance.due_date < end)
+        .order_by(ObligationInstance.due_date, ObligationInstance.id)
+    )
+    if loan_id is not None:
+        stmt = stmt.where(ObligationInstance.loan_id == loan_id)
+    if cursor is not None:
+        due_date, instance_id = cursor
+        stmt = stmt.where(
+            tuple_(ObligationInstance.due_date, ObligationInstance.id)
+            > tuple_(literal(due_date, DateTime), literal(instance_id))
+        )
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def obligation_to_dict(instance, borrower_name):
+    return {
+        "id": instance.id,
+        "loan_id": instance.loan_id,
+        "borrower_name": borrower_name,
+        "covenant_id": instance.covenant_id,
+        "name": instance.name,
+        "period_end": instance.period_end.isoformat(),
+        "due_date": instance.due_date.isoformat(),
+    }
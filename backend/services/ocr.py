@@ -1,5 +1,30 @@
 import fitz  # PyMuPDF
+import multiprocessing
+import os
 import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from services.telemetry import record_extraction
+
+# Size of the extraction process pool (1 = serial), shared by every job in this process.
+# Short documents always run serially: shipping the batches costs more than it saves.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PARALLEL_MIN_PAGES = int(os.getenv("OCR_PARALLEL_MIN_PAGES", "32"))
+OCR_MAX_BATCH_PAGES = 16
+OCR_OPEN_DOCUMENTS = 4  # Documents each worker keeps open (one per concurrent extraction)
+
+# The server is multi-threaded (scheduler, job pool, profiler): a forked child could
+# inherit a lock held by one of those threads and deadlock. Workers are started from a
+# clean forkserver process instead.
+_pool = None
+_pool_lock = threading.Lock()
+
+# Worker side: documents opened by earlier batches of the same extraction, by key
+_worker_docs = OrderedDict()
 
 def clean_text(text):
     """
@@ -19,26 +44,136 @@ def clean_text(text):
     # 3. Strip leading/trailing whitespace
     return text.strip()
 
-def extract_text_from_pdf(file_bytes):
+def _open_document(source):
+    """Opens a PDF from raw bytes or from a file path."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def _extract_page(doc, page_num):
+    # "flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE" 
+    # helps keep the text readable for the AI.
+    # Using "get_text('blocks')" often yields cleaner paragraphs than simple "get_text()".
+    page_text = doc[page_num].get_text()
+    if page_text.strip():
+        return clean_text(page_text)
+    return None
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _worker_document(key, source):
+    """Runs in a worker: the document of extraction `key`, opened on its first batch."""
+    doc = _worker_docs.get(key)
+    if doc is None:
+        doc = _worker_docs[key] = _open_document(source)
+        while len(_worker_docs) > OCR_OPEN_DOCUMENTS:
+            _worker_docs.popitem(last=False)[1].close()
+    _worker_docs.move_to_end(key)
+    return doc
+
+def _extract_batch(key, source, start, stop):
+    """Runs in a worker: extracts pages [start, stop)."""
+    doc = _worker_document(key, source)
+    pages = []
+    for page_num in range(start, stop):
+        text = _extract_page(doc, page_num)
+        if text:
+            pages.append((page_num + 1, text))
+    return pages
+
+def iter_pdf_pages(source, workers=None):
+    """
+    Yields (page_number, cleaned_text) for every non-empty page, in page order.
+    `source` is the PDF as bytes or a file path. With workers > 1, page batches
+    are extracted in a process pool and yielded as soon as the next batch in
+    order is ready, so consumers can start before the whole document is done.
+    """
+    # Extraction time only: the consumer's work between pages is not counted
+    busy, pages = 0.0, 0
+    size_bytes = len(source) if isinstance(source, (bytes, bytearray, memoryview)) else os.path.getsize(source)
+    extracted = _extract_pages(source, workers)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                page = next(extracted)
+            except StopIteration:
+                return
+            finally:
+                busy += time.perf_counter() - started
+            pages += 1
+            yield page
+    finally:
+        extracted.close()
+        record_extraction(pages, busy, size_bytes)
+
+def _extract_pages(source, workers=None):
+    workers = OCR_WORKERS if workers is None else workers
+
+    with _open_document(source) as doc:
+        page_count = doc.page_count
+
+        if workers <= 1 or page_count < OCR_PARALLEL_MIN_PAGES:
+            for page_num in range(page_count):
+                text = _extract_page(doc, page_num)
+                if text:
+                    yield page_num + 1, text
+            return
+
+    # Small batches keep the pool balanced and let the first pages stream out early
+    workers = min(workers, OCR_WORKERS, page_count)
+    batch_size = max(1, min(OCR_MAX_BATCH_PAGES, page_count // (workers * 4)))
+
+    # Bytes would be pickled into every batch: write them out once and send the path
+    spooled = None
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        fd, spooled = tempfile.mkstemp(suffix=".pdf")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        source = spooled
+
+    key = uuid.uuid4().hex
+    futures = []
+    try:
+        futures = [
+            _get_pool().submit(_extract_batch, key, source, start, min(start + batch_size, page_count))
+            for start in range(0, page_count, batch_size)
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()  # Consumer stopped early: drop the batches not started yet
+        if spooled:
+            # Batches still running keep their open handle (POSIX); just don't start new ones
+            os.remove(spooled)
+
+def extract_text_from_pdf(file_bytes, workers=None):
     """
-    Robustly extracts text from a PDF file stream.
+    Robustly extracts text from a PDF file stream (bytes or a file path).
+    Thin wrapper over iter_pdf_pages that joins the pages with "--- Page N ---" markers.
     """
     try:
-        doc = fitz.open(stream=file_bytes, filetype="pdf")
-        full_text = []
-
-        for page_num, page in enumerate(doc):
-            # "flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE" 
-            # helps keep the text readable for the AI.
-            # Using "get_text('blocks')" often yields cleaner paragraphs than simple "get_text()".
-            page_text = page.get_text() 
-            
-            if page_text.strip():
-                cleaned_page_text = clean_text(page_text)
-                full_text.append(f"--- Page {page_num + 1} ---\n{cleaned_page_text}")
-        
+        full_text = [
+            f"--- Page {page_num} ---\n{page_text}"
+            for page_num, page_text in iter_pdf_pages(file_bytes, workers)
+        ]
         return "\n\n".join(full_text)
     
     except Exception as e:
         print(f"❌ PDF Extraction Error: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,225 @@
+import re
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from sqlalchemy import delete, func, text
+from sqlmodel import Session, select
+from models import Loan, Alert, Covenant, ObligationInstance, PortfolioStat
+
+# --- PORTFOLIO SUMMARY ---
+# The dashboard numbers live in the small `PortfolioStat` table. Every writer that
+# changes them (new loans, reviews, scheduler transitions, alerts) applies a delta
+# in its own transaction, so reading the summary never touches the loan table.
+
+LOAN_BUCKET = "loans"
+ALERT_BUCKET = "alerts"
+COVENANT_BUCKET = "covenants"
+OBLIGATION_BUCKET = "obligations"
+
+UNKNOWN_CURRENCY = "XXX"  # ISO 4217 "no currency", for amounts we can't parse
+CURRENCY_SYMBOLS = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR"}
+AMOUNT_MULTIPLIERS = {"k": 1e3, "m": 1e6, "mn": 1e6, "million": 1e6, "bn": 1e9, "b": 1e9, "billion": 1e9}
+
+# Obligation windows are time-based, so they are recounted (an indexed range count)
+# by the obligation checker instead of being maintained as deltas.
+DUE_WINDOWS = {"due_7_days": 7, "due_30_days": 30}
+
+_CURRENCY_CODE = re.compile(r"\b([A-Z]{3})\b")
+_AMOUNT = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*([a-z]*)")
+
+_UPSERT = text(
+    "INSERT INTO portfoliostat (bucket, key, currency, count, exposure, updated_at) "
+    "VALUES (:bucket, :key, :currency, :count, :exposure, :updated_at) "
+    "ON CONFLICT (bucket, key, currency) DO UPDATE SET "
+    "count = portfoliostat.count + excluded.count, "
+    "exposure = portfoliostat.exposure + excluded.exposure, "
+    "updated_at = excluded.updated_at"
+)
+
+
+def parse_loan_amount(raw):
+    """
+    Splits a loan amount string into (currency, value).
+    - "USD 250,000,000" -> ("USD", 250000000.0)
+    - "$15M"            -> ("USD", 15000000.0)
+    - "N/A"             -> ("XXX", 0.0)
+    """
+    if raw is None:
+        return UNKNOWN_CURRENCY, 0.0
+    return _parse_amount_text(str(raw).strip())
+
+
+@lru_cache(maxsize=4096)
+def _parse_amount_text(text):
+    code = _CURRENCY_CODE.search(text)
+    if code:
+        currency = code.group(1)
+    else:
+        currency = next((iso for symbol, iso in CURRENCY_SYMBOLS.items() if symbol in text), UNKNOWN_CURRENCY)
+
+    match = _AMOUNT.search(text.lower())
+    if not match:
+        return UNKNOWN_CURRENCY, 0.0
+    value = float(match.group(1).replace(",", ""))
+    return currency, value * AMOUNT_MULTIPLIERS.get(match.group(2), 1)
+
+
+def apply_deltas(session: Session, deltas):
+    """
+    Adds {(bucket, key, currency): (count, exposure)} to the summary rows with one
+    UPSERT executemany. Does not commit - runs inside the caller's transaction.
+    """
+    now = datetime.now()
+    rows = [
+        {"bucket": bucket, "key": key, "currency": currency,
+         "count": count, "exposure": exposure, "updated_at": now}
+        for (bucket, key, currency), (count, exposure) in deltas.items()
+        if count or exposure
+    ]
+    if rows:
+        session.execute(_UPSERT, rows)
+
+
+def record_new_loans(session: Session, loans, covenant_count=0):
+    """`loans`: iterable of (risk_status, loan_amount) for freshly inserted loans."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for status, amount in loans:
+        currency, value = parse_loan_amount(amount)
+        delta = deltas[(LOAN_BUCKET, status, currency)]
+        delta[0] += 1
+        delta[1] += value
+    if covenant_count:
+        deltas[(COVENANT_BUCKET, "monitored", "")][0] += covenant_count
+    apply_deltas(session, deltas)
+
+
+def record_status_changes(session: Session, changes):
+    """`changes`: iterable of (old_status, new_status, loan_amount)."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for old_status, new_status, amount in changes:
+        if old_status == new_status:
+            continue
+        currency, value = parse_loan_amount(amount)
+        before = deltas[(LOAN_BUCKET, old_status, currency)]
+        before[0] -= 1
+        before[1] -= value
+        after = deltas[(LOAN_BUCKET, new_status, currency)]
+        after[0] += 1
+        after[1] += value
+    apply_deltas(session, deltas)
+
+
+def record_loan_edit(session: Session, risk_status, old_amount, new_amount, covenant_delta=0):
+    """An edited loan: moves its exposure from the old amount to the new one."""
+    deltas = defaultdict(lambda: [0, 0.0])
+    for sign, amount in ((-1, old_amount), (1, new_amount)):
+        currency, value = parse_loan_amount(amount)
+        delta = deltas[(LOAN_BUCKET, risk_status, currency)]
+        delta[0] += sign
+        delta[1] += sign * value
+    if covenant_delta:
+        deltas[(COVENANT_BUCKET, "monitored", "")][0] += covenant_delta
+    apply_deltas(session, deltas)
+
+
+def record_alerts(session: Session, alert_types, sign=1):
+    """
+    Counts unresolved alerts by type: sign=1 for new alerts, -1 for resolved ones.
+    `alert_types` is an iterable of types, or a {type: count} mapping.
+    """
+    counts = Counter(alert_types)
+    apply_deltas(session, {
+        (ALERT_BUCKET, alert_type, ""): (sign * count, 0.0) for alert_type, count in counts.items()
+    })
+
+
+def refresh_obligation_counts(session: Session, now=None):
+    """Recounts obligation instances due in the next 7/30 days (index range scans on the calendar)."""
+    now = now or datetime.now()
+    for key, days in DUE_WINDOWS.items():
+        count = session.exec(
+            select(func.count())
+            .select_from(ObligationInstance)
+            .where(ObligationInstance.due_date > now)
+            .where(ObligationInstance.due_date <= now + timedelta(days=days))
+        ).one()
+        stat = session.get(PortfolioStat, (OBLIGATION_BUCKET, key, "")) or PortfolioStat(
+            bucket=OBLIGATION_BUCKET, key=key, currency=""
+        )
+        stat.count = count
+        stat.updated_at = now
+        session.add(stat)
+
+
+def rebuild_portfolio_summary(session: Session):
+    """
+    Recomputes every summary row from scratch (migration, or after bulk deletes
+    like the seeder). Does not commit.
+    """
+    session.execute(delete(PortfolioStat))
+
+    # Amount strings repeat across the portfolio, so group on them before parsing
+    loans = session.exec(
+        select(Loan.risk_status, Loan.loan_amount, func.count()).group_by(Loan.risk_status, Loan.loan_amount)
+    ).all()
+    deltas = defaultdict(lambda: [0, 0.0])
+    for status, amount, count in loans:
+        currency, value = parse_loan_amount(amount)
+        delta = deltas[(LOAN_BUCKET, status, currency)]
+        delta[0] += count
+        delta[1] += value * count
+
+    alerts = session.exec(
+        select(Alert.type, func.count()).where(Alert.is_resolved == False).group_by(Alert.type)
+    ).all()
+    for alert_type, count in alerts:
+        deltas[(ALERT_BUCKET, alert_type, "")][0] += count
+
+    deltas[(COVENANT_BUCKET, "monitored", "")][0] += session.exec(
+        select(func.count()).select_from(Covenant)
+    ).one()
+
+    apply_deltas(session, deltas)
+    refresh_obligation_counts(session)
+
+
+def ensure_portfolio_summary(session: Session):
+    """Builds the summary once for databases created before the table existed."""
+    if session.exec(select(PortfolioStat).limit(1)).first() is None:
+        rebuild_portfolio_summary(session)
+        session.commit()
+        print("🔧 [MIGRATE] Built portfolio summary.")
+
+
+def get_portfolio_summary(session: Session):
+    """Reads the (small) summary table into the GET /api/portfolio/summary payload."""
+    summary = {
+        "loans": {"total": 0, "by_status": {}},
+        "alerts": {"unresolved": 0, "by_type": {}},
+        "covenants": {"monitored": 0},
+        "obligations": {key: 0 for key in DUE_WINDOWS},
+        "updated_at": None,
+    }
+
+    for stat in session.exec(select(PortfolioStat)).all():
+        if stat.bucket == LOAN_BUCKET:
+            if stat.count == 0:
+                continue
+            status = summary["loans"]["by_status"].setdefault(stat.key, {"count": 0, "exposure": {}})
+            status["count"] += stat.count
+            status["exposure"][stat.currency] = stat.exposure
+            summary["loans"]["total"] += stat.count
+        elif stat.bucket == ALERT_BUCKET:
+            if stat.count == 0:
+                continue
+            summary["alerts"]["by_type"][stat.key] = stat.count
+            summary["alerts"]["unresolved"] += stat.count
+        elif stat.bucket == COVENANT_BUCKET:
+            summary["covenants"][stat.key] = stat.count
+        elif stat.bucket == OBLIGATION_BUCKET:
+            summary["obligations"][stat.key] = stat.count
+
+        if summary["updated_at"] is None or stat.updated_at.isoformat() > summary["updated_at"]:
+            summary["updated_at"] = stat.updated_at.isoformat()
+
+    return summary
@@ -0,0 +1,186 @@
+import math
+import os
+import re
+from collections import Counter
+
+# --- RELEVANCE PRE-FILTER ---
+# Most pages of a loan agreement are definitions, boilerplate and signature blocks.
+# Before anything goes to the LLM, every page is scored for covenant relevance
+# (BM25 over a fixed covenant vocabulary + a few regex patterns) and only the best
+# pages, page 1 (parties, amount, date) and their neighbours are kept. Pages that name
+# a covenant metric or state a threshold are kept whatever their rank (recall floor).
+
+RELEVANCE_FILTER = os.getenv("RELEVANCE_FILTER", "1") not in ("0", "false", "off")
+RELEVANCE_TOP_FRACTION = float(os.getenv("RELEVANCE_TOP_FRACTION", "0.3"))  # At most this share of pages is ranked in
+RELEVANCE_MIN_SCORE_RATIO = float(os.getenv("RELEVANCE_MIN_SCORE_RATIO", "0.2"))  # ...and only if score >= ratio * best
+RELEVANCE_MARGIN_PAGES = int(os.getenv("RELEVANCE_MARGIN_PAGES", "1"))  # Safety margin around selected pages
+RELEVANCE_MIN_PAGES = int(os.getenv("RELEVANCE_MIN_PAGES", "6"))  # Shorter documents are sent whole
+
+CHARS_PER_TOKEN = 4  # Same estimate as the chunker
+
+# Query terms. Multi-word terms are matched as phrases (consecutive tokens).
+COVENANT_TERMS = [
+    "covenant", "financial covenant", "ebitda", "leverage", "leverage ratio", "debt to ebitda",
+    "interest cover", "interest coverage", "debt service", "dscr", "fixed charge", "net worth",
+    "tangible net worth", "gearing", "current ratio", "liquidity", "capital expenditure", "capex",
+    "loan to value", "ltv", "ratio", "shall not exceed", "not less than", "minimum", "maximum",
+    "compliance certificate", "financial statements", "audited", "quarterly", "annual", "monthly",
+    "within", "days", "deliver", "test date", "relevant period", "borrower", "facility amount",
+    "commitment", "effective date",
+]
+
+# Threshold wording: "within 45 days", "3.5x" / "2 times" / "1.25:1", "<="
+DEADLINE_PATTERN = re.compile(r"\bwithin\s+\d+\s+(?:business\s+)?days\b", re.IGNORECASE)
+MULTIPLE_PATTERN = re.compile(r"\b\d+(?:\.\d+)?\s*(?:x|times|:\s*1(?:\.0+)?)\b", re.IGNORECASE)
+COMPARATOR_PATTERN = re.compile(r"(?:<=|>=|≤|≥)")
+
+# Strong structural signals, weighted on top of BM25 (counted once per match, saturating)
+PATTERN_BOOSTS = [
+    (DEADLINE_PATTERN, 2.0),
+    (MULTIPLE_PATTERN, 2.0),
+    (re.compile(r"\b\d+(?:\.\d+)?\s*(?:%|per\s*cent)", re.IGNORECASE), 0.5),
+    (COMPARATOR_PATTERN, 1.5),
+]
+
+# Recall floor: a page matching any of these is always kept, however it ranks. A missed
+# covenant costs far more than the tokens of a few extra pages.
+RECALL_PATTERNS = [
+    re.compile(
+        r"\b(?:financial\s+covenants?|ebitda|leverage\s+ratio|interest\s+cover(?:age)?|debt\s+service|dscr"
+        r"|fixed\s+charge|(?:tangible\s+)?net\s+worth|gearing|current\s+ratio|loan\s+to\s+value|ltv"
+        r"|capital\s+expenditure|capex|compliance\s+certificate)\b",
+        re.IGNORECASE,
+    ),
+    DEADLINE_PATTERN,
+    MULTIPLE_PATTERN,
+    COMPARATOR_PATTERN,
+]
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Part of the analysis fingerprint: changing the filter invalidates cached analyses
+RELEVANCE_SETTINGS = (
+    RELEVANCE_FILTER, RELEVANCE_TOP_FRACTION, RELEVANCE_MIN_SCORE_RATIO, RELEVANCE_MARGIN_PAGES, RELEVANCE_MIN_PAGES,
+    [pattern.pattern for pattern in RECALL_PATTERNS],
+)
+
+_PAGE_MARKER = re.compile(r"^--- Page \d+ ---$", re.MULTILINE)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def split_pages(text_content):
+    """Splits extract_text_from_pdf output at its "--- Page N ---" markers (markers kept)."""
+    starts = [m.start() for m in _PAGE_MARKER.finditer(text_content)]
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    pages = [text_content[a:b].strip() for a, b in zip(starts, starts[1:] + [len(text_content)])]
+    return [page for page in pages if page]
+
+
+def _tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+
+_QUERY = [tuple(_tokenize(term)) for term in COVENANT_TERMS]
+_QUERY_LENGTHS = sorted({len(term) for term in _QUERY})
+
+
+def _term_counts(tokens):
+    """Counts every query term (single words and phrases) in a token list."""
+    grams = Counter()
+    for n in _QUERY_LENGTHS:
+        grams.update(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return {term: grams[term] for term in _QUERY if grams[term]}
+
+
+def score_pages(pages):
+    """BM25 score of each page against the covenant vocabulary, plus pattern boosts."""
+    if not pages:
+        return []
+
+    tokenized = [_tokenize(page) for page in pages]
+    counts = [_term_counts(tokens) for tokens in tokenized]
+    lengths = [len(tokens) for tokens in tokenized]
+    avg_length = (sum(lengths) / len(lengths)) or 1
+
+    n = len(pages)
+    document_frequency = Counter(term for page_counts in counts for term in page_counts)
+    idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    scores = []
+    for page, page_counts, length in zip(pages, counts, lengths):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+        score = sum(idf[term] * tf * (BM25_K1 + 1) / (tf + norm) for term, tf in page_counts.items())
+        for pattern, weight in PATTERN_BOOSTS:
+            hits = len(pattern.findall(page))
+            score += weight * hits / (hits + 1)  # Diminishing returns per page
+        scores.append(score)
+    return scores
+
+
+def select_relevant_pages(pages, scores=None, top_fraction=None, min_score_ratio=None,
+                          margin_pages=None, min_pages=None):
+    """
+    Returns the sorted indexes of the pages to keep:
+    - every page for documents of at most `min_pages` pages
+    - otherwise page 1, every page matching RECALL_PATTERNS, the best pages (at most
+      `top_fraction` of them, each scoring at least `min_score_ratio` x the best score),
+      and `margin_pages` on either side of the matching and best pages
+    """
+    top_fraction = RELEVANCE_TOP_FRACTION if top_fraction is None else top_fraction
+    min_score_ratio = RELEVANCE_MIN_SCORE_RATIO if min_score_ratio is None else min_score_ratio
+    margin_pages = RELEVANCE_MARGIN_PAGES if margin_pages is None else margin_pages
+    min_pages = RELEVANCE_MIN_PAGES if min_pages is None else min_pages
+
+    n = len(pages)
+    if n <= min_pages:
+        return list(range(n))
+
+    scores = score_pages(pages) if scores is None else scores
+    best = max(scores)
+    if best <= 0:
+        return list(range(n))  # Nothing recognisable: don't guess, send everything
+
+    ranked = sorted(range(n), key=lambda i: scores[i], reverse=True)
+    limit = max(1, math.ceil(top_fraction * n))
+    selected = [i for i in ranked[:limit] if scores[i] >= min_score_ratio * best]
+    selected += [i for i in range(n) if any(pattern.search(pages[i]) for pattern in RECALL_PATTERNS)]
+
+    keep = {0}
+    for i in selected:
+        for j in range(i - margin_pages, i + margin_pages + 1):
+            if 0 <= j < n and scores[j] > 0:
+                keep.add(j)
+        keep.add(i)
+    return sorted(keep)
+
+
+def filter_relevant_text(text_content, enabled=None):
+    """
+    Drops low-relevance pages from page-tagged text.
+    Returns (filtered_text, report) where report counts pages, characters and
+    (estimated) tokens before and after.
+    """
+    enabled = RELEVANCE_FILTER if enabled is None else enabled
+    pages = split_pages(text_content)
+
+    if enabled and pages:
+        kept = [pages[i] for i in select_relevant_pages(pages)]
+    else:
+        kept = pages
+    filtered = "\n\n".join(kept)
+
+    chars_in, chars_out = len(text_content), len(filtered)
+    report = {
+        "pages_total": len(pages),
+        "pages_kept": len(kept),
+        "chars_in": chars_in,
+        "chars_out": chars_out,
+        "chars_saved": max(0, chars_in - chars_out),
+        "tokens_in": chars_in // CHARS_PER_TOKEN,
+        "tokens_out": chars_out // CHARS_PER_TOKEN,
+        "tokens_saved": max(0, chars_in - chars_out) // CHARS_PER_TOKEN,
+        "reduction": round(chars_in / chars_out, 2) if chars_out else None,
+    }
+    return filtered, report
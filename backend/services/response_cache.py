@@ -0,0 +1,115 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from fastapi import Request, Response
+from services.versions import get_table_versions
+
+# --- HTTP RESPONSE CACHE ---
+# Poll-heavy GET routes (dashboard, loan pages) declare which tables they read. Their
+# ETag is derived from the request and those tables' versions, so:
+# - a client sending a current If-None-Match gets a 304, without a query or serialization
+# - otherwise the serialized body is served from an in-process LRU while the versions hold
+# - any write to one of the tables changes the ETag, and the next request rebuilds it
+
+# --- CONFIGURATION ---
+RESPONSE_CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "32"))  # 0 = ETags/304s only, no body cache
+
+# Browsers keep the body but revalidate before every use (which is where the 304s come from)
+CACHE_HEADERS = {"Cache-Control": "no-cache"}
+
+
+class ResponseCache:
+    """LRU of serialized bodies, bounded by total size: key -> (etag, body, headers)."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = 0
+
+    def get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, etag, body, headers):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous[1])
+            self._entries[key] = (etag, body, headers)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self._size,
+                "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified,
+            }
+
+
+_cache = ResponseCache(int(RESPONSE_CACHE_MB * 1024 * 1024))
+
+
+def get_response_cache():
+    return _cache
+
+
+def _request_key(request: Request):
+    """Path + sorted query string, so parameter order doesn't split the cache."""
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+def _parse_if_none_match(if_none_match):
+    """If-None-Match can be "*" or a list of (possibly weak) ETags."""
+    if not if_none_match:
+        return set()
+    return {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+def cached_response(request: Request, tables, build, media_type="application/json"):
+    """
+    Serves a GET from the version-keyed cache. `build()` returns (body, headers) and
+    is only called on a miss; an exception from it (e.g. a 404) is not cached.
+    """
+    key = _request_key(request)
+    versions = get_table_versions(*tables)
+    digest = hashlib.blake2b(f"{key}|{versions}".encode(), digest_size=10).hexdigest()
+    etag = f'"{digest}"'
+
+    candidates = _parse_if_none_match(request.headers.get("if-none-match"))
+    if etag in candidates:
+        _cache.count_not_modified()
+        return Response(status_code=304, headers={"ETag": etag, **CACHE_HEADERS})
+
+    entry = _cache.get(key, etag)
+    if entry is None:
+        body, headers = build()
+        if isinstance(body, str):
+            body = body.encode()
+        _cache.put(key, etag, body, headers)
+    else:
+        _, body, headers = entry
+
+    # "*" matches any current representation, so only once build() has shown there is one
+    if "*" in candidates:
+        _cache.count_not_modified()
+        return Response(status_code=304, headers={"ETag": etag, **CACHE_HEADERS})
+    return Response(content=body, media_type=media_type, headers={**headers, "ETag": etag, **CACHE_HEADERS})
@@ -1,99 +1,292 @@
-import json
+import os
 import random
+import time
+from functools import partial
 from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import insert
 from sqlmodel import Session, select
-from database import engine
-from models import Loan, Alert
+from database import engine, begin_write
+from models import Loan, Alert, ObligationInstance, SchedulerState
+from services.portfolio import record_alerts, refresh_obligation_counts
+from services.alerts import insert_obligation_alerts, overdue_alert
+from services.loans import apply_status_transitions
+from services.obligations import OBLIGATION_WATERMARK_KEY
+from services.evaluation import evaluate_covenants
+from services.leases import run_exclusive
+from services.telemetry import record_scan
+from services.versions import bump_table_versions
 
-def run_portfolio_health_check():
+# "columnar" (default) scans the portfolio as NumPy arrays with set-based writes.
+# "loop" is the original row-by-row ORM scan, kept so results can be compared.
+SCAN_MODE = os.getenv("SCAN_MODE", "columnar")
+
+# Where risk status changes come from: "covenants" tests financial covenants against
+# reported metrics (services/evaluation.py); "simulation" is the original demo randomness.
+RISK_ENGINE = os.getenv("RISK_ENGINE", "covenants")
+
+# Demo probabilities shared by both scan modes
+DOWNGRADE_RATE = 0.02     # Healthy -> Watchlist
+CRITICAL_RATE = 0.05      # Watchlist -> Critical
+RECOVERY_RATE = 0.10      # Watchlist -> Healthy
+
+# On the very first incremental run there is no watermark yet: look back this far
+OBLIGATION_LOOKBACK_DAYS = int(os.getenv("OBLIGATION_LOOKBACK_DAYS", "7"))
+
+# The hourly scan can be split by loan id (shard i of N holds the loans with id % N == i).
+# Every shard is claimed through its own lease (services/leases.py) and commits on its
+# own, so several uvicorn workers (or dedicated scan processes) work through it in parallel.
+SCAN_SHARDS = int(os.getenv("SCAN_SHARDS", "1"))
+SCAN_INTERVAL_SECONDS = int(os.getenv("SCAN_INTERVAL_SECONDS", "3600"))
+
+def run_scheduled_health_check(interval_seconds=None, shards=None):
+    """
+    Scheduler entry point, ticking in every worker. Each shard runs at most once per
+    interval across all workers: a worker skips the shards another one already holds
+    (or finished less than half an interval ago). Workers start at different shards
+    (by pid) so the ones that tick together spread out. Returns the shards run here.
+    """
+    interval_seconds = interval_seconds or SCAN_INTERVAL_SECONDS
+    shards = shards or SCAN_SHARDS
+    first = os.getpid() % shards
+    ran = 0
+    for offset in range(shards):
+        index = (first + offset) % shards
+        result = run_exclusive(
+            f"portfolio_scan:{index}/{shards}",
+            partial(run_portfolio_health_check, check_obligations=False, shard=(index, shards)),
+            min_interval_seconds=interval_seconds / 2,
+        )
+        if result is not None:
+            ran += 1
+    return ran
+
+def run_portfolio_health_check(mode=None, seed=None, check_obligations=True, risk_engine=None, shard=None):
     """
     Runs periodically (e.g., Hourly).
-    1. Checks for overdue reporting obligations based on real dates.
-    2. Simulates credit risk migration (Downgrades/Upgrades/Recoveries).
+    1. Checks for overdue reporting obligations (run_obligation_check).
+    2. Moves loans between risk statuses: from covenant breaches and headroom
+       (risk_engine="covenants") or simulated credit migration ("simulation").
+
+    `mode` selects the simulation engine ("columnar" or "loop"), `seed` makes the
+    simulated transitions reproducible. Pass check_obligations=False when
+    run_obligation_check is scheduled on its own.
+    `shard` = (index, count) limits the scan to the loans with id % count == index.
     """
+    mode = mode or SCAN_MODE
+    risk_engine = risk_engine or RISK_ENGINE
+    if mode not in ("loop", "columnar"):
+        raise ValueError(f"Unknown scan mode: {mode}")
+    if risk_engine not in ("covenants", "simulation"):
+        raise ValueError(f"Unknown risk engine: {risk_engine}")
+
+    started = time.perf_counter()
     current_time = datetime.now().strftime('%H:%M:%S')
-    print(f"⏰ [CRON] Hourly Portfolio Scan started at {current_time}...")
-    
+    scope = f", shard {shard[0] + 1}/{shard[1]}" if shard else ""
+    print(f"⏰ [CRON] Hourly Portfolio Scan ({mode}, {risk_engine}{scope}) started at {current_time}...")
+
+    changes_count = 0
+    if check_obligations:
+        changes_count += run_obligation_check()
+    if risk_engine == "simulation":
+        scan = _scan_loop if mode == "loop" else _scan_columnar
+        changes_count += scan(seed, shard)
+    if risk_engine == "covenants":
+        result = evaluate_covenants(shard=shard)
+        changes_count += sum(result["transitions"].values()) + result["alerts"]
+    record_scan("portfolio_scan", time.perf_counter() - started)
+
+    if changes_count > 0:
+        print(f"✅ [CRON] Scan Complete. {changes_count} updates applied.")
+    else:
+        print("✅ [CRON] Scan Complete. Portfolio Stable.")
+    return changes_count
+
+def run_obligation_check(now=None):
+    """
+    Incremental deadline checker (cheap enough to run every minute).
+    Only touches obligation instances (services/obligations.py) whose due date fell
+    between the last watermark and now (an index range scan), so cost grows with
+    deadlines crossed, not with portfolio size. The new watermark is committed
+    together with the alerts.
+    """
+    now = now or datetime.now()
+    started = time.perf_counter()
+
+    with Session(engine) as session:
+        state = session.get(SchedulerState, OBLIGATION_WATERMARK_KEY)
+        if state:
+            watermark = datetime.fromisoformat(state.value)
+        else:
+            watermark = now - timedelta(days=OBLIGATION_LOOKBACK_DAYS)
+
+        crossed = session.exec(
+            select(ObligationInstance.covenant_id, ObligationInstance.loan_id,
+                   ObligationInstance.name, ObligationInstance.due_date)
+            .where(ObligationInstance.due_date > watermark)
+            .where(ObligationInstance.due_date <= now)
+        ).all()
+
+        alert_rows = []
+        for cov_id, loan_id, cov_name, due_date in crossed:
+            alert_rows.append(overdue_alert(loan_id, cov_id, cov_name, due_date, now))
+        inserted = insert_obligation_alerts(session, alert_rows)
+        record_alerts(session, inserted)
+
+        # Deadlines move into (and out of) the 7/30-day windows as time passes
+        refresh_obligation_counts(session, now)
+
+        # Advance the watermark in the same transaction as the alerts
+        if state is None:
+            state = SchedulerState(key=OBLIGATION_WATERMARK_KEY, value="")
+        state.value = now.isoformat()
+        state.updated_at = now
+        session.add(state)
+        session.commit()
+
+    new_alerts = sum(inserted.values())
+    record_scan("obligation_check", time.perf_counter() - started, alerts=new_alerts)
+    if new_alerts:
+        print(f"⚠️  [CRON] {new_alerts} reporting obligations became overdue since {watermark:%Y-%m-%d %H:%M}.")
+    return new_alerts
+
+# --- HELPERS ---
+
+def _in_shard(stmt, column, shard):
+    """Restricts a select to shard (index, count) of the loan id space (no-op for None)."""
+    if not shard:
+        return stmt
+    index, count = shard
+    return stmt.where(column % count == index)
+
+# --- SCAN ENGINE 1: ROW-BY-ROW (ORIGINAL) ---
+
+def _scan_loop(seed=None, shard=None):
+    rng = random.Random(seed)
+
     with Session(engine) as session:
-        loans = session.exec(select(Loan)).all()
-        changes_count = 0
-        
+        loans = session.exec(_in_shard(select(Loan), Loan.id, shard)).all()
+        transitions = []  # (loan_id, old, new), applied set-based after the loop
+        transition_alerts = {}  # loan_id -> Alert, raised only if its transition applies
+
         for loan in loans:
-            # --- 1. OBLIGATION CHECKER (Deadlines) ---
-            try:
-                covenants = json.loads(loan.covenants_json)
-                for cov in covenants:
-                    # Look for reporting items like "Quarterly Reporting <= 45 days"
-                    if "reporting" in cov["name"].lower() and "days" in cov["threshold"]:
-                        try:
-                            # Extract number (e.g. "45")
-                            days_limit = int(''.join(filter(str.isdigit, cov["threshold"])))
-                            
-                            # Logic: If Effective Date + Days Limit < Today, it's OVERDUE.
-                            # (In a real app, you'd track the specific 'Quarter End Date' instead of Effective Date)
-                            eff_date = datetime.strptime(loan.effective_date, "%Y-%m-%d")
-                            # Simulating that the report was due X days after the loan started
-                            due_date = eff_date + timedelta(days=days_limit)
-                            
-                            # If Today is past Due Date AND we haven't flagged it yet
-                            if datetime.now() > due_date and loan.risk_status == "Healthy":
-                                # 10% chance to flag it for the demo
-                                if random.random() < 0.1: 
-                                    print(f"⚠️  COMPLIANCE ALERT: {loan.borrower_name} is overdue on {cov['name']}.")
-                                    
-                                    alert = Alert(
-                                        loan_id=loan.id, 
-                                        message=f"Overdue: {cov['name']} was due on {due_date.strftime('%Y-%m-%d')}.",
-                                        type="warning"
-                                    )
-                                    session.add(alert)
-                                    changes_count += 1
-                        except:
-                            continue
-            except:
-                pass
-
-            # --- 2. RISK SIMULATION ENGINE (Market Movements) ---
-            
+            # --- RISK SIMULATION ENGINE (Market Movements) ---
             # Scenario A: Healthy Loan Deteriorates (2% chance per run)
             if loan.risk_status == "Healthy":
-                if random.random() < 0.02: 
+                if rng.random() < DOWNGRADE_RATE:
                     print(f"📉 DOWNGRADE: {loan.borrower_name} moved to Watchlist.")
-                    loan.risk_status = "Watchlist"
-                    alert = Alert(
-                        loan_id=loan.id, 
+                    transitions.append((loan.id, loan.risk_status, "Watchlist"))
+                    transition_alerts[loan.id] = Alert(
+                        loan_id=loan.id,
                         message=f"AI Risk Model: Early warning signals detected in sector.",
                         type="warning"
                     )
-                    session.add(alert)
-                    session.add(loan)
-                    changes_count += 1
 
             # Scenario B: Watchlist Loan Worsens to Critical (5% chance)
             elif loan.risk_status == "Watchlist":
-                if random.random() < 0.05:
+                if rng.random() < CRITICAL_RATE:
                     print(f"🚨 CRITICAL: {loan.borrower_name} breached financial covenants.")
-                    loan.risk_status = "Critical"
-                    alert = Alert(
-                        loan_id=loan.id, 
+                    transitions.append((loan.id, loan.risk_status, "Critical"))
+                    transition_alerts[loan.id] = Alert(
+                        loan_id=loan.id,
                         message=f"Breach Confirmed: Leverage Ratio exceeds limit.",
                         type="critical"
                     )
-                    session.add(alert)
-                    session.add(loan)
-                    changes_count += 1
-                
+
                 # Scenario C: Watchlist Loan Recovers (10% chance - Correction)
-                elif random.random() < 0.10:
+                elif rng.random() < RECOVERY_RATE:
                     print(f"✅ RECOVERY: {loan.borrower_name} stabilized.")
-                    loan.risk_status = "Healthy"
+                    transitions.append((loan.id, loan.risk_status, "Healthy"))
                     # Ideally, resolve old alerts here too
-                    session.add(loan)
-                    changes_count += 1
 
+        begin_write(session)
+        # Loans whose status changed since they were loaded (e.g. a review) are skipped, with their alerts
+        moved = apply_status_transitions(session, transitions)
+        alert_types = []
+        for loan_id, alert in transition_alerts.items():
+            if loan_id in moved:
+                session.add(alert)
+                alert_types.append(alert.type)
+        record_alerts(session, alert_types)
+        if alert_types:
+            bump_table_versions(session, "alert")
         session.commit()
-    
-    if changes_count > 0:
-        print(f"✅ [CRON] Scan Complete. {changes_count} updates applied.")
-    else:
-        print("✅ [CRON] Scan Complete. Portfolio Stable.")
\ No newline at end of file
+
+    record_scan("portfolio_scan", loans=len(loans), alerts=len(alert_types))
+
+    return len(moved)
+
+# --- SCAN ENGINE 2: COLUMNAR (NUMPY) ---
+
+def _scan_columnar(seed=None, shard=None):
+    """
+    Same rules as _scan_loop, but evaluated on whole columns at once:
+    - loan statuses are loaded into NumPy arrays
+    - transition masks are drawn in bulk
+    - status changes are applied with one UPDATE per target status
+    - alerts are written with a single executemany
+    """
+    rng = np.random.default_rng(seed)
+    now = datetime.now()
+
+    with Session(engine) as session:
+        # 1. LOAD COLUMNS
+        loan_rows = session.exec(_in_shard(
+            select(Loan.id, Loan.risk_status).order_by(Loan.id), Loan.id, shard
+        )).all()
+        if not loan_rows:
+            return 0
+
+        raw_ids, raw_statuses = zip(*loan_rows)
+        loan_ids = np.array(raw_ids, dtype=np.int64)
+        statuses = np.array(raw_statuses)
+
+        # 2. RISK SIMULATION ENGINE (Market Movements)
+        healthy = statuses == "Healthy"
+        watchlist = statuses == "Watchlist"
+
+        downgrade = healthy & (rng.random(len(loan_ids)) < DOWNGRADE_RATE)
+        critical = watchlist & (rng.random(len(loan_ids)) < CRITICAL_RATE)
+        recover = watchlist & ~critical & (rng.random(len(loan_ids)) < RECOVERY_RATE)
+
+        transitions = []
+        for mask, new_status in ((downgrade, "Watchlist"), (critical, "Critical"), (recover, "Healthy")):
+            transitions.extend(zip(loan_ids[mask].tolist(), statuses[mask].tolist(), [new_status] * int(mask.sum())))
+
+        # 3. APPLY (one short write transaction)
+        begin_write(session)
+        # Loans whose status changed since step 1 (e.g. a review) are skipped, with their alerts
+        moved = apply_status_transitions(session, transitions)
+        alert_rows = []
+        for loan_id in loan_ids[downgrade]:
+            if int(loan_id) in moved:
+                alert_rows.append({
+                    "loan_id": int(loan_id),
+                    "message": "AI Risk Model: Early warning signals detected in sector.",
+                    "type": "warning",
+                    "timestamp": now,
+                    "is_resolved": False,
+                })
+        for loan_id in loan_ids[critical]:
+            if int(loan_id) in moved:
+                alert_rows.append({
+                    "loan_id": int(loan_id),
+                    "message": "Breach Confirmed: Leverage Ratio exceeds limit.",
+                    "type": "critical",
+                    "timestamp": now,
+                    "is_resolved": False,
+                })
+        if alert_rows:
+            session.execute(insert(Alert), alert_rows)
+            bump_table_versions(session, "alert")
+            record_alerts(session, [row["type"] for row in alert_rows])
+        session.commit()
+
+    record_scan("portfolio_scan", loans=len(loan_ids), alerts=len(alert_rows))
+
+    moved_mask = np.isin(loan_ids, list(moved))
+    print(
+        f"   - {int((downgrade & moved_mask).sum())} downgrades, {int((critical & moved_mask).sum())} critical, "
+        f"{int((recover & moved_mask).sum())} recoveries across {len(loan_ids)} loans."
+    )
+    return len(moved)
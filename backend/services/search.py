@@ -0,0 +1,203 @@
+import json
+import os
+import re
+from sqlalchemy import bindparam, text
+from sqlmodel import Session
+from models import AnalysisJob, AgreementText
+
+# --- SEARCH ---
+# Three FTS5 indexes (created in database.py): borrower names, covenant names/metrics and
+# agreement text. Each is queried for its best matches by bm25 rank, and the hits are
+# merged per loan. Covenant names are indexed once per distinct name: a matching name
+# is turned into covenants with a range scan on ix_covenant_name_threshold, which also
+# applies the numeric threshold filters ("DSCR below 1.2x" = covenant=dscr&threshold_lt=1.2).
+
+# --- CONFIGURATION ---
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "1000"))  # Best hits taken from each index
+SEARCH_MAX_LIMIT = 100
+COVENANT_NAME_MATCHES = 50  # Distinct covenant names a query can expand to
+
+THRESHOLD_FILTERS = {"threshold_lt": "<", "threshold_lte": "<=", "threshold_gt": ">", "threshold_gte": ">="}
+
+
+def build_match_query(query):
+    """
+    User text -> FTS5 MATCH expression. Every term must match; a trailing * makes a
+    term a prefix query ("acm*"). Terms are quoted, so punctuation and FTS operators
+    in the input can't break the syntax ("Debt-to-EBITDA" is the phrase "debt to ebitda").
+    """
+    terms = []
+    for raw in query.split():
+        tokens = re.findall(r"\w+", raw)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"' + ("*" if raw.endswith("*") else ""))
+    return " ".join(terms)
+
+
+def _add_hit(loans, loan_id, score, match):
+    """Keeps each loan's best (lowest) bm25 score and up to 5 of its matches."""
+    entry = loans.setdefault(loan_id, {"score": score, "matches": []})
+    entry["score"] = min(entry["score"], score)
+    if len(entry["matches"]) < 5:
+        entry["matches"].append(match)
+
+
+def _match_covenant_names(session, match):
+    """Covenant names matching a MATCH expression -> {name: bm25}, best first."""
+    return dict(session.execute(text(
+        "SELECT covenantname.name, bm25(covenant_fts) FROM covenant_fts "
+        "JOIN covenantname ON covenantname.id = covenant_fts.rowid "
+        "WHERE covenant_fts MATCH :match ORDER BY rank LIMIT :n"
+    ), {"match": match, "n": COVENANT_NAME_MATCHES}).all())
+
+
+def _covenant_hits(session, names, filters, kind, risk_status, loan_ids, candidates):
+    """
+    Covenants with one of `names` ({name: bm25}; any name if None) that pass the threshold
+    filters, kind and loan status, optionally only on `loan_ids` -> {loan_id: {...}}.
+    Names are taken best first until `candidates` covenants are found.
+    """
+    conditions, params = [], {}
+    if filters:
+        conditions.append("covenant.threshold IS NOT NULL")
+    for name, value in filters.items():
+        conditions.append(f"covenant.threshold {THRESHOLD_FILTERS[name]} :{name}")
+        params[name] = value
+    if kind:
+        conditions.append("covenant.kind = :kind")
+        params["kind"] = kind
+    if risk_status:
+        conditions.append("loan.risk_status = :risk_status")
+        params["risk_status"] = risk_status
+    if loan_ids is not None:
+        # One JSON parameter rather than a bound parameter per id
+        conditions.append("covenant.loan_id IN (SELECT value FROM json_each(:loan_ids))")
+        params["loan_ids"] = json.dumps(list(loan_ids))
+    if names is not None:
+        # With loan_ids, look covenants up by loan: the unary + keeps SQLite (which has no
+        # ANALYZE statistics) from scanning a whole name's range in the name index instead
+        conditions.append("+covenant.name = :name" if loan_ids is not None else "covenant.name = :name")
+
+    statement = text(
+        "SELECT covenant.loan_id, covenant.id, covenant.name, covenant.raw_threshold FROM covenant "
+        + ("JOIN loan ON loan.id = covenant.loan_id " if risk_status else "")
+        + f"WHERE {' AND '.join(conditions or ['1'])} LIMIT :n"
+    )
+
+    loans, found = {}, 0
+    # Filters only (no name): a range scan on the threshold index, unranked
+    for name, score in (names.items() if names is not None else [(None, 0.0)]):
+        rows = session.execute(statement, {**params, "name": name, "n": candidates - found}).all()
+        for loan_id, covenant_id, covenant_name, raw_threshold in rows:
+            _add_hit(loans, loan_id, score, {
+                "field": "covenant", "covenant_id": covenant_id, "name": covenant_name, "threshold": raw_threshold,
+            })
+        found += len(rows)
+        if found >= candidates:
+            break
+    return loans
+
+
+def _search_text(session, match, risk_status, candidates):
+    """Borrower, covenant and agreement hits for a MATCH expression -> {loan_id: {...}}."""
+    status = " AND loan.risk_status = :risk_status" if risk_status else ""
+    params = {"match": match, "risk_status": risk_status, "n": candidates}
+    loans = {}
+    for loan_id, score in session.execute(text(
+        "SELECT loan_fts.rowid, bm25(loan_fts) FROM loan_fts JOIN loan ON loan.id = loan_fts.rowid "
+        f"WHERE loan_fts MATCH :match{status} ORDER BY rank LIMIT :n"
+    ), params):
+        _add_hit(loans, loan_id, score, {"field": "borrower_name"})
+
+    names = _match_covenant_names(session, match)
+    if names:
+        for loan_id, entry in _covenant_hits(session, names, {}, None, risk_status, None, candidates).items():
+            for hit in entry["matches"]:
+                _add_hit(loans, loan_id, entry["score"], hit)
+
+    for loan_id, score, snippet in session.execute(text(
+        "SELECT agreement_fts.rowid, bm25(agreement_fts), snippet(agreement_fts, 0, '[', ']', '…', 12) "
+        "FROM agreement_fts JOIN loan ON loan.id = agreement_fts.rowid "
+        f"WHERE agreement_fts MATCH :match{status} ORDER BY rank LIMIT :n"
+    ), params):
+        _add_hit(loans, loan_id, score, {"field": "agreement", "snippet": snippet})
+    return loans
+
+
+def search_loans(session: Session, q=None, covenant=None, filters=None, kind=None, risk_status=None,
+                 limit=20, candidates=None):
+    """
+    Ranked loan search.
+    - q: free text over borrower names, covenant names and agreement text
+    - covenant (+ threshold filters / kind): loans with a matching covenant
+    Both given: loans matching both. Raises ValueError when there is nothing to search.
+    Returns [{loan_id, borrower_name, risk_status, loan_amount, score, matches}], best first.
+    """
+    filters = {name: value for name, value in (filters or {}).items() if value is not None}
+    candidates = candidates or SEARCH_CANDIDATES
+    text_match = build_match_query(q) if q else None
+    covenant_match = build_match_query(covenant) if covenant else None
+    if not text_match and not covenant_match and not filters:
+        raise ValueError("Nothing to search: pass q, covenant or a threshold filter")
+
+    # 1. HITS PER INDEX (the covenant criteria only look at loans the text matched)
+    hits = _search_text(session, text_match, risk_status, candidates) if text_match else None
+    if covenant_match or filters:
+        if hits is not None and not hits:
+            return []
+        names = _match_covenant_names(session, covenant_match) if covenant_match else None
+        if names is not None and not names:
+            return []
+        covenant_hits = _covenant_hits(
+            session, names, filters, kind, risk_status,
+            None if hits is None else hits.keys(), candidates,
+        )
+        if hits is None:
+            hits = covenant_hits
+        else:
+            hits = {
+                loan_id: {
+                    "score": entry["score"] + covenant_hits[loan_id]["score"],
+                    "matches": entry["matches"] + covenant_hits[loan_id]["matches"],
+                }
+                for loan_id, entry in hits.items() if loan_id in covenant_hits
+            }
+
+    # 2. TOP LOANS, best score first (bm25 is negative: lower = better)
+    ranked = sorted(hits.items(), key=lambda item: (item[1]["score"], item[0]))[:limit]
+    if not ranked:
+        return []
+    rows = session.execute(
+        text("SELECT id, borrower_name, risk_status, loan_amount FROM loan WHERE id IN :ids")
+        .bindparams(bindparam("ids", expanding=True)),
+        {"ids": [loan_id for loan_id, _ in ranked]},
+    ).all()
+    loans = {row[0]: row for row in rows}
+
+    return [
+        {
+            "loan_id": loan_id,
+            "borrower_name": loans[loan_id][1],
+            "risk_status": loans[loan_id][2],
+            "loan_amount": loans[loan_id][3],
+            "score": round(-entry["score"], 4),
+            "matches": entry["matches"],
+        }
+        for loan_id, entry in ranked if loan_id in loans
+    ]
+
+
+def index_agreement_text(session: Session, loan_id, job_id):
+    """
+    Adds the agreement text extracted by analysis job `job_id` to the search index
+    under `loan_id`. Returns False if the job or its text is unknown. Does not commit.
+    """
+    job = session.get(AnalysisJob, job_id) if job_id else None
+    agreement = session.get(AgreementText, job.file_sha256) if job and job.file_sha256 else None
+    if agreement is None:
+        return False
+    session.execute(
+        text("INSERT OR REPLACE INTO agreement_fts (rowid, text) VALUES (:loan_id, :text)"),
+        {"loan_id": loan_id, "text": agreement.text},
+    )
+    return True
@@ -0,0 +1,226 @@
+import math
+import os
+import time
+import numpy as np
+from sqlmodel import Session
+from database import read_engine, begin_snapshot
+from services.covenants import normalize_metric
+from services.evaluation import (
+    EVAL_WATCHLIST_HEADROOM, load_financial_covenants, load_latest_metrics,
+    join_latest_metrics, encode_operators, check_covenants,
+)
+from services.portfolio import parse_loan_amount
+
+# --- STRESS TESTING ---
+# "What if EBITDA falls 20% across Energy?" Each scenario shocks the latest reported
+# metrics (the columns evaluate_covenants tests) and every financial covenant is tested
+# again, without writing anything. The inputs are read in one snapshot through the
+# read-only engine (WAL readers never block the scanner), then all scenarios are
+# evaluated together as a (scenarios x covenants) matrix, a block of rows at a time.
+
+# --- CONFIGURATION ---
+STRESS_MAX_SCENARIOS = int(os.getenv("STRESS_MAX_SCENARIOS", "50"))
+STRESS_BLOCK_CELLS = int(os.getenv("STRESS_BLOCK_CELLS", "4000000"))  # Scenario x covenant values per block
+
+# Drivers: inputs several covenant ratios are built on. A driver factor f moves each
+# ratio by f ** exponent (EBITDA -20%: Debt/EBITDA / 0.8, interest cover * 0.8).
+DRIVERS = {
+    "ebitda": {"debt_to_ebitda": -1, "leverage": -1, "interest_coverage": 1, "dscr": 1, "fixed_charge_coverage": 1},
+    "debt": {"debt_to_ebitda": 1, "leverage": 1},
+}
+
+HEADROOM_PERCENTILES = (5, 25, 50, 75, 95)
+HEADROOM_BINS = (-0.5, -0.25, -0.1, 0.0, 0.1, 0.25, 0.5, 1.0)  # Inner edges of the loan headroom histogram
+
+
+def _load_snapshot():
+    """Covenants, latest metrics and loans, all from the same WAL snapshot."""
+    with Session(read_engine) as session:
+        begin_snapshot(session)
+        cov_rows = load_financial_covenants(session)
+        metric_rows = load_latest_metrics(session)
+        loan_rows = session.connection().exec_driver_sql("SELECT id, sector, loan_amount FROM loan").fetchall()
+    return cov_rows, metric_rows, loan_rows
+
+
+def _build_portfolio(cov_rows, metric_rows, loan_rows):
+    """
+    Column arrays of every testable covenant, ordered by loan so per-loan roll-ups are
+    one reduceat over contiguous runs. Returns None if no covenant has a reported value.
+    """
+    if not cov_rows or not metric_rows:
+        return None
+    _, cov_loan_ids, _, cov_metrics, cov_ops, cov_thresholds, _ = zip(*cov_rows)
+    met_loan_ids, met_metrics, _, met_values = zip(*metric_rows)
+
+    cov_index, metric_index = join_latest_metrics(cov_loan_ids, cov_metrics, met_loan_ids, met_metrics)
+    if len(cov_index) == 0:
+        return None
+    tested_loan_ids = np.array(cov_loan_ids, dtype=np.int64)[cov_index]
+    if np.any(np.diff(tested_loan_ids) < 0):  # Covenants are usually inserted loan by loan already
+        order = np.argsort(tested_loan_ids, kind="stable")
+        cov_index, metric_index, tested_loan_ids = cov_index[order], metric_index[order], tested_loan_ids[order]
+
+    loan_starts = np.flatnonzero(np.diff(tested_loan_ids, prepend=-1))
+    loan_ids = tested_loan_ids[loan_starts]
+    loan_pos = np.cumsum(np.diff(tested_loan_ids, prepend=tested_loan_ids[0]) != 0)
+
+    codes = {}
+    all_codes = np.array([codes.setdefault(metric, len(codes)) for metric in cov_metrics])
+    metric_codes = all_codes[cov_index]
+    metric_names = list(codes)
+
+    # Loan attributes: sector (case-insensitive) and exposure, parsed once per distinct amount string
+    loans = {loan_id: (sector, amount) for loan_id, sector, amount in loan_rows}
+    attributes = [loans.get(int(loan_id), (None, None)) for loan_id in loan_ids]
+    parsed = {amount: parse_loan_amount(amount) for amount in {amount for _, amount in attributes}}
+    currencies, currency_codes = np.unique([parsed[amount][0] for _, amount in attributes], return_inverse=True)
+
+    return {
+        "values": np.array(met_values, dtype=np.float64)[metric_index],
+        "thresholds": np.array(cov_thresholds, dtype=np.float64)[cov_index],
+        "operators": encode_operators(cov_ops)[cov_index],
+        "metric_names": metric_names,
+        "metric_codes": metric_codes,
+        "loan_starts": loan_starts,
+        "loan_pos": loan_pos,
+        "sectors": np.array([(sector or "").lower() for sector, _ in attributes], dtype=object),
+        "currencies": [str(code) for code in currencies],
+        "currency_codes": currency_codes,
+        "amounts": np.array([parsed[amount][1] for _, amount in attributes], dtype=np.float64),
+    }
+
+
+def _plan_shocks(scenario, portfolio):
+    """
+    A scenario's shocks as (covenant mask, factor, shift) steps, applied in order.
+    Raises ValueError for a metric no covenant tests or an invalid driver shock.
+    """
+    metric_index = {name: code for code, name in enumerate(portfolio["metric_names"])}
+    steps = []
+    for shock in scenario.shocks:
+        if not (math.isfinite(shock.factor) and math.isfinite(shock.shift)):
+            raise ValueError(f"Scenario '{scenario.name}': factor and shift must be finite numbers")
+        metric = normalize_metric(shock.metric)
+        if metric in DRIVERS:
+            if shock.shift or shock.factor <= 0:
+                raise ValueError(
+                    f"Scenario '{scenario.name}': '{shock.metric}' is a driver, shock it with a positive factor only"
+                )
+            targets = [(name, shock.factor ** exponent, 0.0) for name, exponent in DRIVERS[metric].items()]
+        elif metric in metric_index:
+            targets = [(metric, shock.factor, shock.shift)]
+        else:
+            known = ", ".join(portfolio["metric_names"] + sorted(DRIVERS))
+            raise ValueError(f"Scenario '{scenario.name}': no covenant tests '{shock.metric}' (known: {known})")
+
+        loan_mask = np.ones(len(portfolio["sectors"]), dtype=bool)
+        if shock.sector:
+            loan_mask &= portfolio["sectors"] == shock.sector.lower()
+        if shock.currency:
+            currency = shock.currency.upper()
+            loan_mask &= np.array(portfolio["currencies"], dtype=object)[portfolio["currency_codes"]] == currency
+        covenant_mask = loan_mask[portfolio["loan_pos"]]
+
+        for name, factor, shift in targets:
+            if name in metric_index:
+                steps.append((covenant_mask & (portfolio["metric_codes"] == metric_index[name]), factor, shift))
+    return steps
+
+
+def _summarize(portfolio, breached, loan_breached, loan_headroom, baseline_breached=None):
+    """Breach counts, exposure at risk and the loan headroom distribution of one scenario."""
+    by_metric = np.bincount(portfolio["metric_codes"][breached], minlength=len(portfolio["metric_names"]))
+    exposure = np.bincount(
+        portfolio["currency_codes"][loan_breached], weights=portfolio["amounts"][loan_breached],
+        minlength=len(portfolio["currencies"]),
+    )
+    watchlist = ~loan_breached & (loan_headroom < EVAL_WATCHLIST_HEADROOM)
+    counts, _ = np.histogram(loan_headroom, bins=(-np.inf, *HEADROOM_BINS, np.inf))
+    edges = (None, *HEADROOM_BINS, None)
+
+    summary = {
+        "breaches": int(breached.sum()),
+        "breaches_by_metric": {
+            name: int(count) for name, count in zip(portfolio["metric_names"], by_metric) if count
+        },
+        "loans_breached": int(loan_breached.sum()),
+        "projected_status": {
+            "Critical": int(loan_breached.sum()),
+            "Watchlist": int(watchlist.sum()),
+            "Healthy": int(len(loan_breached) - loan_breached.sum() - watchlist.sum()),
+        },
+        "exposure_at_risk": {
+            currency: round(float(amount), 2) for currency, amount in zip(portfolio["currencies"], exposure) if amount
+        },
+        "headroom": {
+            "percentiles": {
+                f"p{p}": round(float(value), 4)
+                for p, value in zip(HEADROOM_PERCENTILES, np.percentile(loan_headroom, HEADROOM_PERCENTILES))
+            },
+            "histogram": [
+                {"from": edges[i], "to": edges[i + 1], "loans": int(count)} for i, count in enumerate(counts)
+            ],
+        },
+    }
+    if baseline_breached is not None:
+        summary["newly_breached_loans"] = int((loan_breached & ~baseline_breached).sum())
+    return summary
+
+
+def run_stress_test(scenarios):
+    """
+    Evaluates StressScenario shocks against the latest financials of every loan, plus
+    an unshocked baseline. Headroom is per loan (its tightest covenant, as a share of the
+    threshold); exposure at risk is the amount of the loans with a breach, per currency.
+    Raises ValueError for an invalid request. Read-only.
+    """
+    if not scenarios:
+        raise ValueError("Provide at least one scenario")
+    if len(scenarios) > STRESS_MAX_SCENARIOS:
+        raise ValueError(f"At most {STRESS_MAX_SCENARIOS} scenarios per request")
+    started = time.perf_counter()
+
+    # 1. LOAD (one snapshot, then the connection goes back to the pool)
+    portfolio = _build_portfolio(*_load_snapshot())
+    result = {"loans_tested": 0, "covenants_tested": 0, "baseline": None, "scenarios": []}
+    if portfolio is None:
+        return result
+    plans = [[]] + [_plan_shocks(scenario, portfolio) for scenario in scenarios]  # Row 0: the baseline
+
+    # 2. EVALUATE, a block of scenarios at a time (each row is a full copy of the values)
+    n_covenants = len(portfolio["values"])
+    block_rows = max(1, STRESS_BLOCK_CELLS // n_covenants)
+    summaries, baseline_breached = [], None
+    for start in range(0, len(plans), block_rows):
+        block = plans[start:start + block_rows]
+        values = np.tile(portfolio["values"], (len(block), 1))
+        for row, steps in enumerate(block):
+            for mask, factor, shift in steps:
+                values[row, mask] = values[row, mask] * factor + shift
+
+        compliant, headroom = check_covenants(values, portfolio["operators"], portfolio["thresholds"])
+        breached = ~compliant
+        # Worst covenant per loan: covenants are ordered by loan, so each loan is one contiguous run
+        loan_breached = np.logical_or.reduceat(breached, portfolio["loan_starts"], axis=1)
+        loan_headroom = np.minimum.reduceat(headroom, portfolio["loan_starts"], axis=1)
+
+        for row in range(len(block)):
+            summaries.append(_summarize(
+                portfolio, breached[row], loan_breached[row], loan_headroom[row], baseline_breached,
+            ))
+            if baseline_breached is None:
+                baseline_breached = loan_breached[row].copy()
+
+    elapsed = time.perf_counter() - started
+    result.update({
+        "loans_tested": int(len(portfolio["loan_starts"])),
+        "covenants_tested": n_covenants,
+        "baseline": summaries[0],
+        "scenarios": [{"name": scenario.name, **summary} for scenario, summary in zip(scenarios, summaries[1:])],
+    })
+    print(
+        f"🧪 [STRESS] {len(scenarios)} scenarios x {n_covenants} covenants on "
+        f"{result['loans_tested']} loans in {elapsed:.2f}s."
+    )
+    return result
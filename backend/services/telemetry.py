@@ -0,0 +1,314 @@
+import contextvars
+import heapq
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- TELEMETRY ---
+# Process-local counters and histograms, exposed by GET /metrics in the Prometheus
+# text format. Recording is a lock + a few additions, cheap enough for every request,
+# query and page. With several uvicorn workers each process reports its own numbers
+# (scrape them per worker, or sum them in Prometheus).
+
+# --- CONFIGURATION ---
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))  # 0 = profiler off
+PROFILE_SAMPLE_HZ = float(os.getenv("PROFILE_SAMPLE_HZ", "50"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # Profiles kept: the slowest requests so far
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("uploads", "profiles"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+SCAN_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+SIZE_BUCKETS = (1e4, 1e5, 1e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels: counter.inc(3, route="/api/loans")."""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram with optional labels: histogram.observe(0.12, route="/api/loans")."""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(float(total))}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+# --- 1. INSTRUMENTS ---
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Request latency by route template.", ("method", "route", "status"),
+)
+HTTP_QUERIES = Histogram(
+    "http_request_db_queries", "SQLite statements executed per request.", ("method", "route"), COUNT_BUCKETS,
+)
+DB_QUERIES = Counter("db_queries_total", "SQLite statements executed (requests, jobs and scans).")
+
+EXTRACTION_DURATION = Histogram(
+    "extraction_duration_seconds", "PDF text extraction time per document.", buckets=SCAN_BUCKETS,
+)
+EXTRACTION_RATE = Histogram(
+    "extraction_pages_per_second", "PDF text extraction throughput per document.", buckets=RATE_BUCKETS,
+)
+EXTRACTION_BYTES = Histogram("extraction_document_bytes", "Size of each extracted PDF.", buckets=SIZE_BUCKETS)
+EXTRACTION_PAGES = Counter("extraction_pages_total", "Pages with text extracted from PDFs.")
+
+LLM_LATENCY = Histogram(
+    "llm_request_duration_seconds", "LLM completion latency (one attempt).", ("backend", "outcome"),
+    LLM_LATENCY_BUCKETS,
+)
+LLM_PROMPT_CHARS = Histogram(
+    "llm_prompt_chars", "Prompt size per completion, in characters.", ("backend",),
+    (1000, 2500, 5000, 10000, 20000, 40000, 80000),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM backend.", ("backend", "kind"))
+LLM_RETRIES = Counter("llm_retries_total", "Retried LLM calls (429s, 5xx, timeouts).", ("backend",))
+
+SCAN_DURATION = Histogram("scan_duration_seconds", "Scheduler job run time.", ("job",), SCAN_BUCKETS)
+SCAN_LOANS = Counter("scan_loans_total", "Loans examined by scheduler jobs.", ("job",))
+SCAN_ALERTS = Counter("scan_alerts_total", "Alerts emitted by scheduler jobs.", ("job",))
+
+INSTRUMENTS = (
+    HTTP_LATENCY, HTTP_QUERIES, DB_QUERIES,
+    EXTRACTION_DURATION, EXTRACTION_RATE, EXTRACTION_BYTES, EXTRACTION_PAGES,
+    LLM_LATENCY, LLM_PROMPT_CHARS, LLM_TOKENS, LLM_RETRIES,
+    SCAN_DURATION, SCAN_LOANS, SCAN_ALERTS,
+)
+
+
+def render_metrics():
+    """All instruments in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for instrument in INSTRUMENTS:
+        lines.extend(instrument.render())
+    return "\n".join(lines) + "\n"
+
+
+def record_extraction(pages, seconds, size_bytes):
+    EXTRACTION_PAGES.inc(pages)
+    EXTRACTION_DURATION.observe(seconds)
+    EXTRACTION_BYTES.observe(size_bytes)
+    if seconds > 0 and pages:
+        EXTRACTION_RATE.observe(pages / seconds)
+
+
+def record_scan(job, seconds=None, loans=0, alerts=0):
+    if seconds is not None:
+        SCAN_DURATION.observe(seconds, job=job)
+    if loans:
+        SCAN_LOANS.inc(loans, job=job)
+    if alerts:
+        SCAN_ALERTS.inc(alerts, job=job)
+
+
+# --- 2. QUERY COUNTING ---
+# One listener on every Engine; the count lands on whichever request (if any) is in
+# the current context. Starlette copies the context into the threadpool that runs
+# sync routes and dependencies, so queries made there are attributed too.
+
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+# Threads doing this request's work (for the profiler): the event loop thread it started
+# on, plus the threadpool threads of sync routes, recorded when they run its queries
+_request_threads = contextvars.ContextVar("request_threads", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.inc()
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    threads = _request_threads.get()
+    if threads is not None:
+        threads.add(threading.get_ident())
+
+
+def start_query_count():
+    """Starts counting this request's queries. Returns the counter ([n]) and a reset token."""
+    counter = [0]
+    return counter, _request_queries.set(counter)
+
+
+def stop_query_count(token):
+    _request_queries.reset(token)
+
+
+def start_thread_tracking():
+    """Starts recording the threads that work on this request. Returns the set and a reset token."""
+    threads = {threading.get_ident()}
+    return threads, _request_threads.set(threads)
+
+
+def stop_thread_tracking(token):
+    _request_threads.reset(token)
+
+
+# --- 3. SLOW REQUEST PROFILER ---
+# Opt-in (PROFILE_SLOW_REQUEST_MS > 0). A daemon thread samples the stacks of all busy
+# threads PROFILE_SAMPLE_HZ times a second into a short ring buffer. When a request is
+# slower than the threshold, the samples its own threads took while it ran (not the
+# scheduler's or the job workers') are written as folded
+# stacks ("frame;frame;frame count"), the input of flamegraph.pl and speedscope.
+# Only the PROFILE_KEEP slowest requests are kept on disk.
+
+IDLE_FRAMES = {"wait", "select", "_worker", "accept"}  # A thread parked here is not doing work
+PROFILE_BUFFER_SECONDS = 120
+
+
+class SamplingProfiler:
+    def __init__(self, hz=None, slow_ms=None, keep=None, directory=None):
+        self.interval = 1.0 / (hz or PROFILE_SAMPLE_HZ)
+        self.slow_seconds = (slow_ms if slow_ms is not None else PROFILE_SLOW_REQUEST_MS) / 1000
+        self.keep = keep or PROFILE_KEEP
+        self.directory = directory or PROFILE_DIR
+        self._samples = deque(maxlen=int(PROFILE_BUFFER_SECONDS / self.interval) * 8)
+        self._kept = []  # Min-heap of (duration, path) of the profiles on disk
+        self._kept_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="telemetry-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_name in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)  # Resolved to names only when a profile is written
+                    frame = frame.f_back
+                self._samples.append((now, thread_id, tuple(stack)))
+
+    def finish_request(self, label, started, seconds, threads):
+        """
+        Writes the profile of a finished request if it is among the slowest so far.
+        Only samples of `threads` (start_thread_tracking) are attributed to it.
+        """
+        if seconds < self.slow_seconds:
+            return None
+        with self._kept_lock:
+            if len(self._kept) >= self.keep and seconds <= self._kept[0][0]:
+                return None
+
+        ended = started + seconds
+        folded = {}
+        for sampled_at, thread_id, stack in list(self._samples):
+            if started <= sampled_at <= ended and thread_id in threads:
+                key = ";".join(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                               for code in reversed(stack))
+                folded[key] = folded.get(key, 0) + 1
+        if not folded:
+            return None
+
+        name = "".join(c if c.isalnum() else "_" for c in label).strip("_")
+        path = os.path.join(
+            self.directory, f"{datetime.now():%Y%m%d-%H%M%S}_{name}_{seconds * 1000:.0f}ms.folded"
+        )
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in folded.items())
+
+        with self._kept_lock:
+            heapq.heappush(self._kept, (seconds, path))
+            while len(self._kept) > self.keep:
+                _, evicted = heapq.heappop(self._kept)
+                try:
+                    os.remove(evicted)
+                except OSError:
+                    pass
+        return path
+
+
+_profiler = None
+
+
+def get_profiler():
+    """The running profiler, started on first call, or None when profiling is off."""
+    global _profiler
+    if PROFILE_SLOW_REQUEST_MS <= 0:
+        return None
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+        _profiler.start()
+        print(f"🔬 [PROFILE] Sampling at {PROFILE_SAMPLE_HZ:g} Hz; requests over "
+              f"{PROFILE_SLOW_REQUEST_MS:g} ms are saved to {PROFILE_DIR}.")
+    return _profiler
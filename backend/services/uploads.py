@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+# --- CONFIGURATION ---
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join("uploads", "spool"))
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", os.path.join("uploads", "documents"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", "250")) * 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded UPLOAD_MAX_BYTES (mapped to HTTP 413 by the routes)."""
+
+
+@dataclass
+class SpooledUpload:
+    """An upload copied to local disk. `sha256` is its content address."""
+    path: str
+    sha256: str
+    size: int
+    filename: str = ""
+
+
+def _limit_message(max_bytes):
+    return f"Upload exceeds the {max_bytes / (1024 * 1024):g} MB limit"
+
+
+def check_content_length(headers, max_bytes=None):
+    """Rejects obviously oversized requests before any body is read."""
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    try:
+        declared = int(headers.get("content-length", 0))
+    except ValueError:
+        return
+    if declared > max_bytes:
+        raise UploadTooLarge(_limit_message(max_bytes))
+
+
+async def spool_upload(upload, directory=None, max_bytes=None, chunk_size=None):
+    """
+    Copies an UploadFile to a temp file `chunk_size` bytes at a time, hashing as it
+    goes, so memory use is bounded by the chunk size rather than the file size.
+    Raises UploadTooLarge (and removes the partial file) once `max_bytes` is passed.
+    """
+    directory = directory or UPLOAD_SPOOL_DIR
+    max_bytes = max_bytes or UPLOAD_MAX_BYTES
+    chunk_size = chunk_size or UPLOAD_CHUNK_BYTES
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(_limit_message(max_bytes))
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+    except BaseException:
+        discard(path)
+        raise
+
+    return SpooledUpload(path=path, sha256=digest.hexdigest(), size=size, filename=upload.filename or "")
+
+
+def hash_file(path, chunk_size=None):
+    """sha256 of a file on disk, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size or UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_document(spooled, directory=None, extension=".pdf"):
+    """
+    Moves a spooled upload into the content-addressed store
+    (<dir>/<sha[:2]>/<sha>.pdf). Identical files are stored once.
+    Returns the stored path.
+    """
+    directory = directory or DOCUMENT_STORE_DIR
+    target_dir = os.path.join(directory, spooled.sha256[:2])
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, f"{spooled.sha256}{extension}")
+
+    if os.path.exists(target):
+        discard(spooled.path)  # Already stored: same bytes, same address
+    else:
+        shutil.move(spooled.path, target)
+    spooled.path = target
+    return target
+
+
+def discard(path):
+    if path and os.path.exists(path):
+        os.remove(path)
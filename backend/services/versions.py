@@ -0,0 +1,72 @@
+import os
+import threading
+import time
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session
+from database import read_engine
+
+# --- TABLE VERSIONS ---
+# One counter per table in `tableversion`, bumped by every writer in the same transaction
+# as its change. HTTP caching (services/response_cache.py) builds ETags from them.
+# Each process keeps a mirror of the counters:
+# - its own commits update the mirror as soon as they succeed (no staleness)
+# - commits by other processes (workers, sharded scans) are picked up by re-reading
+#   the table at most once per TABLE_VERSION_TTL_SECONDS
+# so checking the versions on a request normally doesn't touch the database.
+
+# --- CONFIGURATION ---
+TABLE_VERSION_TTL_SECONDS = float(os.getenv("TABLE_VERSION_TTL_SECONDS", "1.0"))
+
+# A table's first version is the current time in ms, so a recreated database never
+# hands out versions (and ETags) a client may still hold from the old one
+_BUMP = text(
+    "INSERT INTO tableversion (name, version) VALUES (:name, :initial) "
+    "ON CONFLICT (name) DO UPDATE SET version = tableversion.version + 1 "
+    "RETURNING version"
+)
+
+_versions = {}
+_refreshed_at = None
+_lock = threading.Lock()
+
+
+def bump_table_versions(session: Session, *tables):
+    """
+    Marks `tables` (e.g. "loan", "alert") as changed. Does not commit: the bump becomes
+    visible with the caller's commit, and this process's mirror is updated right after it.
+    """
+    pending = session.info.setdefault("table_versions", {})
+    for table in tables:
+        pending[table] = session.execute(_BUMP, {"name": table, "initial": int(time.time() * 1000)}).scalar_one()
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _publish_versions(session):
+    pending = session.info.pop("table_versions", None)
+    if pending:
+        with _lock:
+            for table, version in pending.items():
+                _versions[table] = max(_versions.get(table, 0), version)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _discard_versions(session):
+    session.info.pop("table_versions", None)
+
+
+def get_table_versions(*tables, now=None):
+    """Current versions of `tables` (0 for a table never written), from the local mirror."""
+    global _refreshed_at
+    now = now or time.monotonic()
+    with _lock:
+        stale = _refreshed_at is None or now - _refreshed_at >= TABLE_VERSION_TTL_SECONDS
+    if stale:
+        with Session(read_engine) as session:
+            stored = dict(session.execute(text("SELECT name, version FROM tableversion")).all())
+        with _lock:
+            for table, version in stored.items():
+                _versions[table] = max(_versions.get(table, 0), version)
+            _refreshed_at = now
+    with _lock:
+        return tuple(_versions.get(table, 0) for table in tables)
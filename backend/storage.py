@@ -0,0 +1,115 @@
+import os
+from dataclasses import dataclass
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlmodel import create_engine
+
+# --- STORAGE CONFIGURATION ---
+# Everything here can be overridden from the environment, e.g.
+#   DATABASE_URL=sqlite:////var/lib/covenant/covenant.db SQLITE_SYNCHRONOUS=FULL uvicorn main:app
+#
+# WAL lets readers keep going while one writer commits, so GET routes are served from
+# a separate read-only pool and never queue behind the scheduler or an ingest batch.
+# Writers still serialize on SQLite's single write lock; the busy timeout makes them
+# wait for it instead of failing with "database is locked".
+
+
+def _env_int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+@dataclass(frozen=True)
+class StorageSettings:
+    database_url: str = "sqlite:///covenant.db"
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"      # Safe with WAL: a power loss can drop the last commits, never corrupt
+    cache_size_mb: int = 64          # Page cache per connection
+    mmap_size_mb: int = 256          # Memory-mapped reads; 0 disables
+    busy_timeout_ms: int = 10000     # How long a writer waits for the write lock
+    pool_size: int = 5               # Write pool
+    max_overflow: int = 5
+    read_pool_size: int = 10         # Read-only pool for GET routes
+    read_max_overflow: int = 10
+    pool_timeout: int = 30           # Seconds to wait for a free pooled connection
+
+    @classmethod
+    def from_env(cls):
+        defaults = cls()
+        return cls(
+            database_url=os.getenv("DATABASE_URL", defaults.database_url),
+            journal_mode=os.getenv("SQLITE_JOURNAL_MODE", defaults.journal_mode).upper(),
+            synchronous=os.getenv("SQLITE_SYNCHRONOUS", defaults.synchronous).upper(),
+            cache_size_mb=_env_int("SQLITE_CACHE_SIZE_MB", defaults.cache_size_mb),
+            mmap_size_mb=_env_int("SQLITE_MMAP_SIZE_MB", defaults.mmap_size_mb),
+            busy_timeout_ms=_env_int("SQLITE_BUSY_TIMEOUT_MS", defaults.busy_timeout_ms),
+            pool_size=_env_int("DB_POOL_SIZE", defaults.pool_size),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", defaults.max_overflow),
+            read_pool_size=_env_int("DB_READ_POOL_SIZE", defaults.read_pool_size),
+            read_max_overflow=_env_int("DB_READ_MAX_OVERFLOW", defaults.read_max_overflow),
+            pool_timeout=_env_int("DB_POOL_TIMEOUT", defaults.pool_timeout),
+        )
+
+    @property
+    def is_sqlite(self):
+        return make_url(self.database_url).get_backend_name() == "sqlite"
+
+    @property
+    def is_memory(self):
+        database = make_url(self.database_url).database
+        return self.is_sqlite and (not database or database == ":memory:")
+
+
+# --- ENGINES ---
+
+def build_engine(settings: StorageSettings, read_only: bool = False):
+    """
+    Creates a pooled engine. For SQLite every new connection gets the pragmas below;
+    `read_only` connections additionally refuse writes (PRAGMA query_only).
+    """
+    if not settings.is_sqlite:
+        return create_engine(
+            settings.database_url,
+            pool_size=settings.read_pool_size if read_only else settings.pool_size,
+            max_overflow=settings.read_max_overflow if read_only else settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {
+        # Connections are handed between FastAPI's threadpool, the scheduler and job workers
+        "check_same_thread": False,
+        "timeout": settings.busy_timeout_ms / 1000,
+    }
+
+    if settings.is_memory:
+        # One shared connection, otherwise every pooled connection sees its own empty database
+        engine = create_engine(settings.database_url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            settings.database_url,
+            connect_args=connect_args,
+            poolclass=QueuePool,
+            pool_size=settings.read_pool_size if read_only else settings.pool_size,
+            max_overflow=settings.read_max_overflow if read_only else settings.max_overflow,
+            pool_timeout=settings.pool_timeout,
+        )
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not read_only and not settings.is_memory:
+                # Persistent per database file; the read pool inherits it
+                cursor.execute(f"PRAGMA journal_mode = {settings.journal_mode}")
+            cursor.execute(f"PRAGMA synchronous = {settings.synchronous}")
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings.busy_timeout_ms)}")
+            cursor.execute(f"PRAGMA cache_size = -{int(settings.cache_size_mb) * 1024}")  # Negative = KiB
+            cursor.execute(f"PRAGMA mmap_size = {int(settings.mmap_size_mb) * 1024 * 1024}")
+            cursor.execute("PRAGMA temp_store = MEMORY")
+            if read_only:
+                cursor.execute("PRAGMA query_only = ON")
+        finally:
+            cursor.close()
+
+    return engine
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# The app reads its settings at import time: point every test run at a throwaway
+# database and cache (never covenant.db), with the offline LLM backend.
+_TMP_DIR = tempfile.mkdtemp(prefix="covenant-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ["ANALYSIS_CACHE_PATH"] = os.path.join(_TMP_DIR, "analysis_cache.db")
+os.environ["ANALYSIS_JOB_DIR"] = os.path.join(_TMP_DIR, "jobs")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.setdefault("GROQ_API_KEY", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from sqlmodel import Session, delete, select
+from database import create_db_and_tables, engine
+from models import Alert, AlertArchive
+from services.alerts import archive_resolved_alerts
+
+
+def _add_resolved_alert(session, message, timestamp):
+    alert = Alert(loan_id=1, message=message, type="Overdue", timestamp=timestamp, is_resolved=True)
+    session.add(alert)
+    session.commit()
+    return alert.id
+
+
+def test_archive_survives_reused_alert_ids():
+    create_db_and_tables()
+    old = datetime.now() - timedelta(days=365)
+    with Session(engine) as session:
+        session.execute(delete(Alert))
+        session.execute(delete(AlertArchive))
+        session.commit()
+
+        first_id = _add_resolved_alert(session, "first", old)
+        assert archive_resolved_alerts(older_than_days=90) == 1
+
+        # SQLite hands the archived alert's id to the next alert (no AUTOINCREMENT)
+        second_id = _add_resolved_alert(session, "second", old)
+        assert second_id == first_id
+        assert archive_resolved_alerts(older_than_days=90) == 1
+
+        archived = session.exec(select(AlertArchive).order_by(AlertArchive.id)).all()
+        assert [(row.alert_id, row.message) for row in archived] == [(first_id, "first"), (first_id, "second")]
+        assert session.exec(select(Alert)).all() == []
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import pytest
+from services import analyzer
+from services.analyzer import analyze_covenants_with_groq, merge_chunk_results, split_into_chunks
+from services.fake_llm import FakeLLMClient, FakeRateLimitError
+from services.llm import LLMClient
+
+
+def make_agreement(pages, covenant_pages=(), filler_lines=20):
+    """extract_text_from_pdf-style text: "--- Page N ---" markers, one covenant line on the given pages."""
+    text = []
+    for page in range(1, pages + 1):
+        lines = [f"Clause {page}.{i}: The Borrower shall comply with this Agreement." for i in range(filler_lines)]
+        if page == 1:
+            lines[:2] = ["Borrower: Test Holdings Ltd.", "Amount: USD 50,000,000"]
+        if page in covenant_pages:
+            lines.append(f"Covenant {page} Ratio <= {page}.5x")
+        text.append(f"--- Page {page} ---\n" + "\n".join(lines))
+    return "\n\n".join(text)
+
+
+class TrackingLLM(FakeLLMClient):
+    """FakeLLMClient that records how many calls were in flight at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = self.max_in_flight = 0
+        self._flight_lock = threading.Lock()
+
+    def _complete(self, messages):
+        with self._flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return super()._complete(messages)
+        finally:
+            with self._flight_lock:
+                self.in_flight -= 1
+
+    async def _acomplete(self, messages):
+        with self._flight_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await super()._acomplete(messages)
+        finally:
+            with self._flight_lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Chunks of ~one page, so a short agreement fans out into several LLM calls."""
+    monkeypatch.setattr(analyzer, "split_into_chunks", lambda text: split_into_chunks(text, token_budget=300))
+
+
+# --- SPLITTING ---
+
+def test_split_into_chunks_respects_token_budget_and_page_markers():
+    text = make_agreement(12)
+    budget = 700
+    chunks = split_into_chunks(text, token_budget=budget)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= budget * analyzer.CHARS_PER_TOKEN
+        assert chunk.startswith("--- Page ")  # Cut at page boundaries only
+    # Every page lands whole in exactly one chunk, in order
+    pages = [page for chunk in chunks for page in chunk.split("\n\n")]
+    assert pages == text.split("\n\n")
+
+
+def test_split_into_chunks_cuts_an_oversized_page():
+    text = make_agreement(3, filler_lines=200)
+    chunks = split_into_chunks(text, token_budget=500)
+
+    assert all(len(chunk) <= 500 * analyzer.CHARS_PER_TOKEN for chunk in chunks)
+    assert "".join(chunks).replace("\n\n", "") == text.replace("\n\n", "")
+
+
+# --- MERGING ---
+
+def test_merge_chunk_results_dedupes_covenants():
+    merged = merge_chunk_results([
+        {"borrower_name": "N/A", "loan_amount": "USD 5M", "effective_date": "N/A", "covenants": [
+            {"name": "Debt-to-EBITDA", "operator": "<=", "threshold": "3.5x"},
+            {"name": "Interest Coverage", "operator": ">=", "threshold": "2.0x"},
+        ]},
+        None,  # A failed chunk
+        {"borrower_name": "Acme Corp", "loan_amount": "USD 9M", "effective_date": "2025-01-01", "covenants": [
+            {"name": "debt to ebitda", "operator": "<=", "threshold": "3.5 x"},  # Same covenant, other spelling
+            {"name": "Debt-to-EBITDA", "operator": "<=", "threshold": "4.0x"},  # Different threshold: kept
+            {"name": "N/A", "operator": "<=", "threshold": "1x"},
+        ]},
+    ])
+
+    assert merged["borrower_name"] == "Acme Corp"
+    assert merged["loan_amount"] == "USD 5M"  # First non-missing value in document order
+    assert [(cov["name"], cov["threshold"]) for cov in merged["covenants"]] == [
+        ("Debt-to-EBITDA", "3.5x"), ("Interest Coverage", "2.0x"), ("Debt-to-EBITDA", "4.0x"),
+    ]
+
+
+# --- MAP (concurrency, retries) ---
+
+def test_analysis_respects_the_concurrency_limit(small_chunks):
+    llm = TrackingLLM(latency=0.05)
+    result = analyze_covenants_with_groq(make_agreement(5, covenant_pages=range(1, 6)), llm_client=llm, max_concurrency=2)
+
+    assert llm.calls >= 4
+    assert llm.max_in_flight == 2
+    assert len(result["covenants"]) == 5
+
+
+def test_llm_client_bounds_concurrent_calls():
+    backend = TrackingLLM(latency=0.05)
+    client = LLMClient(backend=backend, requests_per_minute=0, tokens_per_minute=0, max_concurrency=2)
+    threads = [
+        threading.Thread(target=client.create, kwargs={"messages": [{"role": "user", "content": "x"}]})
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.calls == 6
+    assert backend.max_in_flight == 2
+
+
+def test_rate_limited_calls_are_retried(small_chunks):
+    backend = FakeLLMClient(rate_limit_every=2)  # Every other request gets a 429
+    client = LLMClient(backend=backend, requests_per_minute=0, tokens_per_minute=0, backoff_seconds=0)
+    result = analyze_covenants_with_groq(
+        make_agreement(4, covenant_pages=range(1, 5)), llm_client=client, max_concurrency=1,
+    )
+
+    stats = client.stats()
+    assert stats["rate_limited"] >= 1 and stats["retries"] == stats["rate_limited"]
+    assert stats["failures"] == 0
+    assert len(result["covenants"]) == 4
+
+
+def test_rate_limit_error_surfaces_after_the_last_retry():
+    client = LLMClient(
+        backend=FakeLLMClient(rate_limit_every=1), requests_per_minute=0, tokens_per_minute=0,
+        max_retries=2, backoff_seconds=0,
+    )
+    with pytest.raises(FakeRateLimitError):
+        client.create(messages=[{"role": "user", "content": "x"}])
+
+    assert client.stats()["retries"] == 2
+
+
+def test_async_calls_await_the_backend_within_the_concurrency_limit(monkeypatch):
+    backend = TrackingLLM(latency=0.05, rate_limit_every=4)
+    client = LLMClient(backend=backend, requests_per_minute=0, tokens_per_minute=0, max_concurrency=2, backoff_seconds=0)
+    monkeypatch.setattr(asyncio, "to_thread", None)  # No worker threads: the fake's async client is awaited
+
+    async def run():
+        calls = [client.acreate(messages=[{"role": "user", "content": "x"}]) for _ in range(6)]
+        return await asyncio.gather(*calls)
+
+    assert len(asyncio.run(run())) == 6
+    assert backend.calls == 6
+    assert backend.max_in_flight == 2
+    assert client.stats()["retries"] == client.stats()["rate_limited"] >= 1
@@ -0,0 +1,24 @@
+import json
+from sqlmodel import Session, delete, select
+from database import create_db_and_tables, engine
+from models import Covenant, Loan, SchedulerState
+from services.covenants import backfill_covenants
+
+
+def test_backfill_reads_loans_without_usable_covenants_once():
+    create_db_and_tables()
+    with Session(engine) as session:
+        for table in (Covenant, Loan, SchedulerState):
+            session.execute(delete(table))
+        for covenants_json in (
+            "not json",
+            json.dumps(["Debt to EBITDA <= 3.5x"]),  # Not a dict: yields no rows
+            json.dumps([{"name": "Debt to EBITDA", "operator": "<=", "threshold": "3.5x"}]),
+        ):
+            session.add(Loan(borrower_name="Legacy", loan_amount="$1M", effective_date="2025-01-01",
+                             covenants_json=covenants_json))
+        session.commit()
+
+        assert backfill_covenants(session) == 3
+        assert len(session.exec(select(Covenant)).all()) == 1
+        assert backfill_covenants(session) == 0
@@ -0,0 +1,42 @@
+from datetime import datetime
+from sqlmodel import Session, delete
+from database import begin_write, create_db_and_tables, engine
+from models import Alert, Covenant, FinancialMetric, Loan, PortfolioStat
+from services import evaluation
+from services.portfolio import get_portfolio_summary, rebuild_portfolio_summary
+
+
+def test_evaluation_leaves_a_loan_reviewed_mid_run_alone(monkeypatch):
+    create_db_and_tables()
+    with Session(engine) as session:
+        for table in (Alert, Covenant, FinancialMetric, Loan, PortfolioStat):
+            session.execute(delete(table))
+        loan = Loan(borrower_name="Reviewed", loan_amount="$1,000,000", effective_date="2025-01-01", covenants_json="[]")
+        session.add(loan)
+        session.commit()
+        loan_id = loan.id
+        session.add(Covenant(
+            loan_id=loan_id, name="Debt to EBITDA", kind="financial", metric="debt_to_ebitda",
+            operator="<=", threshold=3.0, unit="x", raw_threshold="3.0x",
+        ))
+        session.add(FinancialMetric(loan_id=loan_id, metric="debt_to_ebitda", period_end=datetime(2025, 6, 30), value=3.5))
+        rebuild_portfolio_summary(session)
+        session.commit()
+
+    def review_then_begin_write(session):
+        # A review lands after evaluation read the statuses, before it writes
+        with Session(engine) as other:
+            other.get(Loan, loan_id).risk_status = "Watchlist"
+            rebuild_portfolio_summary(other)
+            other.commit()
+        begin_write(session)
+
+    monkeypatch.setattr(evaluation, "begin_write", review_then_begin_write)
+    result = evaluation.evaluate_covenants()
+
+    assert result["breaches"] == 1
+    assert result["transitions"]["Critical"] == 0
+    with Session(engine) as session:
+        assert session.get(Loan, loan_id).risk_status == "Watchlist"
+        by_status = get_portfolio_summary(session)["loans"]["by_status"]
+        assert {status: row["count"] for status, row in by_status.items()} == {"Watchlist": 1}
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from sqlmodel import Session, delete
+from database import create_db_and_tables, engine
+from models import AnalysisJob, SchedulerLease
+from services import jobs
+from services.leases import worker_id
+
+
+@pytest.fixture
+def ran(monkeypatch):
+    """Runs submitted jobs inline; records the jobs whose claim succeeded (and so would be analyzed)."""
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.execute(delete(AnalysisJob))
+        session.execute(delete(SchedulerLease))
+        session.commit()
+
+    claimed = []
+    monkeypatch.setattr(jobs, "_get_executor", lambda: SimpleNamespace(submit=lambda fn, *args: fn(*args)))
+    monkeypatch.setattr(jobs, "_run_job", lambda job_id: jobs._claim_job(job_id) and claimed.append(job_id))
+    return claimed
+
+
+def _add_job(job_id, status, owner, age_seconds=0):
+    with Session(engine) as session:
+        session.add(AnalysisJob(
+            id=job_id, filename=f"{job_id}.pdf", file_path="", status=status, owner=owner,
+            updated_at=datetime.now() - timedelta(seconds=age_seconds),
+        ))
+        session.commit()
+
+
+def test_restart_under_the_same_worker_id_resumes_its_jobs_at_once(ran):
+    _add_job("interrupted", "running", worker_id())
+    _add_job("waiting", "queued", worker_id())
+    _add_job("other-worker", "running", "otherhost:1")  # Heartbeating: left alone
+
+    jobs.resume_pending_jobs()
+
+    assert sorted(ran) == ["interrupted", "waiting"]
+    assert jobs.get_job("other-worker").owner == "otherhost:1"
+
+
+def test_jobs_of_a_worker_that_stopped_heartbeating_are_taken_over(ran):
+    _add_job("crashed", "running", "otherhost:1", age_seconds=jobs.JOB_STALE_SECONDS + 5)
+    _add_job("alive", "running", "otherhost:2", age_seconds=jobs.JOB_HEARTBEAT_SECONDS)
+
+    assert jobs.requeue_stale_jobs() == 1
+    assert jobs.requeue_stale_jobs() == 0  # Now owned (and heartbeated) by this worker
+    assert ran == ["crashed"]
+    assert jobs.get_job("crashed").owner == worker_id()
+    assert jobs.get_job("alive").owner == "otherhost:2"
+
+
+def test_a_job_submitted_twice_runs_once(ran):
+    _add_job("twice", "queued", "otherhost:1")
+
+    jobs._run_job("twice")
+    jobs._run_job("twice")
+
+    assert ran == ["twice"]
+    assert jobs.get_job("twice").status == "running"
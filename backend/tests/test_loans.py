@@ -0,0 +1,40 @@
+from sqlmodel import Session, delete
+from database import begin_write, create_db_and_tables, engine
+from models import Loan, PortfolioStat
+from services.loans import apply_status_transitions
+from services.portfolio import get_portfolio_summary, rebuild_portfolio_summary
+
+
+def _by_status(session):
+    return {status: row["count"] for status, row in get_portfolio_summary(session)["loans"]["by_status"].items()}
+
+
+def test_transition_skips_a_loan_changed_since_it_was_read():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.execute(delete(Loan))
+        session.execute(delete(PortfolioStat))
+        loans = [
+            Loan(borrower_name=name, loan_amount="$1,000,000", effective_date="2025-01-01", covenants_json="[]")
+            for name in ("Scanned", "Reviewed")
+        ]
+        session.add_all(loans)
+        session.commit()
+        scanned, reviewed = (loan.id for loan in loans)
+        rebuild_portfolio_summary(session)
+        session.commit()
+
+    # The scan read both as Healthy; a review moves one to Watchlist before the scan writes
+    with Session(engine) as session:
+        session.get(Loan, reviewed).risk_status = "Watchlist"
+        rebuild_portfolio_summary(session)
+        session.commit()
+
+    with Session(engine) as session:
+        begin_write(session)
+        moved = apply_status_transitions(session, [(scanned, "Healthy", "Critical"), (reviewed, "Healthy", "Critical")])
+        session.commit()
+
+        assert moved == {scanned}
+        assert session.get(Loan, reviewed).risk_status == "Watchlist"  # The review wins
+        assert _by_status(session) == {"Critical": 1, "Watchlist": 1}
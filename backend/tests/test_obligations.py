@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+from sqlmodel import Session, delete, select
+from database import create_db_and_tables, engine
+from models import Alert, Covenant, Loan, ObligationInstance, SchedulerState
+from services.obligations import OBLIGATION_HISTORY_DAYS, prune_obligation_instances, regenerate_obligations
+from services.scheduler import OBLIGATION_WATERMARK_KEY, run_obligation_check
+
+
+def test_backdated_loan_is_alerted_for_deadlines_behind_the_watermark():
+    create_db_and_tables()
+    now = datetime(2025, 5, 20)
+    with Session(engine) as session:
+        for table in (Alert, Covenant, Loan, ObligationInstance, SchedulerState):
+            session.execute(delete(table))
+        # The checker already ran past the deadline (2025-04-01 + 45 days) before the loan existed
+        session.add(SchedulerState(key=OBLIGATION_WATERMARK_KEY, value=now.isoformat()))
+        loan = Loan(borrower_name="Backdated", loan_amount="$1,000,000", effective_date="2025-01-01", covenants_json="[]")
+        session.add(loan)
+        session.commit()
+        session.add(Covenant(
+            loan_id=loan.id, name="Quarterly Financials", kind="reporting", operator="<=",
+            threshold=45, unit="days", raw_threshold="45 days", frequency_months=3,
+        ))
+        regenerate_obligations(session, [loan.id], now)
+        session.commit()
+
+        alerts = session.exec(select(Alert.due_date, Alert.type)).all()
+        assert alerts == [(datetime(2025, 5, 16), "warning")]
+
+    assert run_obligation_check(now) == 0  # Already alerted, not raised twice
+
+
+def test_prune_drops_history_the_checker_has_passed():
+    create_db_and_tables()
+    now = datetime(2025, 5, 20)
+    old, recent = now - timedelta(days=OBLIGATION_HISTORY_DAYS + 30), now - timedelta(days=1)
+    with Session(engine) as session:
+        for table in (ObligationInstance, SchedulerState):
+            session.execute(delete(table))
+        for covenant_id, due_date in ((1, old), (2, recent)):
+            session.add(ObligationInstance(covenant_id=covenant_id, loan_id=1, name="Financials",
+                                           period_end=due_date, due_date=due_date))
+        # The checker stopped before the old deadline: it must survive until alerted
+        session.add(SchedulerState(key=OBLIGATION_WATERMARK_KEY, value=(old - timedelta(days=1)).isoformat()))
+        session.commit()
+
+    assert prune_obligation_instances(now) == 0
+
+    with Session(engine) as session:
+        session.get(SchedulerState, OBLIGATION_WATERMARK_KEY).value = now.isoformat()
+        session.commit()
+
+    assert prune_obligation_instances(now, batch_size=1) == 1
+    with Session(engine) as session:
+        assert session.exec(select(ObligationInstance.covenant_id)).all() == [2]
@@ -0,0 +1,34 @@
+from services import relevance
+from services.relevance import select_relevant_pages
+
+BOILERPLATE = "Clause {page}: Notices shall be given in writing to the address of the relevant party."
+REPORTING = (
+    "The Borrower shall deliver its audited annual financial statements and its quarterly "
+    "financial statements for each relevant period, with a minimum of detail. "
+)
+COVENANT = "Tangible Net Worth shall at all times be at least USD 25,000,000."
+
+
+def _document(pages=40, reporting_pages=range(2, 12), covenant_page=30):
+    text = []
+    for page in range(pages):
+        if page in reporting_pages:
+            text.append(REPORTING * 5)
+        elif page == covenant_page:
+            text.append(BOILERPLATE.format(page=page) + " " + COVENANT)
+        else:
+            text.append(BOILERPLATE.format(page=page))
+    return text
+
+
+def test_page_naming_a_covenant_is_kept_however_it_ranks(monkeypatch):
+    pages = _document()
+    cut = {"top_fraction": 0.15, "min_score_ratio": 0.3, "margin_pages": 0}
+
+    monkeypatch.setattr(relevance, "RECALL_PATTERNS", [])
+    assert 30 not in select_relevant_pages(pages, **cut)  # Outranked by the reporting boilerplate
+
+    monkeypatch.undo()
+    kept = select_relevant_pages(pages, **cut)
+    assert 30 in kept
+    assert len(kept) < len(pages) / 2  # Still a filter
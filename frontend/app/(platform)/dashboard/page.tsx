@@ -29,6 +29,16 @@ interface Alert {
   timestamp: string;
 }
 
+interface PortfolioSummary {
+  loans: { total: number; by_status: Record<string, { count: number; exposure: Record<string, number> }> };
+  alerts: { unresolved: number; by_type: Record<string, number> };
+  covenants: { monitored: number };
+  obligations: { due_7_days: number; due_30_days: number };
+}
+
+const API = "http://localhost:8000/api";
+const LIST_FIELDS = "id,borrower_name,loan_amount,effective_date,risk_status,covenants_json";
+
 export default function Dashboard() {
   const [loans, setLoans] = useState<Loan[]>([]);
   const [loading, setLoading] = useState(true);
@@ -56,10 +66,24 @@ export default function Dashboard() {
 
     async function fetchData() {
       try {
-        const res = await fetch("http://localhost:8000/api/loans");
-        if (!res.ok) throw new Error("Failed to fetch");
-        const data: Loan[] = await res.json();
-        setLoans(data);
+        // KPIs come pre-aggregated from the server; only the flagged loans are listed
+        const [summaryRes, criticalRes, watchlistRes] = await Promise.all([
+          fetch(`${API}/portfolio/summary`),
+          fetch(`${API}/loans?risk_status=Critical&limit=200&fields=${LIST_FIELDS}`),
+          fetch(`${API}/loans?risk_status=Watchlist&limit=200&fields=${LIST_FIELDS}`),
+        ]);
+        if (!summaryRes.ok || !criticalRes.ok || !watchlistRes.ok) throw new Error("Failed to fetch");
+        const summary: PortfolioSummary = await summaryRes.json();
+        const critical: Loan[] = await criticalRes.json();
+        const watchlist: Loan[] = await watchlistRes.json();
+
+        setStats({
+          activeLoans: summary.loans.total,
+          totalCovenants: summary.covenants.monitored,
+          pendingReviews: summary.loans.by_status["Watchlist"]?.count ?? 0,
+          criticalBreaches: summary.loans.by_status["Critical"]?.count ?? 0
+        });
+        setLoans([...critical, ...watchlist]);
       } catch (error) {
         console.error("Error fetching loans:", error);
       } finally {
@@ -73,19 +97,9 @@ export default function Dashboard() {
   useEffect(() => {
     if (loans.length === 0) return;
 
-    let covCount = 0;
-    let critical = 0;
-    let watchlist = 0;
     const newAlerts: Alert[] = [];
 
     loans.forEach((loan) => {
-      if (loan.risk_status === "Critical") critical++;
-      if (loan.risk_status === "Watchlist") watchlist++;
-      try {
-        const covenants = JSON.parse(loan.covenants_json);
-        covCount += covenants.length;
-      } catch (e) { }
-
       if (loan.risk_status === "Critical") {
         newAlerts.push({
           id: loan.id,
@@ -103,13 +117,6 @@ export default function Dashboard() {
       }
     });
 
-    setStats({
-      activeLoans: loans.length,
-      totalCovenants: covCount,
-      pendingReviews: watchlist,
-      criticalBreaches: critical
-    });
-
     setCriticalLoans(loans.filter(l => l.risk_status === "Critical"));
     setWatchlistLoans(loans.filter(l => l.risk_status === "Watchlist"));
     setAlerts(newAlerts.slice(0, 6)); 
@@ -42,7 +42,8 @@ export default function LoanPortfolioPage() {
   async function fetchLoans() {
     setLoading(true);
     try {
-      const res = await fetch("http://localhost:8000/api/loans");
+      // List view only needs these columns; skips the covenant blobs
+      const res = await fetch("http://localhost:8000/api/loans?fields=id,borrower_name,loan_amount,effective_date,risk_status");
       if (!res.ok) throw new Error("Failed to fetch");
       const data: Loan[] = await res.json();
 
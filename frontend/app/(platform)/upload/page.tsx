@@ -21,6 +21,7 @@ interface ExtractedData {
     threshold: string;
     confidence: string;
   }[];
+  analysis_job_id?: string; // Lets the backend index the agreement text for search
 }
 
 export default function UploadPage() {
@@ -48,8 +49,17 @@ export default function UploadPage() {
 
       if (!response.ok) throw new Error("Analysis failed");
 
-      const result = await response.json();
-      setData(result);
+      // The backend queues the analysis and returns a job; poll until it finishes
+      let job = await response.json();
+      while (job.status === "queued" || job.status === "running") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const poll = await fetch(`http://localhost:8000/api/analyze/${job.job_id}`);
+        if (!poll.ok) throw new Error("Analysis failed");
+        job = await poll.json();
+      }
+      if (job.status !== "done") throw new Error(job.error || "Analysis failed");
+
+      setData({ ...job.result, analysis_job_id: job.job_id });
       setStep("review");
       
     } catch (error) {